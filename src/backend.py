@@ -0,0 +1,115 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional
+import os
+import numpy as np
+import finite_field
+import finite_field_vec
+import poseidon2
+from finite_field import Field, inverse_python, batch_inverse_montgomery, batch_inverse_naive
+from finite_field_vec import mul_numpy, mul_python, ext_mul_numpy, ext_mul_python, matrix_dot_numpy, matrix_dot_python
+from poseidon2 import POSEIDON_WIDTH, permutation_python, permutation_batch_numpy
+
+# Arithmetic and hash backends.
+# F.inverse / EF.inverse, batch_inverse, poseidon2_permutation and poseidon2_permutation_batch, and the multiplication
+# kernels of finite_field_vec (FVec / EFVec products, matrix_dot) dispatch to the active backend, so every module
+# (whatever it imported) follows the selection. The scalar F / EF arithmetic and the vectorized additions are shared.
+# Selection: the process-wide default comes from the SIMPLE_SNARK_BACKEND environment variable or set_backend,
+# and use_backend (or the backend argument of piop_verify) overrides it in the current context only (contextvars),
+# so concurrent threads and tasks can use different backends.
+
+
+@dataclass(frozen=True)
+class Backend:
+    name: str
+    inverse: Callable[[int], int]  # in Fp, on canonical ints
+    batch_inverse: Callable[[List[Field]], List[Field]]
+    permutation: Callable[[List[int]], List[int]]  # one Poseidon2 state, as canonical ints
+    permutation_batch: Callable[[np.ndarray], np.ndarray]  # (N, POSEIDON_WIDTH) canonical uint32 states
+    mul: Callable[[np.ndarray, np.ndarray], np.ndarray]  # elementwise in Fp (see finite_field_vec.mul_numpy)
+    ext_mul: Callable[[np.ndarray, np.ndarray], np.ndarray]  # in EF, on limbs (see finite_field_vec.ext_mul_numpy)
+    matrix_dot: Callable[[np.ndarray, np.ndarray], np.ndarray]  # see finite_field_vec.matrix_dot_numpy
+
+
+DEFAULT_BACKEND = "numpy"
+_backends: Dict[str, Backend] = {}
+_default: Optional[Backend] = None
+_selected: ContextVar[Optional[Backend]] = ContextVar("backend", default=None)
+
+
+def register_backend(backend: Backend):
+    _backends[backend.name] = backend
+
+
+def available_backends() -> List[str]:
+    return list(_backends)
+
+
+def get_backend(name: str) -> Backend:
+    assert name in _backends, f"unknown backend {name!r}, available: {available_backends()}"
+    return _backends[name]
+
+
+def _active() -> Backend:
+    return _selected.get() or _default
+
+
+def current_backend() -> str:
+    return _active().name
+
+
+def set_backend(name: str):
+    # process-wide default
+    global _default
+    _default = get_backend(name)
+
+
+@contextmanager
+def use_backend(name: Optional[str]) -> Iterator[None]:
+    # in the current context only, no-op for None
+    if name is None:
+        yield
+        return
+    token = _selected.set(get_backend(name))
+    try:
+        yield
+    finally:
+        _selected.reset(token)
+
+
+def _rows(permutation: Callable[[List[int]], List[int]]) -> Callable[[np.ndarray], np.ndarray]:
+    # batched permutation, one state at a time
+    def permutation_batch(states: np.ndarray) -> np.ndarray:
+        return np.array([permutation(state) for state in states.tolist()], dtype=np.uint32).reshape(-1, POSEIDON_WIDTH)
+    return permutation_batch
+
+
+# pure Python, one operation at a time
+register_backend(Backend("python", inverse_python, batch_inverse_naive, permutation_python, _rows(permutation_python),
+                         mul_python, ext_mul_python, matrix_dot_python))
+# NumPy for vectors and batches of permutations (a single state is faster in pure Python),
+# Montgomery's trick for batch inversions
+register_backend(Backend("numpy", inverse_python, batch_inverse_montgomery, permutation_python, permutation_batch_numpy,
+                         mul_numpy, ext_mul_numpy, matrix_dot_numpy))
+
+try:
+    import gmpy2
+
+    def _inverse_gmpy2(value: int) -> int:
+        return int(gmpy2.invert(value, finite_field.P))
+
+    # the numpy backend, with GMP's extended gcd for the inversions (instead of an exponentiation)
+    register_backend(Backend("gmpy2", _inverse_gmpy2, batch_inverse_montgomery, permutation_python,
+                             permutation_batch_numpy, mul_numpy, ext_mul_numpy, matrix_dot_numpy))
+except ImportError:
+    pass
+
+finite_field._inverse = lambda value: _active().inverse(value)
+finite_field._batch_inverse = lambda elements: _active().batch_inverse(elements)
+poseidon2._permutation = lambda state: _active().permutation(state)
+poseidon2._permutation_batch = lambda states: _active().permutation_batch(states)
+finite_field_vec._mul = lambda a, b: _active().mul(a, b)
+finite_field_vec._ext_mul = lambda a, b: _active().ext_mul(a, b)
+finite_field_vec._matrix_dot = lambda rows, weights: _active().matrix_dot(rows, weights)
+set_backend(os.environ.get("SIMPLE_SNARK_BACKEND", DEFAULT_BACKEND))
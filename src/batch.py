@@ -0,0 +1,106 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Union
+import os
+import traceback
+from finite_field import *
+from transcript import TranscriptReader, encode_transcript
+from piop import AirTable, VerifyingKey, piop_verify, verifying_key
+from checks import DeferredEqualityChecks
+from backend import set_backend, use_backend
+
+# Batch verification of many proofs for the same AirTable, over a process pool.
+# The verifying key is built once, and sent once to each worker, via the pool initializer.
+# With deferred=True, the equality checks of a whole group of proofs are discharged by a single random linear
+# combination (see checks.py); when it fails, the proofs of the group are verified again one by one.
+
+Transcript = Union[List[F], bytes, str]  # elements, encoded transcript (see transcript.py), or path to an encoded transcript
+
+
+@dataclass
+class VerificationResult:
+    ok: bool
+    failed_check: Optional[str] = None  # location and source of the check that failed
+
+
+def _failed_check(e: Exception) -> str:
+    # the innermost frame outside of checks.py, plus the name of the equality check if any
+    frames = [f for f in traceback.extract_tb(e.__traceback__) if os.path.basename(f.filename) != "checks.py"]
+    frame = frames[-1]
+    description = f"{os.path.basename(frame.filename)}:{frame.lineno} in {frame.name}: {frame.line}"
+    if isinstance(e, AssertionError):
+        return f"{description} ({e})" if str(e) else description
+    return f"{description} ({type(e).__name__}: {e})"
+
+
+def _open_transcript(transcript: Transcript) -> TranscriptReader:
+    if isinstance(transcript, str):
+        return TranscriptReader.open(transcript)
+    if isinstance(transcript, (bytes, bytearray)):
+        return TranscriptReader(transcript)
+    return TranscriptReader.from_elements(transcript)
+
+
+def verify_one(key: Union[AirTable, VerifyingKey], transcript: Transcript, backend: Optional[str] = None) -> VerificationResult:
+    try:
+        with _open_transcript(transcript) as reader:
+            piop_verify(key, reader, backend=backend)
+        return VerificationResult(True)
+    except Exception as e:  # a malformed proof can fail anywhere, not only on an assertion
+        return VerificationResult(False, _failed_check(e))
+
+
+def verify_group_deferred(key: Union[AirTable, VerifyingKey], transcripts: List[Transcript]) -> List[VerificationResult]:
+    checks = DeferredEqualityChecks()
+    results = []
+    for transcript in transcripts:
+        n_claims = len(checks.claims)
+        try:
+            with _open_transcript(transcript) as reader:
+                piop_verify(key, reader, checks)
+            results.append(None)  # pending on checks.finalize()
+        except Exception:
+            # a deferred check may have failed earlier in this proof: verify it eagerly to report the right one
+            del checks.claims[n_claims:]
+            results.append(verify_one(key, transcript))
+    try:
+        checks.finalize()
+        return [r or VerificationResult(True) for r in results]
+    except AssertionError:
+        return [r or verify_one(key, t) for r, t in zip(results, transcripts)]
+
+
+_worker_key: Optional[VerifyingKey] = None
+
+
+def _init_worker(key: VerifyingKey, backend: Optional[str]):
+    global _worker_key
+    _worker_key = key
+    if backend is not None:
+        set_backend(backend)
+
+
+def _verify_in_worker(transcript: Transcript) -> VerificationResult:
+    return verify_one(_worker_key, transcript)
+
+
+def _verify_group_in_worker(transcripts: List[Transcript]) -> List[VerificationResult]:
+    return verify_group_deferred(_worker_key, transcripts)
+
+
+def verify_batch(key: Union[AirTable, VerifyingKey], transcripts: List[Transcript], workers: Optional[int] = None,
+                 deferred: bool = False, backend: Optional[str] = None) -> List[VerificationResult]:
+    # one result per transcript, in order
+    workers = workers or os.cpu_count()
+    vk = verifying_key(key)
+    if workers == 1:
+        with use_backend(backend):
+            return verify_group_deferred(vk, transcripts) if deferred else [verify_one(vk, t) for t in transcripts]
+    # lists of field elements are much cheaper to send encoded
+    transcripts = [t if isinstance(t, (str, bytes, bytearray)) else encode_transcript(t) for t in transcripts]
+    chunksize = max(1, len(transcripts) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(vk, backend)) as executor:
+        if not deferred:
+            return list(executor.map(_verify_in_worker, transcripts, chunksize=chunksize))
+        groups = [transcripts[i:i + chunksize] for i in range(0, len(transcripts), chunksize)]
+        return [r for group in executor.map(_verify_group_in_worker, groups) for r in group]
@@ -0,0 +1,78 @@
+from typing import List, Optional
+import argparse
+import itertools
+import json
+import statistics
+import time
+import tracemalloc
+from synthetic import *
+from prover import piop_prove
+from piop import VerifyingKey, piop_verify
+from codegen import piop_verify_specialized, specialized_verifier
+from transcript import TranscriptReader, encode_transcript
+
+# Verifier benchmark on synthetic tables (see synthetic.py), one JSON line per configuration:
+#   python benchmark.py --log-n-rows 8 10 12 --num-queries 8 16 --folding-factors 2 4
+
+
+def benchmark(log_n_rows: int, n_witness_columns: int, n_preprocessed_columns: int, constraint_degree: int,
+              folding_factor: int, num_queries: int, merkle_multiproof: bool = False, repeats: int = 3) -> dict:
+    table, witness = synthetic_air_table(log_n_rows, n_witness_columns, n_preprocessed_columns, constraint_degree)
+    table.whir_params = synthetic_whir_params(log_n_rows + table.log_n_witness_columns(), folding_factor, num_queries,
+                                              merkle_multiproof=merkle_multiproof)
+    vk = VerifyingKey.build(table)
+    start = time.perf_counter()
+    transcript = encode_transcript(piop_prove(vk, witness))
+    prove_seconds = time.perf_counter() - start
+
+    verify_seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        piop_verify(vk, TranscriptReader(transcript))
+        verify_seconds.append(time.perf_counter() - start)
+    specialized_verifier(vk)  # generated once per key, not timed
+    specialized_verify_seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        piop_verify_specialized(vk, TranscriptReader(transcript))
+        specialized_verify_seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    piop_verify(vk, TranscriptReader(transcript))
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "log_n_rows": log_n_rows,
+        "n_witness_columns": n_witness_columns,
+        "n_preprocessed_columns": n_preprocessed_columns,
+        "constraint_degree": constraint_degree,
+        "folding_factor": folding_factor,
+        "num_queries": num_queries,
+        "merkle_multiproof": merkle_multiproof,
+        "transcript_bytes": len(transcript),
+        "prove_seconds": prove_seconds,
+        "verify_seconds": statistics.median(verify_seconds),
+        "specialized_verify_seconds": statistics.median(specialized_verify_seconds),
+        "verify_peak_memory_bytes": peak_memory,
+    }
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="benchmark piop_verify on synthetic tables")
+    parser.add_argument("--log-n-rows", type=int, nargs="+", default=[6, 8, 10])
+    parser.add_argument("--num-queries", type=int, nargs="+", default=[16])
+    parser.add_argument("--folding-factors", type=int, nargs="+", default=[4])
+    parser.add_argument("--witness-columns", type=int, default=4)
+    parser.add_argument("--preprocessed-columns", type=int, default=1)
+    parser.add_argument("--constraint-degree", type=int, default=2)
+    parser.add_argument("--merkle-multiproof", action="store_true")
+    parser.add_argument("--repeats", type=int, default=3)
+    options = parser.parse_args(args)
+    for log_n_rows, num_queries, folding_factor in itertools.product(options.log_n_rows, options.num_queries, options.folding_factors):
+        result = benchmark(log_n_rows, options.witness_columns, options.preprocessed_columns, options.constraint_degree,
+                           folding_factor, num_queries, options.merkle_multiproof, options.repeats)
+        print(json.dumps(result), flush=True)
+
+
+if __name__ == "__main__":
+    main()
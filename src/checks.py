@@ -0,0 +1,39 @@
+from typing import List, Tuple
+import secrets
+from finite_field import *
+from finite_field_vec import *
+
+# Equality checks between extension field elements, at the end of the sumchecks and of WHIR.
+# EqualityChecks asserts each claim immediately. DeferredEqualityChecks records the claims and discharges them
+# all at once in finalize(), as a single random linear combination sum_i r^i.(a_i - b_i) == 0,
+# with r sampled by the verifier (not from the transcript): a false claim goes unnoticed with probability
+# at most n_claims / |EF|. The same accumulator can be shared by several proofs.
+
+
+class EqualityChecks:
+    def check(self, a: EF, b: EF, name: str) -> None:
+        assert a == b, name
+
+    def finalize(self) -> None:
+        pass
+
+
+class DeferredEqualityChecks(EqualityChecks):
+    def __init__(self, debug: bool = False):
+        self.debug = debug  # on failure, report the name of every failed check
+        self.claims: List[Tuple[EF, EF, str]] = []
+
+    def check(self, a: EF, b: EF, name: str) -> None:
+        self.claims.append((a, b, name))
+
+    def finalize(self) -> None:
+        claims, self.claims = self.claims, []
+        if len(claims) == 0:
+            return
+        r = EF.from_ints(*(secrets.randbelow(P) for _ in range(DEG)))
+        left = EFVec.from_list([a for a, _, _ in claims])
+        right = EFVec.from_list([b for _, b, _ in claims])
+        if (left - right).dot(EFVec.from_list(powers(r, len(claims)))) != EF.zero():
+            if self.debug:
+                raise AssertionError(", ".join(name for a, b, name in claims if a != b))
+            raise AssertionError(f"deferred equality checks failed ({len(claims)} claims)")
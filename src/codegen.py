@@ -0,0 +1,351 @@
+from dataclasses import astuple
+from typing import Dict, List, Optional, Union
+import hashlib
+import linecache
+import types
+import numpy as np
+from finite_field import *
+from finite_field_vec import *
+from checks import EqualityChecks
+import poseidon2
+from poseidon2 import DIGEST_LEN, POSEIDON_WIDTH
+from transcript import TranscriptReader
+from piop import AirTable, VerifyingKey, UNIVARIATE_SKIPS, verifying_key
+
+# Specialized verifiers: for a given verifying key, the control flow of piop_verify is fully determined
+# (rounds, degrees, query counts, transcript offsets), so we emit it as a straight-line Python module,
+# with the constraints inlined and the transcript read at precomputed offsets (until the first read whose length
+# depends on the challenges, i.e. a Merkle multiproof). Same checks, in the same order, as piop_verify.
+# The Fiat-Shamir sponge, where most of the verification time goes, uses a straight-line Poseidon2 permutation
+# (round constants and matrices inlined, state in local variables), instead of the permutation of the active backend.
+# Generated modules are kept in memory, keyed by a hash of everything they depend on, and their source is registered
+# with linecache so that tracebacks and debuggers can show it. Nothing is written to or read from disk.
+
+CODEGEN_VERSION = 4
+_loaded: Dict[str, object] = {}
+
+
+# Helpers used by the generated modules
+
+def read(data: np.ndarray, start: int, n: int) -> np.ndarray:
+    assert start + n <= len(data)
+    return data[start:start + n]
+
+
+def base(view: np.ndarray) -> List[F]:
+    return FVec(view).to_list()
+
+
+def ext(view: np.ndarray) -> List[EF]:
+    return ext_vec(view).to_list()
+
+
+def ext_vec(view: np.ndarray) -> EFVec:
+    return EFVec.from_base_field(FVec(view))
+
+
+class _Writer:
+    def __init__(self):
+        self.lines: List[str] = []
+        self.offset: Optional[int] = 0  # static position in the transcript, None once it depends on the challenges
+        self.static_length = None
+
+    def __call__(self, line: str = "", indent: int = 1):
+        self.lines.append("    " * indent + line if line else "")
+
+    def dynamic(self, indent: int = 1):
+        if self.offset is not None:
+            self.static_length = self.offset
+            self(f"cursor = {self.offset}", indent)
+            self.offset = None
+
+    def read(self, target: str, n: Union[int, str], indent: int = 1):
+        # target <- the next n elements of the transcript, absorbed by the sponge
+        if self.offset is not None and isinstance(n, int):
+            self(f"{target} = data[{self.offset}:{self.offset + n}]", indent)
+            self.offset += n
+        else:
+            self.dynamic(indent)
+            self(f"{target} = read(data, cursor, {n})", indent)
+            self(f"cursor += len({target})", indent)
+        self(f"fs._update_state({target}.tolist())", indent)
+
+    def pow_grinding(self, bits: int, indent: int = 1):
+        if bits > 0:
+            self.read("nonce", 1, indent)
+            self(f"assert fs.random_index({bits}) == 0", indent)
+
+
+def _constraints_source(vk: VerifyingKey) -> List[str]:
+    # the compiled constraints, as a straight-line function
+    circuit = vk.constraints
+    lines = [f"C{k} = EF.from_ints{c.coords()}" for k, c in enumerate(circuit.constants)]
+    lines += ["", "", "def constraints(x):"]
+
+    def register(i: int) -> str:
+        if i < circuit.n_inputs:
+            return f"x[{i}]"
+        if i < circuit.n_inputs + len(circuit.constants):
+            return f"C{i - circuit.n_inputs}"
+        return f"r{i}"
+
+    symbols = {"add": "+", "sub": "-", "mul": "*"}
+    first = circuit.n_inputs + len(circuit.constants)
+    for k, (op, a, b) in enumerate(circuit.tape):
+        lines.append(f"    r{first + k} = {register(a)} {symbols[op]} {register(b)}")
+    lines.append(f"    return [{', '.join(register(o) for o in circuit.outputs)}]")
+    return lines
+
+
+def _permutation_source() -> List[str]:
+    # poseidon2_permutation as a straight-line function (see poseidon2.permutation_python)
+    # in the full rounds, the S-box outputs (below 2^96) are only reduced at the end of the following linear layer
+    state = [f"s{i}" for i in range(POSEIDON_WIDTH)]
+    lines = ["def permutation(state):", f"    {', '.join(state)} = [x.value for x in state]"]
+
+    def external_linear_layer():
+        for c in range(0, POSEIDON_WIDTH, 4):
+            x = state[c:c + 4]
+            mixed = [" + ".join(f"{m} * {x[j]}" if m > 1 else x[j] for j, m in enumerate(row)) for row in poseidon2.M4]
+            lines.append(f"    t{c}, t{c + 1}, t{c + 2}, t{c + 3} = {', '.join(mixed)}")
+        for k in range(4):
+            lines.append(f"    u{k} = {' + '.join(f't{c + k}' for c in range(0, POSEIDON_WIDTH, 4))}")
+        lines.append(f"    {', '.join(state)} = {', '.join(f'(t{i} + u{i % 4}) % P' for i in range(POSEIDON_WIDTH))}")
+
+    def sbox(i: int, constant: int) -> str:
+        return f"x = s{i} + {constant}; s{i} = {' * '.join(['x'] * poseidon2.SBOX_DEGREE)}"
+
+    def full_round(constants: List[int]):
+        lines.extend(f"    {sbox(i, c)}" for i, c in enumerate(constants))
+        external_linear_layer()
+
+    external_linear_layer()
+    for constants in poseidon2.EXTERNAL_INITIAL_CONSTANTS:
+        full_round(constants)
+    for constant in poseidon2.INTERNAL_CONSTANTS:
+        lines.append(f"    {sbox(0, constant)} % P")
+        lines.append(f"    total = {' + '.join(state)}")
+        lines.append(f"    {', '.join(state)} = {', '.join(f'({x} * {d} + total) % P' for x, d in zip(state, poseidon2.INTERNAL_DIAG))}")
+    for constants in poseidon2.EXTERNAL_FINAL_CONSTANTS:
+        full_round(constants)
+    lines.append(f"    return [{', '.join(f'F({x})' for x in state)}]")
+    return lines
+
+
+def verifier_source(key: Union[AirTable, VerifyingKey]) -> str:
+    vk = verifying_key(key)
+    params = vk.whir_params
+    s = UNIVARIATE_SKIPS
+    n_w = vk.n_witness_columns
+    log_w = vk.log_n_witness_columns()
+    w = _Writer()
+
+    w(f"fs = FiatShamir({vk.fiat_shamir_version}, permutation)")
+    w("STATIC_LENGTH_CHECK")
+    w("# WHIR commitment")
+    w.read("v", DIGEST_LEN)
+    w("merkle_root = base(v)")
+    w(f"ood_points = [multilinear_point_from_univariate(z, {params.rounds[0].n_variables}) for z in fs.random_scalars({params.initial_ood_samples})]")
+    w("ood_answers = []")
+    for _ in range(params.initial_ood_samples):
+        w.read("v", DEG)
+        w("ood_answers.append(ext(v)[0])")
+
+    w()
+    w("# zerocheck, with univariate skip")
+    w("constraints_batching_scalar = fs.random_scalar()")
+    w(f"zerocheck_challenges = fs.random_scalars({vk.log_n_rows - s + 1})")
+    w.read("v", DEG * (vk.max_constraint_degree + 1) * 2 ** s)
+    w("poly = UnivariatePolynomial(ext_vec(v))")
+    w(f"zero_sum = poly.sum_over_domain({s})")
+    w("point = [fs.random_scalar()]")
+    w("target = poly.evaluate(point[-1])")
+    for _ in range(vk.log_n_rows - s):
+        w.read("v", DEG * (vk.max_constraint_degree + 2))
+        w("poly = UnivariatePolynomial(ext_vec(v))")
+        w('checks.check(target, poly.evaluate_zero_plus_one(), "zerocheck sumcheck round")')
+        w("point.append(fs.random_scalar())")
+        w("target = poly.evaluate(point[-1])")
+    w('checks.check(zero_sum, EF.zero(), "zerocheck sum")')
+    w.read("v", DEG * 2 * n_w)
+    w("witness_shifted_evals = ext(v)")
+    w(f"selector_evals = lagrange_selector_evals(point[0], {s})")
+    w("preprocessed_up, preprocessed_down = shifted_columns_evals(vk.preprocessed_columns, selector_evals, point[1:])")
+    w(f"constraint_evals = constraints(preprocessed_up + witness_shifted_evals[:{n_w}] + preprocessed_down + witness_shifted_evals[{n_w}:])")
+    w("global_constraint_eval = EF.zero()")
+    w("for constraint_eval, coeff in zip(constraint_evals, powers(constraints_batching_scalar, len(constraint_evals))):")
+    w("global_constraint_eval += coeff * constraint_eval", 2)
+    w(f"checks.check(global_constraint_eval * dot_product(lagrange_selector_evals(zerocheck_challenges[0], {s}), selector_evals) *")
+    w('             eq_extension(zerocheck_challenges[1:], point[1:]), target, "zerocheck final evaluation")')
+
+    w()
+    w("# inner sumcheck")
+    w(f"secondary_batching_powers = powers(fs.random_scalar(), {2 * n_w})")
+    for i in range(vk.log_n_rows + s):
+        w.read("v", DEG * 4)
+        w("poly = UnivariatePolynomial(ext_vec(v))")
+        if i == 0:
+            w("inner_sum = poly.evaluate_zero_plus_one()")
+            w("inner_point = []")
+        else:
+            w('checks.check(target, poly.evaluate_zero_plus_one(), "sumcheck round")')
+        w("inner_point.append(fs.random_scalar())")
+        w("target = poly.evaluate(inner_point[-1])")
+    w('checks.check(inner_sum, dot_product(witness_shifted_evals, secondary_batching_powers), "inner sumcheck sum")')
+    w(f"matrix_lde_point = (point[1:] + inner_point[:{s}])[::-1] + inner_point[{s}:][::-1]")
+    w("matrix_up_eval = vk.matrix_up.evaluate(matrix_lde_point)")
+    w("matrix_down_eval = vk.matrix_down.evaluate(matrix_lde_point)")
+    w.read("v", DEG * n_w)
+    w("final_inner_claims = ext(v)")
+    w("batched_inner_value = EF.zero()")
+    w(f"for u in range({n_w}):")
+    w("batched_inner_value += final_inner_claims[u] * (secondary_batching_powers[u] * matrix_up_eval +", 2)
+    w(f"                                                secondary_batching_powers[u + {n_w}] * matrix_down_eval)", 2)
+    w(f"batched_inner_value *= MultilinearEvals(selector_evals).evaluate(inner_point[:{s}])")
+    w('checks.check(batched_inner_value, target, "inner sumcheck final evaluation")')
+    w(f"final_random_scalars = fs.random_scalars({log_w})")
+    w(f"final_point = final_random_scalars + inner_point[{s}:]")
+    w(f"packed_value = MultilinearEvals(final_inner_claims + [EF.zero()] * {2 ** log_w - n_w}).evaluate(final_random_scalars)")
+
+    w()
+    w("# WHIR opening")
+    w("evaluation_points = [ood_points + [final_point]]")
+    w("expected_evals = ood_answers + [packed_value]")
+    w("combination_randomness = []")
+    w("expected_sumcheck_output = EF.zero()")
+    w("all_folding_randomness = []")
+    for r, round in enumerate(params.rounds):
+        folded_n_variables = round.n_variables - round.folding_factor
+        query_domain = round.domain_size - round.folding_factor
+        leaf_length = 2 ** round.folding_factor * (1 if r == 0 else DEG)
+        leaf = "FVec(leaf)" if r == 0 else "EFVec.from_base_field(FVec(leaf))"
+        w()
+        w(f"# round {r}")
+        w.pow_grinding(round.combination_pow_bits)
+        w("combination_randomness_gen = fs.random_scalar()")
+        w("for expected_eval, coeff in zip(expected_evals, powers(combination_randomness_gen, len(expected_evals))):")
+        w("expected_sumcheck_output += expected_eval * coeff", 2)
+        w("folding_randomness = []")
+        for _ in range(round.folding_factor):
+            w.read("v", DEG * 3)
+            w("poly = UnivariatePolynomial(ext_vec(v))")
+            w(f'checks.check(poly.evaluate_zero_plus_one(), expected_sumcheck_output, "whir round {r} sumcheck")')
+            w("folding_randomness.append(fs.random_scalar())")
+            w("expected_sumcheck_output = poly.evaluate(folding_randomness[-1])")
+            w.pow_grinding(round.folding_pow_bits)
+        w.read("v", DIGEST_LEN)
+        w("folded_merkle_root = base(v)")
+        w(f"ood_points = [multilinear_point_from_univariate(z, {folded_n_variables}) for z in fs.random_scalars({round.ood_samples})]")
+        w("ood_answers = []")
+        for _ in range(round.ood_samples):
+            w.read("v", DEG)
+            w("ood_answers.append(ext(v)[0])")
+        if params.merkle_multiproof:
+            w(f"indices = fs.random_indices({round.num_queries}, {query_domain})")
+            w("unique_indices = sorted(set(indices))")
+            w("unique_leaves = []")
+            w.dynamic()  # the number of unique leaves depends on the challenges
+            w("for _ in unique_indices:")
+            w.read("leaf", leaf_length, 2)
+            w(f"unique_leaves.append({leaf})", 2)
+            w.read("v", f"merkle_multiproof_size(unique_indices, {query_domain}) * {DIGEST_LEN}")
+            w(f"proof = [base(v[i:i + {DIGEST_LEN}]) for i in range(0, len(v), {DIGEST_LEN})]")
+            w(f"verify_merkle_multiproof(merkle_root, unique_indices, unique_leaves, proof, {query_domain})")
+            w("leaf_of = dict(zip(unique_indices, unique_leaves))")
+            w("leaves = [leaf_of[index] for index in indices]")
+        else:
+            stride = leaf_length + query_domain * DIGEST_LEN
+            batched_indices = vk.fiat_shamir_version >= 2  # see whir_verify
+            w(f"indices = fs.random_indices({round.num_queries}, {query_domain})" if batched_indices else "indices = []")
+            w("leaves, auth_paths = [], []")
+            if w.offset is not None:
+                w(f"for start in range({w.offset}, {w.offset + round.num_queries * stride}, {stride}):")
+                if not batched_indices:
+                    w(f"indices.append(fs.random_index({query_domain}))", 2)
+                w(f"leaf, path = data[start:start + {leaf_length}], data[start + {leaf_length}:start + {stride}]", 2)
+                w.offset += round.num_queries * stride
+            else:
+                w(f"for _ in range({round.num_queries}):")
+                if not batched_indices:
+                    w(f"indices.append(fs.random_index({query_domain}))", 2)
+                w(f"leaf, path = read(data, cursor, {leaf_length}), read(data, cursor + {leaf_length}, {stride - leaf_length})", 2)
+                w(f"cursor += {stride}", 2)
+            w("fs._update_state(leaf.tolist())", 2)
+            w("fs._update_state(path.tolist())", 2)
+            w(f"leaves.append({leaf})", 2)
+            w(f"auth_paths.append([base(path[i:i + {DIGEST_LEN}]) for i in range(0, len(path), {DIGEST_LEN})])", 2)
+            w(f"verify_merkle_paths(merkle_root, indices, leaves, auth_paths, {query_domain})")
+        w(f"z_is = [multilinear_point_from_univariate(EF.from_base(vk.whir_query_tables[{r}].pow(index)), {folded_n_variables}) for index in indices]")
+        w("folded_evals = multilinear_coeffs_evaluate_batch(leaves, folding_randomness)")
+        w("merkle_root = folded_merkle_root")
+        w("expected_evals = ood_answers + folded_evals")
+        w("all_folding_randomness += folding_randomness")
+        w("evaluation_points.append(ood_points + z_is)")
+        w("combination_randomness.append(combination_randomness_gen)")
+
+    w()
+    w("# WHIR final checks")
+    w.read("v", DEG)
+    w("claimed_constant_poly = ext(v)[0]")
+    w("verify_merkle_path(merkle_root, 0, [claimed_constant_poly], [], 0)")
+    w("for expected_eval in expected_evals:")
+    w('checks.check(expected_eval, claimed_constant_poly, "whir final evaluations")', 2)
+    w("final_weight = EF.zero()")
+    w("for eval_points, combination_randomness_gen in zip(evaluation_points, combination_randomness):")
+    w("if len(eval_points) == 0:", 2)
+    w("continue", 3)
+    w("eqs = eq_extension_batch(eval_points, all_folding_randomness[-len(eval_points[0]):])", 2)
+    w("final_weight += eqs.dot(EFVec.from_list(powers(combination_randomness_gen, len(eval_points))))", 2)
+    w('checks.check(expected_sumcheck_output, claimed_constant_poly * final_weight, "whir final constant")')
+
+    static_length = w.offset if w.offset is not None else w.static_length
+    body = [f"    assert len(data) >= {static_length}" if line.strip() == "STATIC_LENGTH_CHECK" else line for line in w.lines]
+    header = [
+        f"# Generated by codegen.py (version {CODEGEN_VERSION}), do not edit",
+        f"# parameters hash: {parameters_hash(vk)}",
+        "from piop import *",
+        "from fiat_shamir import FiatShamir",
+        "from codegen import read, base, ext, ext_vec",
+        "",
+    ]
+    return "\n".join(header + _permutation_source() + ["", ""] + _constraints_source(vk) +
+                     ["", "", "def verify(vk, data, checks):"] + body) + "\n"
+
+
+def parameters_hash(key: Union[AirTable, VerifyingKey]) -> str:
+    # everything the generated code depends on (the preprocessed columns are read from the key at runtime)
+    vk = verifying_key(key)
+    circuit = vk.constraints
+    parameters = (
+        CODEGEN_VERSION, vk.fiat_shamir_version, UNIVARIATE_SKIPS, vk.log_n_rows, vk.n_columns, vk.n_witness_columns, vk.max_constraint_degree,
+        circuit.n_inputs, [c.coords() for c in circuit.constants], circuit.tape, circuit.outputs,
+        vk.whir_params.initial_ood_samples, vk.whir_params.merkle_multiproof, [astuple(r) for r in vk.whir_params.rounds],
+        poseidon2.SBOX_DEGREE, poseidon2.M4, poseidon2.INTERNAL_DIAG,
+        poseidon2.EXTERNAL_INITIAL_CONSTANTS, poseidon2.INTERNAL_CONSTANTS, poseidon2.EXTERNAL_FINAL_CONSTANTS,
+    )
+    return hashlib.sha256(repr(parameters).encode()).hexdigest()
+
+
+def specialized_verifier(key: Union[AirTable, VerifyingKey]):
+    # the generated module (with a verify(vk, data, checks) function), generated on first use
+    vk = verifying_key(key)
+    digest = parameters_hash(vk)
+    if digest in _loaded:
+        return _loaded[digest]
+    source = verifier_source(vk)
+    filename = f"<specialized verifier {digest[:16]}>"
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    module = types.ModuleType(f"_verifier_{digest[:32]}")
+    exec(compile(source, filename, "exec"), module.__dict__)
+    _loaded[digest] = module
+    return module
+
+
+def piop_verify_specialized(key: Union[AirTable, VerifyingKey], proof_transcript: Union[List[F], TranscriptReader],
+                            checks: Optional[EqualityChecks] = None):
+    # same as piop_verify, with the specialized verifier of the key
+    vk = verifying_key(key)
+    if not isinstance(proof_transcript, TranscriptReader):
+        proof_transcript = TranscriptReader.from_elements(proof_transcript)
+    data = proof_transcript.elements[proof_transcript.cursor:]
+    specialized_verifier(vk).verify(vk, data, checks if checks is not None else EqualityChecks())
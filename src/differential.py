@@ -0,0 +1,96 @@
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Sequence, Union
+import argparse
+import random
+from finite_field import *
+from fiat_shamir import FiatShamir
+from backend import available_backends
+from batch import Transcript, VerificationResult, verify_one
+from piop import AirTable, VerifyingKey, verifying_key
+
+# Differential testing of the backends (see backend.py): verifying the same transcripts with each backend
+# must give the same Fiat-Shamir challenges and the same results.
+#   python differential.py --backends python numpy
+
+
+@dataclass
+class BackendRun:
+    backend: str
+    result: VerificationResult
+    challenges: List[F]  # every field element squeezed by the verifier, in order (random indices included)
+
+
+@contextmanager
+def _recorded_challenges() -> Iterator[List[F]]:
+    challenges = []
+    original = FiatShamir._squeeze
+
+    def squeeze(self, n: int) -> List[F]:
+        values = original(self, n)
+        challenges.extend(values)
+        return values
+
+    FiatShamir._squeeze = squeeze
+    try:
+        yield challenges
+    finally:
+        FiatShamir._squeeze = original
+
+
+def run_backend(key: Union[AirTable, VerifyingKey], transcript: Transcript, backend: str) -> BackendRun:
+    with _recorded_challenges() as challenges:
+        result = verify_one(key, transcript, backend)
+    return BackendRun(backend, result, challenges)
+
+
+def _assert_same(reference: BackendRun, run: BackendRun, transcript_index: int):
+    where = f"transcript {transcript_index}, {run.backend} vs {reference.backend}"
+    for k, (a, b) in enumerate(zip(reference.challenges, run.challenges)):
+        assert a == b, f"{where}: challenge {k} differs ({b} vs {a})"
+    assert len(run.challenges) == len(reference.challenges), \
+        f"{where}: {len(run.challenges)} vs {len(reference.challenges)} challenges"
+    assert run.result == reference.result, f"{where}: {run.result} vs {reference.result}"
+
+
+def compare_backends(key: Union[AirTable, VerifyingKey], transcripts: List[Transcript],
+                     backends: Optional[Sequence[str]] = None) -> List[VerificationResult]:
+    # raises an AssertionError at the first divergence, otherwise returns the (common) results
+    backends = backends or available_backends()
+    vk = verifying_key(key)
+    results = []
+    for i, transcript in enumerate(transcripts):
+        reference, *others = [run_backend(vk, transcript, backend) for backend in backends]
+        for run in others:
+            _assert_same(reference, run, i)
+        results.append(reference.result)
+    return results
+
+
+def main(args: Optional[List[str]] = None):
+    # valid and tampered proofs of synthetic tables
+    from synthetic import synthetic_air_table
+    from prover import piop_prove
+    parser = argparse.ArgumentParser(description="check that the backends agree on synthetic proofs")
+    parser.add_argument("--backends", nargs="+", default=available_backends())
+    parser.add_argument("--log-n-rows", type=int, nargs="+", default=[4, 6])
+    parser.add_argument("--tampered", type=int, default=4, help="tampered copies of each proof")
+    options = parser.parse_args(args)
+    rng = random.Random(0)
+    for log_n_rows in options.log_n_rows:
+        table, witness = synthetic_air_table(log_n_rows, 3)
+        vk = VerifyingKey.build(table)
+        transcript = piop_prove(vk, witness)
+        transcripts = [transcript]
+        for _ in range(options.tampered):
+            tampered = list(transcript)
+            i = rng.randrange(len(tampered))
+            tampered[i] = tampered[i] + F(1)
+            transcripts.append(tampered)
+        results = compare_backends(vk, transcripts, options.backends)
+        print(f"log_n_rows={log_n_rows}: {len(transcripts)} transcripts, backends {options.backends} agree, "
+              f"{sum(r.ok for r in results)} accepted")
+
+
+if __name__ == "__main__":
+    main()
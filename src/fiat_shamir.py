@@ -1,39 +1,147 @@
-from typing import List
+from typing import Callable, List, Optional, Union
 from finite_field import *
+from finite_field_vec import *
 from poseidon2 import *
+from transcript import BaseTranscriptReader, TranscriptReader
 
 
-class FiatShamirVerifier:
-    def __init__(self, transcript: List[F]):
-        self.transcript = transcript
-        self.cursor = 0
+# Sponge modes (part of the protocol: prover and verifier must agree, see VerifyingKey.fiat_shamir_version)
+#   1: every absorbed chunk of DIGEST_LEN elements (zero-padded) is permuted, and every challenge costs one permutation
+#   2: duplex sponge: absorbed elements are buffered across calls, and permuted once per full rate; the rate of the state
+#      after a permutation is squeezed element by element (2 extension field challenges, or DIGEST_LEN indices)
+# In both modes, a partial chunk is zero-padded: the transcript layout is fixed by the protocol, not chosen by the prover.
+FIAT_SHAMIR_VERSIONS = (1, 2)
+
+
+class FiatShamir:
+    # the sponge shared by the verifier and the (reference) prover
+
+    def __init__(self, version: int = 1, permutation: Optional[Callable[[PermutationState], PermutationState]] = None):
+        # permutation: a drop-in for poseidon2_permutation (e.g. the straight-line one of codegen.py)
+        assert version in FIAT_SHAMIR_VERSIONS
+        self.version = version
+        self.permutation = permutation
         self.state = [F(0) for _ in range(POSEIDON_WIDTH)]
+        self.pending: List[int] = []  # absorbed, not permuted yet (version 2)
+        self.output: List[F] = []  # squeezable (version 2)
+        self.fresh = False  # the rate was produced by a permutation, and has not been squeezed yet (version 2)
 
-    def _update_state(self, scalars: List[F]) -> None:
-        for i in range(0, len(scalars), DIGEST_LEN):
-            for j in range(DIGEST_LEN):
-                self.state[j] = scalars[i + j] if i + j < len(scalars) else F(0)
-            self.state = poseidon2_permutation(self.state)
+    def copy(self) -> "FiatShamir":
+        sponge = FiatShamir(self.version, self.permutation)
+        sponge.state, sponge.pending, sponge.output, sponge.fresh = list(self.state), list(self.pending), list(self.output), self.fresh
+        return sponge
 
-    def receive_scalars_base(self, n: int) -> List[F]:
-        scalars = self.transcript[self.cursor:self.cursor + n]
-        self.cursor += n
-        self._update_state(scalars)
-        return scalars
+    def _permute(self) -> None:
+        self.state = poseidon2_permutation(self.state) if self.permutation is None else self.permutation(self.state)
+
+    def _update_state(self, scalars: List[int]) -> None:
+        if self.version == 1:
+            for i in range(0, len(scalars), DIGEST_LEN):
+                for j in range(DIGEST_LEN):
+                    self.state[j] = F(scalars[i + j]) if i + j < len(scalars) else F(0)
+                self._permute()
+            return
+        self.output = []
+        self.fresh = False
+        self.pending += scalars
+        full = len(self.pending) - len(self.pending) % DIGEST_LEN
+        for i in range(0, full, DIGEST_LEN):
+            self.state[:DIGEST_LEN] = [F(v) for v in self.pending[i:i + DIGEST_LEN]]
+            self._permute()
+            self.fresh = True
+        self.pending = self.pending[full:]
 
-    def receive_scalars_ext(self, n: int) -> List[EF]:
-        return list_to_ext_field(self.receive_scalars_base(n * DEG))
+    def _squeeze(self, n: int) -> List[F]:
+        if self.version == 1:
+            assert n == DEG
+            values = self.state[:DEG]
+            self._permute()
+            return values
+        values = []
+        while len(values) < n:
+            if len(self.output) == 0:
+                if len(self.pending) > 0:
+                    self.state[:DIGEST_LEN] = [F(v) for v in self.pending] + [F(0)] * (DIGEST_LEN - len(self.pending))
+                    self.pending = []
+                    self._permute()
+                elif not self.fresh:
+                    self._permute()
+                self.output = self.state[:DIGEST_LEN]
+                self.fresh = False
+            k = min(n - len(values), len(self.output))
+            values += self.output[:k]
+            self.output = self.output[k:]
+        return values
 
     def random_scalar(self) -> EF:
-        challenge = EF(self.state[:DEG])
-        self.state = poseidon2_permutation(self.state)
-        return challenge
+        return EF(self._squeeze(DEG))
+
+    def random_scalars(self, n: int) -> List[EF]:
+        return [self.random_scalar() for _ in range(n)]
 
     def random_index(self, bits: int) -> int:
         # Not very recursion friendly, requires to decompose a field element into individual bits
         assert (bits < P_BITS)
-        self.random_scalar()[0].value % (1 << bits)
+        if self.version == 1:
+            return self.random_scalar().c0 % (1 << bits)
+        return self._squeeze(1)[0].value % (1 << bits)
+
+    def random_indices(self, n: int, bits: int) -> List[int]:
+        assert (bits < P_BITS)
+        if self.version == 1:
+            return [self.random_index(bits) for _ in range(n)]
+        return [f.value % (1 << bits) for f in self._squeeze(n)]
+
+
+class FiatShamirVerifier(FiatShamir):
+    def __init__(self, transcript: Union[List[F], BaseTranscriptReader], version: int = 1):
+        super().__init__(version)
+        if not isinstance(transcript, BaseTranscriptReader):
+            transcript = TranscriptReader.from_elements(transcript)
+        self.transcript = transcript
+
+    def receive_scalars_base_vec(self, n: int) -> FVec:
+        # zero-copy view on the transcript
+        values = self.transcript.read(n)
+        self._update_state(values.tolist())
+        return FVec(values)
+
+    def receive_scalars_base(self, n: int) -> List[F]:
+        return self.receive_scalars_base_vec(n).to_list()
+
+    def receive_scalars_ext(self, n: int) -> EFVec:
+        # zero-copy view on the transcript
+        return list_to_ext_field(self.receive_scalars_base_vec(n * DEG))
+
+    def pow_grinding(self, bits: int):
+        if bits == 0:
+            return
+        _ = self.receive_scalars_base(1)  # nonce
+        assert self.random_index(bits) == 0
+
+
+class FiatShamirProver(FiatShamir):
+    # Mirror of FiatShamirVerifier: each send_* call must match the corresponding receive_* call of the verifier
+    def __init__(self, version: int = 1):
+        super().__init__(version)
+        self.transcript: List[F] = []
+
+    def send_scalars_base(self, scalars: List[F]) -> None:
+        self.transcript += scalars
+        self._update_state([f.value for f in scalars])
+
+    def send_scalars_ext(self, scalars: Union[List[EF], EFVec]) -> None:
+        if isinstance(scalars, EFVec):
+            scalars = scalars.to_base_field().to_list()
+        self.send_scalars_base(list_to_base_field(scalars))
 
     def pow_grinding(self, bits: int):
-        _ = self.receive_scalars_base(0)  # nonce
+        if bits == 0:
+            return
+        for nonce in range(P):
+            trial = self.copy()
+            trial._update_state([nonce])
+            if trial.random_index(bits) == 0:
+                break
+        self.send_scalars_base([F(nonce)])
         assert self.random_index(bits) == 0
@@ -1,4 +1,5 @@
-from typing import List, Union
+from functools import lru_cache
+from typing import List, Tuple, TypeVar, Union
 
 P = 2130706433  # Prime field of our finite field
 P_BITS = 31  # Log2(P)
@@ -11,19 +12,36 @@ W = 3  # such that (x^DEG - W) is irreducible over Fp
 
 # Base field
 class F:
+    __slots__ = ("value",)
+
     def __init__(self, value: int):
         self.value = value % P
 
-    def __add__(self, other: "F") -> "F": return F(self.value + other.value)
-    def __sub__(self, other: "F") -> "F": return F(self.value - other.value)
-    def __mul__(self, other: "F") -> "F": return F(self.value * other.value)
-    def __pow__(self, exponent: int) -> "F": return F(pow(self.value, exponent, P))
-    def __eq__(self, other: object) -> bool: return self.value == other.value
+    def __add__(self, other: "F") -> "F": return _f((self.value + other.value) % P)
+    def __sub__(self, other: "F") -> "F": return _f((self.value - other.value) % P)
+    def __mul__(self, other: "F") -> "F": return _f(self.value * other.value % P)
+    def __neg__(self) -> "F": return _f(-self.value % P)
+    def __pow__(self, exponent: int) -> "F": return _f(pow(self.value, exponent, P))
     def __repr__(self) -> str: return f"F({self.value})"
 
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, F):
+            return self.value == other.value
+        if isinstance(other, int):
+            return self.value == other % P
+        return NotImplemented
+
+    def inverse(self) -> "F":
+        assert self.value != 0
+        return _f(_inverse(self.value))
+
     @staticmethod
     def zero() -> "F":
-        return F(0)
+        return _f(0)
+
+    @staticmethod
+    def one() -> "F":
+        return _f(1)
 
     @staticmethod
     def two_addic_generator(bits: int) -> "F":
@@ -31,55 +49,213 @@ class F:
         return F(TWO_ADIC_GENERATOR) ** (2**(TWO_ADICITY - bits))
 
 
-# Extension field Fq (q = P^DEG)
+def inverse_python(value: int) -> int:
+    return pow(value, P - 2, P)
+
+
+_inverse = inverse_python  # inversion in Fp, set by the active backend (see backend.py)
+
+
+def _f(value: int) -> F:
+    # value must already be reduced
+    f = object.__new__(F)
+    f.value = value
+    return f
+
+
+# Extension field Fq (q = P^DEG), elements are c0 + c1.X + c2.X^2 + c3.X^3 with X^4 = W
+# Coordinates are stored as plain (reduced) ints, and every operation reduces only once per coordinate
 class EF:
+    __slots__ = ("c0", "c1", "c2", "c3")
+
     def __init__(self, value: List[F]):
         assert len(value) == DEG
-        self.value = value
+        self.c0, self.c1, self.c2, self.c3 = value[0].value, value[1].value, value[2].value, value[3].value
+
+    @staticmethod
+    def from_ints(c0: int, c1: int, c2: int, c3: int) -> "EF":
+        return _ef(c0 % P, c1 % P, c2 % P, c3 % P)
 
+    @staticmethod
     def from_base(value: F) -> "EF":
-        return EF([value] + [F(0) for _ in range(DEG - 1)])
+        return _ef(value.value, 0, 0, 0)
+
+    @property
+    def value(self) -> Tuple[F, F, F, F]:
+        # a copy of the coordinates (read-only, EF is immutable)
+        return (_f(self.c0), _f(self.c1), _f(self.c2), _f(self.c3))
+
+    def coords(self) -> Tuple[int, int, int, int]:
+        return (self.c0, self.c1, self.c2, self.c3)
 
     def __add__(self, other: "EF") -> "EF":
-        return EF([self.value[i] + other.value[i] for i in range(DEG)])
+        return _ef((self.c0 + other.c0) % P, (self.c1 + other.c1) % P, (self.c2 + other.c2) % P, (self.c3 + other.c3) % P)
 
     def __sub__(self, other: "EF") -> "EF":
-        return EF([self.value[i] - other.value[i] for i in range(DEG)])
+        return _ef((self.c0 - other.c0) % P, (self.c1 - other.c1) % P, (self.c2 - other.c2) % P, (self.c3 - other.c3) % P)
+
+    def __neg__(self) -> "EF":
+        return _ef(-self.c0 % P, -self.c1 % P, -self.c2 % P, -self.c3 % P)
 
     def __mul__(self, other: "EF") -> "EF":
-        result = [F(0) for _ in range(DEG)]
-        for i in range(DEG):
-            for j in range(DEG):
-                if i + j < DEG:
-                    result[i + j] += self.value[i] * other.value[j]
-                else:
-                    result[i + j - DEG] += self.value[i] * other.value[j] * F(W)
-        return EF(result)
+        # schoolbook product, the wrapped-around partial products are multiplied by W once per coordinate
+        a0, a1, a2, a3 = self.c0, self.c1, self.c2, self.c3
+        b0, b1, b2, b3 = other.c0, other.c1, other.c2, other.c3
+        return _ef(
+            (a0 * b0 + W * (a1 * b3 + a2 * b2 + a3 * b1)) % P,
+            (a0 * b1 + a1 * b0 + W * (a2 * b3 + a3 * b2)) % P,
+            (a0 * b2 + a1 * b1 + a2 * b0 + W * a3 * b3) % P,
+            (a0 * b3 + a1 * b2 + a2 * b1 + a3 * b0) % P,
+        )
+
+    def mul_base(self, other: F) -> "EF":
+        b = other.value
+        return _ef(self.c0 * b % P, self.c1 * b % P, self.c2 * b % P, self.c3 * b % P)
+
+    def __pow__(self, exponent: int) -> "EF":
+        result = EF.one()
+        base = self
+        while exponent > 0:
+            if exponent & 1:
+                result = result * base
+            base = base * base
+            exponent >>= 1
+        return result
+
+    def inverse(self) -> "EF":
+        # Write a = A + X.B with A, B in Fp[Y]/(Y^2 - W), Y = X^2.
+        # Then a.(A - X.B) = A^2 - Y.B^2 =: N lies in Fp[Y]/(Y^2 - W), and a^-1 = (A - X.B).N^-1
+        a0, a1, a2, a3 = self.c0, self.c1, self.c2, self.c3
+        n0 = (a0 * a0 + W * (a2 * a2 - 2 * a1 * a3)) % P
+        n1 = (2 * a0 * a2 - a1 * a1 - W * a3 * a3) % P
+        d = (n0 * n0 - W * n1 * n1) % P  # norm down to Fp
+        assert d != 0
+        d_inv = _inverse(d)
+        m0, m1 = n0 * d_inv % P, -n1 * d_inv % P
+        return _ef(
+            (a0 * m0 + W * a2 * m1) % P,
+            -(a1 * m0 + W * a3 * m1) % P,
+            (a2 * m0 + a0 * m1) % P,
+            -(a3 * m0 + a1 * m1) % P,
+        )
 
     def __eq__(self, other: object) -> bool:
-        return all(self.value[i] == other.value[i] for i in range(DEG))
+        # base field elements and ints are compared through the embedding (ints modulo P)
+        if not isinstance(other, EF):
+            if isinstance(other, F):
+                other = EF.from_base(other)
+            elif isinstance(other, int):
+                other = EF.from_ints(other, 0, 0, 0)
+            else:
+                return NotImplemented
+        return self.c0 == other.c0 and self.c1 == other.c1 and self.c2 == other.c2 and self.c3 == other.c3
 
     def __repr__(self) -> str:
-        return f"EF({self.value})"
+        return f"EF({list(self.value)})"
 
     @staticmethod
-    def zero() -> "F":
-        return EF([F(0) for _ in range(DEG)])
-    
+    def zero() -> "EF":
+        return _ef(0, 0, 0, 0)
+
     @staticmethod
-    def one() -> "F":
-        return EF([F(1)] + [F(0) for _ in range(DEG - 1)])
+    def one() -> "EF":
+        return _ef(1, 0, 0, 0)
+
+
+def _ef(c0: int, c1: int, c2: int, c3: int) -> EF:
+    # coordinates must already be reduced
+    e = object.__new__(EF)
+    e.c0, e.c1, e.c2, e.c3 = c0, c1, c2, c3
+    return e
+
+
+Field = TypeVar("Field", F, EF)
+
+
+def batch_inverse(elements: List[Field]) -> List[Field]:
+    return _batch_inverse(elements)
+
+
+def batch_inverse_montgomery(elements: List[Field]) -> List[Field]:
+    # Montgomery's trick: n inversions for the price of 1 inversion and 3(n-1) multiplications
+    if len(elements) == 0:
+        return []
+    prefix_products = [elements[0]]
+    for e in elements[1:]:
+        prefix_products.append(prefix_products[-1] * e)
+    inv = prefix_products[-1].inverse()
+    result = [None] * len(elements)
+    for i in range(len(elements) - 1, 0, -1):
+        result[i] = inv * prefix_products[i - 1]
+        inv = inv * elements[i]
+    result[0] = inv
+    return result
+
 
+def batch_inverse_naive(elements: List[Field]) -> List[Field]:
+    return [e.inverse() for e in elements]
 
-def list_to_base_field(list: Union[List[F], List[EF]]) -> List[F]:
+
+_batch_inverse = batch_inverse_montgomery  # set by the active backend (see backend.py)
+
+
+def powers(x: Field, n: int) -> List[Field]:
+    # [1, x, x^2, ..., x^(n-1)], one multiplication each
+    result = []
+    cur = type(x).one()
+    for _ in range(n):
+        result.append(cur)
+        cur = cur * x
+    return result
+
+
+class FixedBaseTable:
+    # Fixed-base windowed exponentiation: table[k][d] = base^(d * 2^(k * window)),
+    # so that base^e costs one multiplication per window of e (e < 2^max_bits)
+
+    def __init__(self, base: Field, max_bits: int, window: int = 8):
+        self.max_bits = max_bits
+        self.window = window
+        self.table = []
+        window_base = base
+        for _ in range(0, max_bits, window):
+            self.table.append(powers(window_base, 2 ** window))
+            for _ in range(window):
+                window_base = window_base * window_base
+
+    def pow(self, exponent: int) -> Field:
+        assert 0 <= exponent < 2 ** self.max_bits
+        mask = 2 ** self.window - 1
+        result = self.table[0][exponent & mask]
+        for k in range(1, len(self.table)):
+            exponent >>= self.window
+            result = result * self.table[k][exponent & mask]
+        return result
+
+
+@lru_cache(maxsize=None)
+def two_adic_generator_table(bits: int) -> FixedBaseTable:
+    # powers of the generator of the two-adic subgroup of size 2^bits, shared by every proof
+    return FixedBaseTable(F.two_addic_generator(bits), max(bits, 1))
+
+
+def list_to_base_field(list: Union[List[F], List[EF], "FVec", "EFVec"]) -> Union[List[F], "FVec"]:
+    from finite_field_vec import FVec, EFVec  # (finite_field_vec imports this module)
+    if isinstance(list, EFVec):
+        return list.to_base_field()
+    if isinstance(list, FVec):
+        return list
     if len(list) == 0:
         return []
     if isinstance(list[0], EF):
-        return sum([e.value for e in list], [])
+        return [_f(c) for e in list for c in (e.c0, e.c1, e.c2, e.c3)]
     else:
         return list
 
 
-def list_to_ext_field(list: List[F]) -> EF:
+def list_to_ext_field(list: Union[List[F], "FVec"]) -> Union[List[EF], "EFVec"]:
+    from finite_field_vec import FVec, EFVec
     assert len(list) % DEG == 0
-    return [EF(list[i:i + DEG]) for i in range(0, len(list), DEG)]
+    if isinstance(list, FVec):
+        return EFVec.from_base_field(list)
+    return [_ef(list[i].value, list[i + 1].value, list[i + 2].value, list[i + 3].value) for i in range(0, len(list), DEG)]
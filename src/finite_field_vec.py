@@ -0,0 +1,238 @@
+from typing import List, Union
+import numpy as np
+from finite_field import *
+
+# Batched counterparts of F and EF, backed by contiguous NumPy arrays.
+# Elements are stored in canonical form (in [0, P)) as uint32, and widened to uint64 for arithmetic:
+# since P < 2^31, the product of two canonical elements fits in 62 bits.
+
+
+def _wide(a: np.ndarray) -> np.ndarray:
+    return a.astype(np.uint64, copy=False)
+
+
+def _canonical(a: np.ndarray) -> np.ndarray:
+    # a must already be reduced mod P
+    return a.astype(np.uint32)
+
+
+def _add(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    s = _wide(a) + _wide(b)
+    return np.where(s >= P, s - P, s)
+
+
+def _sub(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return _add(a, P - _wide(b))
+
+
+# Multiplication kernels, dispatched to the active backend (see backend.py) through the hooks below.
+# The NumPy ones are the default, the Python ones are the reference (one int operation at a time).
+
+
+def mul_numpy(a: np.ndarray, b: Union[np.ndarray, np.uint64]) -> np.ndarray:
+    # elementwise product in Fp (b broadcasts), reduced, as uint64
+    return (_wide(a) * _wide(b)) % P
+
+
+def mul_python(a: np.ndarray, b: Union[np.ndarray, np.uint64]) -> np.ndarray:
+    a, b = np.broadcast_arrays(a, b)
+    products = [x * y % P for x, y in zip(a.ravel().tolist(), b.ravel().tolist())]
+    return np.array(products, dtype=np.uint64).reshape(a.shape)
+
+
+def ext_mul_numpy(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # product in EF of limb-major arrays (shape (DEG, n), b broadcasts), canonical uint32
+    a = _wide(a)
+    b = _wide(b)
+    # schoolbook product, each partial product is reduced so that the accumulators stay below 2^34
+    acc = [None] * (2 * DEG - 1)
+    for i in range(DEG):
+        for j in range(DEG):
+            term = (a[i] * b[j]) % P
+            acc[i + j] = term if acc[i + j] is None else acc[i + j] + term
+    # reduction modulo X^DEG - W
+    for k in range(DEG - 1):
+        acc[k] = acc[k] + (acc[k + DEG] % P) * W
+    return _canonical(np.stack(acc[:DEG]) % P)
+
+
+def ext_mul_python(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a, b = np.broadcast_arrays(a, b)
+    products = [
+        ((a0 * b0 + W * (a1 * b3 + a2 * b2 + a3 * b1)) % P,
+         (a0 * b1 + a1 * b0 + W * (a2 * b3 + a3 * b2)) % P,
+         (a0 * b2 + a1 * b1 + a2 * b0 + W * a3 * b3) % P,
+         (a0 * b3 + a1 * b2 + a2 * b1 + a3 * b0) % P)
+        for (a0, a1, a2, a3), (b0, b1, b2, b3) in zip(a.T.tolist(), b.T.tolist())
+    ]
+    return np.array(products, dtype=np.uint32).reshape(-1, DEG).T
+
+
+def matrix_dot_numpy(rows: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    # dot product of each row of a base field matrix (shape (n_rows, n), canonical entries) with limb-major weights
+    # (shape (DEG, n)), as limbs of shape (DEG, n_rows)
+    # weights are split in 16-bit halves, so that a chunk of 2^16 products can be accumulated without overflow
+    chunk = 1 << 16
+    w = _wide(weights)
+    w_low, w_high = w & 0xFFFF, w >> 16
+    result = np.zeros((rows.shape[0], DEG), dtype=np.uint64)
+    for start in range(0, rows.shape[1], chunk):
+        m = _wide(rows[:, start:start + chunk])
+        low = (m @ w_low[:, start:start + chunk].T) % P
+        high = (m @ w_high[:, start:start + chunk].T) % P
+        result = (result + low + (high << 16)) % P
+    return _canonical(result.T)
+
+
+def matrix_dot_python(rows: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    columns = weights.tolist()
+    result = [[sum(m * w for m, w in zip(row, column)) % P for row in rows.tolist()] for column in columns]
+    return np.array(result, dtype=np.uint32).reshape(DEG, rows.shape[0])
+
+
+_mul = mul_numpy  # set by the active backend (see backend.py)
+_ext_mul = ext_mul_numpy  # idem
+_matrix_dot = matrix_dot_numpy  # idem
+
+
+class FVec:
+    # A vector of base field elements, shape (n,)
+
+    def __init__(self, values: np.ndarray):
+        assert values.ndim == 1
+        self.values = values
+
+    @staticmethod
+    def zeros(n: int) -> "FVec":
+        return FVec(np.zeros(n, dtype=np.uint32))
+
+    @staticmethod
+    def from_list(list: List[F]) -> "FVec":
+        return FVec(np.array([f.value for f in list], dtype=np.uint32))
+
+    def to_list(self) -> List[F]:
+        return [F(v) for v in self.values.tolist()]
+
+    def __len__(self) -> int: return len(self.values)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[F, "FVec"]:
+        if isinstance(index, slice):
+            return FVec(self.values[index])
+        return F(int(self.values[index]))
+
+    def __add__(self, other: Union["FVec", F]) -> "FVec": return FVec(_canonical(_add(self.values, _base_limb(other))))
+    def __sub__(self, other: Union["FVec", F]) -> "FVec": return FVec(_canonical(_sub(self.values, _base_limb(other))))
+
+    def __mul__(self, other: Union["FVec", F, "EFVec", EF]) -> Union["FVec", "EFVec"]:
+        if isinstance(other, (EFVec, EF)):
+            return EFVec.lift(self) * other
+        return FVec(_canonical(_mul(self.values, _base_limb(other))))
+
+    def __eq__(self, other: object) -> bool:
+        return len(self) == len(other) and bool(np.all(self.values == _base_limb(other)))
+
+    def __repr__(self) -> str:
+        return f"FVec({self.values.tolist()})"
+
+    def sum(self) -> F:
+        return F(int(np.sum(_wide(self.values)) % P))  # no overflow for n < 2^33
+
+
+class EFVec:
+    # A vector of extension field elements, stored limb-major: limbs has shape (DEG, n),
+    # and limbs[k] holds the k-th coordinate (in the basis 1, X, X^2, X^3) of every element
+
+    def __init__(self, limbs: np.ndarray):
+        assert limbs.ndim == 2 and limbs.shape[0] == DEG
+        self.limbs = limbs
+
+    @staticmethod
+    def zeros(n: int) -> "EFVec":
+        return EFVec(np.zeros((DEG, n), dtype=np.uint32))
+
+    @staticmethod
+    def from_list(list: List[EF]) -> "EFVec":
+        return EFVec(np.array([[e.coords()[k] for e in list] for k in range(DEG)], dtype=np.uint32).reshape(DEG, len(list)))
+
+    def to_list(self) -> List[EF]:
+        return [EF.from_ints(*column) for column in self.limbs.T.tolist()]
+
+    @staticmethod
+    def lift(base: FVec) -> "EFVec":
+        # embedding of base field elements
+        limbs = np.zeros((DEG, len(base)), dtype=np.uint32)
+        limbs[0] = base.values
+        return EFVec(limbs)
+
+    @staticmethod
+    def from_base_field(base: FVec) -> "EFVec":
+        # same as list_to_ext_field: groups DEG consecutive base field elements into one extension field element
+        # (no copy: the limbs are a strided view on base)
+        assert len(base) % DEG == 0
+        return EFVec(base.values.reshape(-1, DEG).T)
+
+    def to_base_field(self) -> FVec:
+        # same as list_to_base_field
+        return FVec(np.ascontiguousarray(self.limbs.T).reshape(-1))
+
+    def __len__(self) -> int: return self.limbs.shape[1]
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[EF, "EFVec"]:
+        if isinstance(index, slice):
+            return EFVec(self.limbs[:, index])
+        return EF.from_ints(*self.limbs[:, index].tolist())
+
+    def __add__(self, other: Union["EFVec", EF]) -> "EFVec": return EFVec(_canonical(_add(self.limbs, _ext_limbs(other))))
+    def __sub__(self, other: Union["EFVec", EF]) -> "EFVec": return EFVec(_canonical(_sub(self.limbs, _ext_limbs(other))))
+
+    def __mul__(self, other: Union["EFVec", EF, FVec, F]) -> "EFVec":
+        if isinstance(other, (FVec, F)):
+            return EFVec(_canonical(_mul(self.limbs, _base_limb(other))))
+        return EFVec(_ext_mul(self.limbs, _ext_limbs(other)))
+
+    @staticmethod
+    def concat(vectors: List[Union["EFVec", List[EF]]]) -> "EFVec":
+        return EFVec(np.concatenate([(v if isinstance(v, EFVec) else EFVec.from_list(v)).limbs for v in vectors], axis=1))
+
+    def __eq__(self, other: object) -> bool:
+        return len(self) == len(other) and bool(np.all(self.limbs == _ext_limbs(other)))
+
+    def __repr__(self) -> str:
+        return f"EFVec({self.to_list()})"
+
+    def sum(self) -> EF:
+        return EF.from_ints(*(np.sum(_wide(self.limbs), axis=1) % P).tolist())
+
+    def dot(self, other: Union["EFVec", FVec]) -> EF:
+        return (self * other).sum()
+
+    def horner(self, x: EF) -> EF:
+        # sum_i self[i].x^i, straight on the coordinates (a short polynomial is too small to amortize NumPy calls)
+        x0, x1, x2, x3 = x.coords()
+        r0 = r1 = r2 = r3 = 0
+        for c0, c1, c2, c3 in reversed(self.limbs.T.tolist()):
+            r0, r1, r2, r3 = (
+                (r0 * x0 + W * (r1 * x3 + r2 * x2 + r3 * x1) + c0) % P,
+                (r0 * x1 + r1 * x0 + W * (r2 * x3 + r3 * x2) + c1) % P,
+                (r0 * x2 + r1 * x1 + r2 * x0 + W * r3 * x3 + c2) % P,
+                (r0 * x3 + r1 * x2 + r2 * x1 + r3 * x0 + c3) % P,
+            )
+        return EF.from_ints(r0, r1, r2, r3)
+
+
+def matrix_dot(rows: np.ndarray, weights: EFVec) -> EFVec:
+    # dot product of each row of a base field matrix (shape (n_rows, n), canonical entries) with weights (length n)
+    assert rows.shape[1] == len(weights)
+    return EFVec(_matrix_dot(rows, weights.limbs))
+
+
+def _base_limb(x: Union[FVec, F]) -> Union[np.ndarray, int]:
+    if isinstance(x, FVec):
+        return x.values
+    return np.uint64(x.value)
+
+
+def _ext_limbs(x: Union[EFVec, EF]) -> np.ndarray:
+    if isinstance(x, EFVec):
+        return x.limbs
+    return np.array([[c] for c in x.coords()], dtype=np.uint64)  # broadcasts over (DEG, n)
@@ -1,6 +1,8 @@
 from typing import Annotated, List, Literal, Union
 from finite_field import *
+from finite_field_vec import *
 from poseidon2 import *
+import numpy as np
 
 Digest = Annotated[List[F], Literal[DIGEST_LEN]]
 
@@ -11,19 +13,152 @@ def verify_merkle_path(root: Digest, index: int, leaf: Union[List[F], List[EF]],
     # 2. hash the leaf
     leaf_base = list_to_base_field(leaf)
     state: PermutationState = [F(0) for _ in range(POSEIDON_WIDTH)]
-    for i in range(0, len(leaf), DIGEST_LEN):
+    for i in range(0, len(leaf_base), DIGEST_LEN):
         for j in range(DIGEST_LEN):
             state[j] = leaf_base[i+j] if i + j < len(leaf_base) else F(0)
         state = poseidon2_permutation(state)
     # 3. walk up the path
     for i in range(height):
         is_left = (index >> i) & 1  # doable via bit-decomposition for the recursion
-        if is_left:
-            for j in range(DIGEST_LEN):
-                state[j + DIGEST_LEN] = auth_path[i][j]
-        else:
-            for j in range(DIGEST_LEN):
-                state[j] = auth_path[i][j]
+        node = state[:DIGEST_LEN]
+        state = node + auth_path[i] if is_left else auth_path[i] + node
         state = poseidon2_permutation(state)
     # 4. check the root
     assert state[:DIGEST_LEN] == root
+
+
+Leaf = Union[List[F], List[EF], FVec, EFVec]
+
+
+def _leaf_values(leaf: Leaf) -> np.ndarray:
+    # the leaf, flattened to base field elements
+    if isinstance(leaf, FVec):
+        return leaf.values
+    if isinstance(leaf, EFVec):
+        return leaf.to_base_field().values
+    return np.array([f.value for f in list_to_base_field(leaf)], dtype=np.uint32)
+
+
+def _digest_values(digests: Union[List[Digest], np.ndarray]) -> np.ndarray:
+    # one digest per row (an array, e.g. a view on the transcript, is used as is)
+    if isinstance(digests, np.ndarray):
+        return digests.reshape(-1, DIGEST_LEN)
+    return np.array([[f.value for f in digest] for digest in digests], dtype=np.uint32).reshape(len(digests), DIGEST_LEN)
+
+
+def _hash_leaves_batch(leaves: List[Leaf]) -> np.ndarray:
+    return hash_leaves(np.array([_leaf_values(leaf) for leaf in leaves], dtype=np.uint32))
+
+
+def hash_leaves(leaves_base: np.ndarray) -> np.ndarray:
+    # one leaf (flattened to base field elements) per row, same sponge as verify_merkle_path
+    states = np.zeros((leaves_base.shape[0], POSEIDON_WIDTH), dtype=np.uint32)
+    for i in range(0, leaves_base.shape[1], DIGEST_LEN):
+        chunk = leaves_base[:, i:i + DIGEST_LEN]
+        states[:, :DIGEST_LEN] = 0
+        states[:, :chunk.shape[1]] = chunk
+        states = poseidon2_permutation_batch(states)
+    return states[:, :DIGEST_LEN]
+
+
+def verify_merkle_paths(root: Digest, indices: List[int], leaves: List[Leaf], auth_paths: List[Union[List[Digest], np.ndarray]],
+                        height: int):
+    # Same as calling verify_merkle_path on each (index, leaf, auth_path), but all the paths are walked in lockstep,
+    # with one batched permutation per step (leaves must have the same length)
+    assert len(indices) == len(leaves) == len(auth_paths)
+    if len(indices) == 0:
+        return
+    auth_paths = [_digest_values(auth_path) for auth_path in auth_paths]
+    assert all(len(auth_path) == height for auth_path in auth_paths)
+    nodes = _hash_leaves_batch(leaves)
+    siblings = np.array(auth_paths, dtype=np.uint32).reshape(len(indices), height, DIGEST_LEN)
+    indices = np.array(indices, dtype=np.int64)
+    for i in range(height):
+        is_left = (((indices >> i) & 1) == 1)[:, None]
+        states = np.where(is_left, np.hstack([nodes, siblings[:, i]]), np.hstack([siblings[:, i], nodes]))
+        nodes = poseidon2_permutation_batch(states)[:, :DIGEST_LEN]
+    assert np.all(nodes == np.array([f.value for f in root], dtype=np.uint32))
+
+
+def merkle_multiproof_size(indices: List[int], height: int) -> int:
+    # number of digests in the multiproof of the (sorted, deduplicated) indices: the siblings that cannot be derived
+    known = sorted(set(indices))
+    size = 0
+    for _ in range(height):
+        known_set = set(known)
+        size += sum(1 for i in known if i ^ 1 not in known_set)
+        known = sorted(set(i >> 1 for i in known))
+    return size
+
+
+def verify_merkle_multiproof(root: Digest, indices: List[int], leaves: List[Leaf], proof: Union[List[Digest], np.ndarray], height: int):
+    # Multiproof for several leaves of the same tree.
+    # Leaves are deduplicated and sorted by index, then the tree is walked level by level, computing each node at most once.
+    # The proof contains only the siblings the verifier cannot derive itself, level by level, in increasing index order.
+    assert len(indices) == len(leaves)
+    by_index = {}
+    for index, leaf in zip(indices, leaves):
+        assert 0 <= index < 2 ** height
+        if index in by_index:
+            assert np.array_equal(_leaf_values(by_index[index]), _leaf_values(leaf))
+        by_index[index] = leaf
+    known = sorted(by_index)
+    proof = _digest_values(proof)
+    if len(known) == 0:
+        assert len(proof) == 0
+        return
+    nodes = _hash_leaves_batch([by_index[i] for i in known])
+    cursor = 0
+    for _ in range(height):
+        # pair every known node with its sibling (known, or read from the proof)
+        position = {index: k for k, index in enumerate(known)}
+        parents, states = [], []
+        for k, index in enumerate(known):
+            if index ^ 1 in position:
+                if index & 1 == 1:
+                    continue  # already handled with its sibling
+                sibling = nodes[position[index ^ 1]]
+            else:
+                assert cursor < len(proof)
+                sibling = proof[cursor]
+                cursor += 1
+            is_left = index & 1  # same convention as verify_merkle_path
+            states.append(np.concatenate([nodes[k], sibling]) if is_left else np.concatenate([sibling, nodes[k]]))
+            parents.append(index >> 1)
+        nodes = poseidon2_permutation_batch(np.array(states, dtype=np.uint32))[:, :DIGEST_LEN]
+        known = parents
+    assert cursor == len(proof)
+    assert known == [0] and nodes[0].tolist() == [f.value for f in root]
+
+
+# Prover side (used by the reference prover)
+
+def merkle_tree_levels(leaves_base: np.ndarray) -> List[np.ndarray]:
+    # levels[0] holds the digests of the leaves (one leaf per row), levels[-1] the root
+    levels = [hash_leaves(leaves_base)]
+    while len(levels[-1]) > 1:
+        nodes = levels[-1]
+        levels.append(poseidon2_permutation_batch(np.hstack([nodes[1::2], nodes[0::2]]))[:, :DIGEST_LEN])
+    return levels
+
+
+def merkle_root(levels: List[np.ndarray]) -> Digest:
+    return [F(v) for v in levels[-1][0].tolist()]
+
+
+def merkle_auth_path(levels: List[np.ndarray], index: int) -> List[F]:
+    # the siblings from the leaf up to the root, flattened
+    return [F(v) for height, level in enumerate(levels[:-1]) for v in level[(index >> height) ^ 1].tolist()]
+
+
+def merkle_multiproof(levels: List[np.ndarray], indices: List[int]) -> List[F]:
+    # the siblings verify_merkle_multiproof cannot derive, in the order it reads them, flattened
+    known = sorted(set(indices))
+    proof = []
+    for level in levels[:-1]:
+        known_set = set(known)
+        for index in known:
+            if index ^ 1 not in known_set:
+                proof += [F(v) for v in level[index ^ 1].tolist()]
+        known = sorted(set(index >> 1 for index in known))
+    return proof
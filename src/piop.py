@@ -1,8 +1,15 @@
 from typing import Literal, Optional, List, Sequence
 from finite_field import *
+from finite_field_vec import *
 from polynomial import *
 from whir import *
-import copy
+from transcript import BaseTranscriptReader, TranscriptReader
+from checks import *
+from profiling import phase
+from backend import use_backend
+from dataclasses import asdict, astuple, dataclass
+import json
+import numpy as np
 
 UNIVARIATE_SKIPS = 3
 
@@ -22,25 +29,176 @@ class AirTable:
 
     def log_n_witness_columns(self) -> int:
         # rounded up
-        return self.n_witness_columns().bit_length() - 1
+        return (self.n_witness_columns() - 1).bit_length()
 
+    def compiled_constraints(self) -> CompiledCircuit:
+        # all the constraints in a single straight-line program, built once
+        if getattr(self, "_compiled_constraints", None) is None:
+            self._compiled_constraints = compile_circuits(self.constraints, 2 * self.n_columns)
+        return self._compiled_constraints
 
-def column_up(col: List[F]) -> List[F]:
-    up = copy.deepcopy(col)
-    up[-1] = up[-2]
-    return up
+    def preprocessed_matrix(self) -> np.ndarray:
+        # the preprocessed columns as one (n_preprocessed_columns, 2^log_n_rows) array, built once
+        if getattr(self, "_preprocessed_matrix", None) is None:
+            self._preprocessed_matrix = np.array([[f.value for f in col] for col in self.preprocessed_columns],
+                                                 dtype=np.uint32).reshape(len(self.preprocessed_columns), 2 ** self.log_n_rows)
+        return self._preprocessed_matrix
 
+    def verifying_key(self) -> "VerifyingKey":
+        # the key for the table's WHIR parameters, built once (and again if the parameters change)
+        whir_params = astuple(self.whir_params)
+        if getattr(self, "_verifying_key", None) is None or self._verifying_key[0] != whir_params:
+            self._verifying_key = (whir_params, VerifyingKey.build(self))
+        return self._verifying_key[1]
 
-def column_down(col: List[F]) -> List[F]:
-    down = copy.deepcopy(col[1:])
-    down.append(down[-1])
-    return down
+
+VERIFYING_KEY_VERSION = 4  # 2: fiat_shamir_version, 3: no univariate_selectors, 4: np.savez instead of pickle
+
+
+@dataclass
+class VerifyingKey:
+    # Everything piop_verify needs that depends only on the table and the WHIR parameters.
+    # Built once, it can be saved to disk and loaded at startup.
+    log_n_rows: int
+    n_columns: int
+    n_witness_columns: int
+    max_constraint_degree: int
+    constraints: CompiledCircuit
+    preprocessed_columns: np.ndarray  # (n_preprocessed_columns, 2^log_n_rows)
+    matrix_up: MatrixUpPolynomial
+    matrix_down: MatrixDownPolynomial
+    whir_params: WhirParams
+    whir_query_tables: List[FixedBaseTable]
+    fiat_shamir_version: int = 1  # sponge mode, see fiat_shamir.py
+
+    @staticmethod
+    def build(table: AirTable, whir_params: Optional[WhirParams] = None, fiat_shamir_version: int = 1) -> "VerifyingKey":
+        whir_params = whir_params or table.whir_params
+        check_univariate_selectors(getattr(table, "univariate_selectors", None))
+        return VerifyingKey(
+            log_n_rows=table.log_n_rows,
+            n_columns=table.n_columns,
+            n_witness_columns=table.n_witness_columns(),
+            max_constraint_degree=table.max_constraint_degree,
+            constraints=table.compiled_constraints(),
+            preprocessed_columns=table.preprocessed_matrix(),
+            matrix_up=MatrixUpPolynomial(table.log_n_rows),
+            matrix_down=MatrixDownPolynomial(table.log_n_rows),
+            whir_params=whir_params,
+            whir_query_tables=whir_query_tables(whir_params),
+            fiat_shamir_version=fiat_shamir_version,
+        )
+
+    def log_n_witness_columns(self) -> int:
+        # rounded up
+        return (self.n_witness_columns - 1).bit_length()
+
+    def save(self, path: str) -> None:
+        # the primitive fields only (no pickle): everything else is rebuilt on load
+        header = {
+            "log_n_rows": self.log_n_rows,
+            "n_columns": self.n_columns,
+            "n_witness_columns": self.n_witness_columns,
+            "max_constraint_degree": self.max_constraint_degree,
+            "fiat_shamir_version": self.fiat_shamir_version,
+            "whir_params": asdict(self.whir_params),
+            "constraints": {"n_inputs": self.constraints.n_inputs, "tape": self.constraints.tape, "outputs": self.constraints.outputs},
+        }
+        with open(path, "wb") as f:
+            np.savez(f, version=np.array(VERIFYING_KEY_VERSION), header=np.array(json.dumps(header)),
+                     constants=np.array([c.coords() for c in self.constraints.constants], dtype=np.uint32).reshape(-1, DEG),
+                     preprocessed_columns=self.preprocessed_columns)
+
+    @staticmethod
+    def load(path: str) -> "VerifyingKey":
+        with open(path, "rb") as f, np.load(f, allow_pickle=False) as data:
+            assert int(data["version"]) == VERIFYING_KEY_VERSION
+            header = json.loads(str(data["header"]))
+            constants, preprocessed_columns = data["constants"], data["preprocessed_columns"]
+        log_n_rows, n_columns, n_witness_columns = header["log_n_rows"], header["n_columns"], header["n_witness_columns"]
+        assert preprocessed_columns.dtype == np.uint32 and np.all(preprocessed_columns < P)
+        assert preprocessed_columns.shape == (n_columns - n_witness_columns, 2 ** log_n_rows)
+        assert constants.dtype == np.uint32 and np.all(constants < P) and constants.shape[1:] == (DEG,)
+        circuit = header["constraints"]
+        n_registers = circuit["n_inputs"] + len(constants)
+        assert circuit["n_inputs"] == 2 * n_columns
+        tape = []
+        for op, a, b in circuit["tape"]:
+            assert op in ("add", "sub", "mul") and 0 <= a < n_registers and 0 <= b < n_registers
+            tape.append((op, a, b))
+            n_registers += 1
+        assert all(0 <= o < n_registers for o in circuit["outputs"])
+        params = header["whir_params"]
+        whir_params = WhirParams(params["initial_ood_samples"], [RoundParams(**r) for r in params["rounds"]],
+                                 params["merkle_multiproof"])
+        return VerifyingKey(
+            log_n_rows=log_n_rows,
+            n_columns=n_columns,
+            n_witness_columns=n_witness_columns,
+            max_constraint_degree=header["max_constraint_degree"],
+            constraints=CompiledCircuit(circuit["n_inputs"], [EF.from_ints(*c) for c in constants.tolist()], tape,
+                                        circuit["outputs"]),
+            preprocessed_columns=preprocessed_columns,
+            matrix_up=MatrixUpPolynomial(log_n_rows),
+            matrix_down=MatrixDownPolynomial(log_n_rows),
+            whir_params=whir_params,
+            whir_query_tables=whir_query_tables(whir_params),
+            fiat_shamir_version=header["fiat_shamir_version"],
+        )
+
+
+def check_univariate_selectors(selectors: Optional[List[UnivariatePolynomial]]) -> None:
+    # The zerocheck evaluates the selectors with lagrange_selector_evals (and uses sum_i L_i(a).L_i(b) = eq(a, b) on the
+    # skipped variables), so a table can only carry the Lagrange basis: reject anything else rather than ignore it
+    if selectors is None:
+        return
+    domain_size = 2 ** UNIVARIATE_SKIPS
+    assert len(selectors) == domain_size
+    for i, selector in enumerate(selectors):
+        assert len(selector.coefficients) <= domain_size  # so that the values on the domain determine the polynomial
+        for j in range(domain_size):
+            assert selector.evaluate(EF.from_ints(j, 0, 0, 0)) == (EF.one() if i == j else EF.zero())
+
+
+def verifying_key(key: Union[AirTable, VerifyingKey]) -> VerifyingKey:
+    return key if isinstance(key, VerifyingKey) else key.verifying_key()
+
+
+def shifted_columns_evals(columns: np.ndarray, selector_evals: List[EF], point: List[EF]) -> Tuple[List[EF], List[EF]]:
+    # For each column col (a row of `columns`), returns in a single pass over the rows:
+    #   up:   fold_rectangular(MultilinearEvals(col[:-1] + [col[-2]]), selector_evals).evaluate(point)
+    #   down: fold_rectangular(MultilinearEvals(col[1:] + [col[-1]]), selector_evals).evaluate(point)
+    # Row k has weight w[k] = selector_evals[k // 2^len(point)] * eq(point, k % 2^len(point)), so that:
+    #   up   = sum_k w[k] col[k] + w[-1] (col[-2] - col[-1])
+    #   down = sum_k w[k] col[k + 1] (for k < n - 1) + w[-1] col[-1]
+    n_cols, n_rows = columns.shape
+    block_size = 2 ** len(point)
+    assert n_rows == block_size * len(selector_evals) and n_rows >= 2
+    if n_cols == 0:
+        return [], []
+    eq = eq_table(point).vec()
+    up = EFVec.zeros(n_cols)
+    down = EFVec.zeros(n_cols)
+    for j, selector_eval in enumerate(selector_evals):
+        start, end = j * block_size, (j + 1) * block_size
+        weights = eq * selector_eval
+        up += matrix_dot(columns[:, start:end], weights)
+        if end < n_rows:
+            down += matrix_dot(columns[:, start + 1:end + 1], weights)
+        else:
+            down += matrix_dot(columns[:, start + 1:end], weights[:-1])
+    last_weight = weights[-1]
+    last, before_last = FVec(columns[:, -1]), FVec(columns[:, -2])
+    up += (before_last - last) * last_weight
+    down += last * last_weight
+    return up.to_list(), down.to_list()
 
 
 def sumcheck_verify(
     fs: FiatShamirVerifier,
     degree: int,
-    n_vars: int
+    n_vars: int,
+    checks: EqualityChecks
 ) -> Tuple[EF, Evaluation]:  # (sum, delayed evaluation)
     challenges = []
     sum = None
@@ -48,9 +206,9 @@ def sumcheck_verify(
     for i in range(n_vars):
         poly = UnivariatePolynomial(fs.receive_scalars_ext(degree + 1))
         if i == 0:
-            sum = poly.evaluate(EF.zero()) + poly.evaluate(EF.one())
+            sum = poly.evaluate_zero_plus_one()
         else:
-            assert target == poly.evaluate(EF.zero()) + poly.evaluate(EF.one())
+            checks.check(target, poly.evaluate_zero_plus_one(), "sumcheck round")
         challenge = fs.random_scalar()
         challenges.append(challenge)
         target = poly.evaluate(challenge)
@@ -61,67 +219,151 @@ def sumcheck_verify_with_univariate_skip(
     fs: FiatShamirVerifier,
     degree: int,
     n_vars: int,
-    skips: int
+    skips: int,
+    checks: EqualityChecks
 ) -> Tuple[EF, Evaluation]:  # (sum, delayed evaluation)
     challenges = []
 
     poly = UnivariatePolynomial(fs.receive_scalars_ext(degree * 2 ** skips))
-    sum = sum([poly.evaluate(EF.from_base(F(i))) for i in range(2 ** skips)])
+    sum = poly.sum_over_domain(skips)
     challenge = fs.random_scalar()
     challenges.append(challenge)
     target = poly.evaluate(challenge)
 
     for i in range(n_vars - skips):
         poly = UnivariatePolynomial(fs.receive_scalars_ext(degree + 1))
-        assert target == poly.evaluate(EF.zero()) + poly.evaluate(EF.one())
+        checks.check(target, poly.evaluate_zero_plus_one(), "zerocheck sumcheck round")
         challenge = fs.random_scalar()
         challenges.append(challenge)
         target = poly.evaluate(challenge)
     return sum, Evaluation(challenges, target)
 
 
-def piop_verify(table: AirTable, proof_transcript: List[F]):
-    fs = FiatShamirVerifier(proof_transcript)
-    whir_commitment = whir_parse_commitment(table.whir_params, fs)
-    constraints_batching_scalar = fs.random_scalar()
-    zerocheck_challenges = [fs.random_scalar() for _ in range(table.log_n_rows - UNIVARIATE_SKIPS + 1)]
-    (zero_sum, zerocheck_eval) = sumcheck_verify_with_univariate_skip(fs, table.max_constraint_degree+1, table.log_n_rows, UNIVARIATE_SKIPS)
-    assert zero_sum == 0
-    witness_shifted_evals = fs.receive_scalars_ext(table.n_witness_columns() * 2)
-    witness_up = witness_shifted_evals[:table.n_witness_columns()]
-    witness_down = witness_shifted_evals[table.n_witness_columns():]
-    zerocheck_selector_evals = [selector.evaluate(zerocheck_eval.point[0]) for selector in table.univariate_selectors]
-    preprocessed_up = [fold_rectangular(MultilinearEvals(column_up(col)), zerocheck_selector_evals).evaluate(
-        zerocheck_eval.point[1:]) for col in table.preprocessed_columns]
-    preprocessed_down = [fold_rectangular(MultilinearEvals(column_down(col)), zerocheck_selector_evals).evaluate(
-        zerocheck_eval.point[1:]) for col in table.preprocessed_columns]
-    global_point = preprocessed_up + witness_up + preprocessed_down + witness_down
-    global_constraint_eval = EF.zero()
-    for i, constraint in enumerate(table.constraints):
-        global_constraint_eval += constraints_batching_scalar ** i * constraint.evaluate(global_point)
-    zerocheck_selector_evals = [selector.evaluate(zerocheck_challenges[0]) for selector in table.univariate_selectors]
-    assert dot_product(zerocheck_selector_evals, zerocheck_selector_evals) * \
-        eq_extension(zerocheck_challenges[1:],  zerocheck_eval.point[1:]) == zerocheck_eval.value
-
-    secondary_sumcheck_batching_scalar = fs.random_scalar()
-    batched_inner_sum, inner_sumcheck_challenge = sumcheck_verify(fs, 3, table.log_n_rows + UNIVARIATE_SKIPS)
-    assert batched_inner_sum == sum([e * secondary_sumcheck_batching_scalar ** i for i, e in enumerate(witness_shifted_evals)])
-
-    matrix_lde_point = inner_sumcheck_challenge[:UNIVARIATE_SKIPS] + zerocheck_eval.point[1:] + inner_sumcheck_challenge[UNIVARIATE_SKIPS:]
-    matrix_up_eval = ArithmeticCircuit.matrix_up_lde(table.log_n_rows).evaluate(matrix_lde_point)
-    matrix_down_eval = ArithmeticCircuit.matrix_down_lde(table.log_n_rows).evaluate(matrix_lde_point)
-
-    final_inner_claims = fs.receive_scalars_ext(table.n_witness_columns())
-    batched_inner_value = EF.zero()
-    for u in range(table.n_witness_columns()):
-        batched_inner_value += final_inner_claims[u] * (secondary_sumcheck_batching_scalar ** u * matrix_up_eval +
-                                                        secondary_sumcheck_batching_scalar ** (u + table.n_witness_columns()) * matrix_down_eval)
-    batched_inner_value *= MultilinearEvals(zerocheck_selector_evals).evaluate(inner_sumcheck_challenge.point[:UNIVARIATE_SKIPS])
-    assert batched_inner_value == inner_sumcheck_challenge.value
-
-    final_random_scalars = [fs.random_scalar() for _ in range(table.log_n_witness_columns())]
+def piop_verify(key: Union[AirTable, VerifyingKey], proof_transcript: Union[List[F], BaseTranscriptReader],
+                checks: Optional[EqualityChecks] = None, backend: Optional[str] = None):
+    # with DeferredEqualityChecks, the caller is responsible for checks.finalize()
+    # backend: for this call only (see backend.py)
+    vk = verifying_key(key)
+    with use_backend(backend):
+        _piop_verify(vk, FiatShamirVerifier(proof_transcript, vk.fiat_shamir_version), checks if checks is not None else EqualityChecks())
+
+
+def _piop_verify(vk: VerifyingKey, fs: FiatShamirVerifier, checks: EqualityChecks):
+    with phase("commitment parsing"):
+        whir_commitment = whir_parse_commitment(vk.whir_params, fs)
+    packed_eval = _piop_verify_table(vk, fs, checks)
+    with phase("whir"):
+        whir_verify(vk.whir_params, fs, whir_commitment, packed_eval, vk.whir_query_tables, checks)
+
+
+def _piop_verify_table(vk: VerifyingKey, fs: FiatShamirVerifier, checks: EqualityChecks) -> Evaluation:
+    # zerocheck and inner sumcheck, reduced to an evaluation of the packed witness columns
+    # (column u, row b at index u + 2^log_n_witness_columns.b), to be checked by the WHIR opening
+    with phase("zerocheck"):
+        constraints_batching_scalar = fs.random_scalar()
+        zerocheck_challenges = fs.random_scalars(vk.log_n_rows - UNIVARIATE_SKIPS + 1)
+        (zero_sum, zerocheck_eval) = sumcheck_verify_with_univariate_skip(fs, vk.max_constraint_degree+1, vk.log_n_rows, UNIVARIATE_SKIPS, checks)
+        checks.check(zero_sum, EF.zero(), "zerocheck sum")
+        witness_shifted_evals = fs.receive_scalars_ext(vk.n_witness_columns * 2)
+        witness_up = witness_shifted_evals[:vk.n_witness_columns].to_list()
+        witness_down = witness_shifted_evals[vk.n_witness_columns:].to_list()
+        zerocheck_selector_evals = lagrange_selector_evals(zerocheck_eval.point[0], UNIVARIATE_SKIPS)
+        preprocessed_up, preprocessed_down = shifted_columns_evals(
+            vk.preprocessed_columns, zerocheck_selector_evals, zerocheck_eval.point[1:])
+        global_point = preprocessed_up + witness_up + preprocessed_down + witness_down
+        global_constraint_eval = EF.zero()
+        constraint_evals = vk.constraints.evaluate(global_point)
+        for constraint_eval, coeff in zip(constraint_evals, powers(constraints_batching_scalar, len(constraint_evals))):
+            global_constraint_eval += coeff * constraint_eval
+        # eq on the skipped variables is sum_i L_i(challenge).L_i(point)
+        challenge_selector_evals = lagrange_selector_evals(zerocheck_challenges[0], UNIVARIATE_SKIPS)
+        checks.check(global_constraint_eval * dot_product(challenge_selector_evals, zerocheck_selector_evals) *
+                     eq_extension(zerocheck_challenges[1:],  zerocheck_eval.point[1:]), zerocheck_eval.value, "zerocheck final evaluation")
+
+    with phase("inner sumcheck"):
+        secondary_sumcheck_batching_scalar = fs.random_scalar()
+        secondary_batching_powers = EFVec.from_list(powers(secondary_sumcheck_batching_scalar, 2 * vk.n_witness_columns))
+        batched_inner_sum, inner_sumcheck_challenge = sumcheck_verify(fs, 3, vk.log_n_rows + UNIVARIATE_SKIPS, checks)
+        checks.check(batched_inner_sum, witness_shifted_evals.dot(secondary_batching_powers), "inner sumcheck sum")
+
+        # The row index is (skipped variables, then zerocheck variables) from the most significant bit,
+        # and the multilinear evaluations are little-endian, while the matrices are big-endian (x then y)
+        row_point = zerocheck_eval.point[1:] + inner_sumcheck_challenge.point[:UNIVARIATE_SKIPS]
+        column_point = inner_sumcheck_challenge.point[UNIVARIATE_SKIPS:]
+        matrix_lde_point = row_point[::-1] + column_point[::-1]
+        matrix_up_eval = vk.matrix_up.evaluate(matrix_lde_point)
+        matrix_down_eval = vk.matrix_down.evaluate(matrix_lde_point)
+
+        final_inner_claims = fs.receive_scalars_ext(vk.n_witness_columns)
+        batched_inner_value = final_inner_claims.dot(secondary_batching_powers[:vk.n_witness_columns] * matrix_up_eval +
+                                                     secondary_batching_powers[vk.n_witness_columns:] * matrix_down_eval)
+        batched_inner_value *= MultilinearEvals(zerocheck_selector_evals).evaluate(inner_sumcheck_challenge.point[:UNIVARIATE_SKIPS])
+        checks.check(batched_inner_value, inner_sumcheck_challenge.value, "inner sumcheck final evaluation")
+
+    final_random_scalars = fs.random_scalars(vk.log_n_witness_columns())
     final_point = final_random_scalars + inner_sumcheck_challenge.point[UNIVARIATE_SKIPS:]
-    packed_value = MultilinearEvals(final_inner_claims + [EF.zero()
-                                    for _ in 2**table.log_n_witness_columns - table.n_witness_columns]).evaluate(final_random_scalars)
+    packed_value = MultilinearEvals(EFVec.concat([final_inner_claims, EFVec.zeros(
+        2**vk.log_n_witness_columns() - vk.n_witness_columns)])).evaluate(final_random_scalars)
+    return Evaluation(final_point, packed_value)
+
+
+# Multi-table verification: the packed witnesses of all the tables are committed together, in a single WHIR polynomial,
+# and opened once, at the final claims of all the tables. Packed witnesses are placed by decreasing number of variables,
+# so that each one starts at an offset aligned to its size, and the rest of the polynomial is zero.
+# The claim of a table at point p is then the evaluation of the whole polynomial at p + (the bits of its block index).
+
+
+def packed_n_variables(vk: VerifyingKey) -> int:
+    return vk.log_n_witness_columns() + vk.log_n_rows
+
+
+def multi_table_layout(keys: Sequence[VerifyingKey]) -> Tuple[int, List[int]]:
+    # (number of variables of the committed polynomial, offset of the packed witness of each table)
+    order = sorted(range(len(keys)), key=lambda t: -packed_n_variables(keys[t]))
+    offsets = [0] * len(keys)
+    size = 0
+    for t in order:
+        offsets[t] = size
+        size += 2 ** packed_n_variables(keys[t])
+    return (size - 1).bit_length(), offsets
+
+
+@dataclass
+class MultiVerifyingKey:
+    tables: List[VerifyingKey]  # their own whir_params are not used
+    offsets: List[int]
+    whir_params: WhirParams
+    whir_query_tables: List[FixedBaseTable]
+    fiat_shamir_version: int = 1  # sponge mode, see fiat_shamir.py
+
+    @staticmethod
+    def build(tables: Sequence[Union[AirTable, VerifyingKey]], whir_params: WhirParams,
+              fiat_shamir_version: int = 1) -> "MultiVerifyingKey":
+        keys = [verifying_key(table) for table in tables]
+        n_variables, offsets = multi_table_layout(keys)
+        assert whir_params.rounds[0].n_variables == n_variables
+        return MultiVerifyingKey(keys, offsets, whir_params, whir_query_tables(whir_params), fiat_shamir_version)
+
+    def n_variables(self) -> int:
+        return self.whir_params.rounds[0].n_variables
+
+    def claim_point(self, t: int, point: List[EF]) -> List[EF]:
+        # point on the packed witness of table t -> point on the committed polynomial
+        block = self.offsets[t] >> len(point)
+        return point + [EF.one() if (block >> i) & 1 else EF.zero() for i in range(self.n_variables() - len(point))]
+
 
-    whir_verify(table.whir_params, fs, whir_commitment, Evaluation(final_point, packed_value))
+def piop_verify_multi(key: MultiVerifyingKey, proof_transcript: Union[List[F], BaseTranscriptReader],
+                      checks: Optional[EqualityChecks] = None, backend: Optional[str] = None):
+    # the tables, in order, followed by a single WHIR opening
+    with use_backend(backend):
+        fs = FiatShamirVerifier(proof_transcript, key.fiat_shamir_version)
+        checks = checks if checks is not None else EqualityChecks()
+        with phase("commitment parsing"):
+            whir_commitment = whir_parse_commitment(key.whir_params, fs)
+        claims = []
+        for t, vk in enumerate(key.tables):
+            packed_eval = _piop_verify_table(vk, fs, checks)
+            claims.append(Evaluation(key.claim_point(t, packed_eval.point), packed_eval.value))
+        with phase("whir"):
+            whir_verify(key.whir_params, fs, whir_commitment, claims, key.whir_query_tables, checks)
@@ -1,6 +1,11 @@
+from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Literal, Optional, List, Sequence
+from typing import Literal, Optional, List, Sequence, Tuple, Union
 from finite_field import *
+from finite_field_vec import *
+import numpy as np
+import operator
+from functools import lru_cache
 
 
 @dataclass
@@ -10,50 +15,238 @@ class Evaluation:
 
 
 class UnivariatePolynomial:
-    def __init__(self, coefficients: List[EF]):
+    def __init__(self, coefficients: Union[List[EF], EFVec]):
         self.coefficients = coefficients
 
-    def evaluate(self, x: EF):
-        result = 0
-        for i, coeff in enumerate(self.coefficients):
-            result += coeff * (x ** i)
+    def evaluate(self, x: EF) -> EF:
+        if isinstance(self.coefficients, EFVec):
+            return self.coefficients.horner(x)
+        # Horner
+        result = EF.zero()
+        for coeff in reversed(self.coefficients):
+            result = result * x + coeff
         return result
 
+    def evaluate_zero_plus_one(self) -> EF:
+        # p(0) + p(1) = 2.c_0 + c_1 + ... + c_d
+        if len(self.coefficients) == 0:
+            return EF.zero()
+        if isinstance(self.coefficients, EFVec):
+            return self.coefficients.sum() + self.coefficients[0]
+        result = EF.zero()
+        for coeff in self.coefficients:
+            result += coeff
+        return result + self.coefficients[0]
+
+    def sum_over_domain(self, skips: int) -> EF:
+        # sum of p(x) for x in {0, 1, ..., 2^skips - 1}, = sum_i c_i.S_i with S_i the precomputed power sums
+        sums = _power_sums(skips, len(self.coefficients))
+        if isinstance(self.coefficients, EFVec):
+            return self.coefficients.dot(FVec.from_list(list(sums)))
+        result = EF.zero()
+        for coeff, s in zip(self.coefficients, sums):
+            result += coeff.mul_base(s)
+        return result
+
+
+@lru_cache(maxsize=None)
+def _power_sums(skips: int, n: int) -> Tuple[F, ...]:
+    # S_i = sum of x^i for x in {0, 1, ..., 2^skips - 1}, for i < n
+    return tuple(F(sum(pow(x, i, P) for x in range(2 ** skips))) for i in range(n))
+
+
+@lru_cache(maxsize=None)
+def _barycentric_weights(skips: int) -> Tuple[F, ...]:
+    # w_i = 1 / prod_{j != i} (i - j), on the domain {0, 1, ..., 2^skips - 1}
+    domain = range(2 ** skips)
+    weights = []
+    for i in domain:
+        denominator = 1
+        for j in domain:
+            if j != i:
+                denominator = denominator * (i - j) % P
+        weights.append(F(denominator))
+    return tuple(batch_inverse(weights))
+
+
+def lagrange_selector_evals(z: EF, skips: int) -> List[EF]:
+    # [L_0(z), ..., L_{2^skips - 1}(z)] for the Lagrange basis on {0, 1, ..., 2^skips - 1} (the univariate selectors),
+    # in one pass, with the barycentric formula: L_i(z) = w_i.l(z) / (z - i), l(z) = prod_j (z - j)
+    domain_size = 2 ** skips
+    differences = [z - EF.from_ints(i, 0, 0, 0) for i in range(domain_size)]
+    for i, d in enumerate(differences):
+        if d == EF.zero():
+            return [EF.one() if j == i else EF.zero() for j in range(domain_size)]
+    l = EF.one()
+    for d in differences:
+        l *= d
+    return [inv.mul_base(w) * l for inv, w in zip(batch_inverse(differences), _barycentric_weights(skips))]
+
+
+def univariate_selectors(skips: int) -> List[UnivariatePolynomial]:
+    # The i-th polynomial equals 1 on i and 0 on {0, 1, ..., 2**skips - 1} \ {i} (Lagrange basis, degree 2**skips - 1)
+    domain = range(2 ** skips)
+    selectors = []
+    for i in domain:
+        coeffs = [1]  # prod_{j != i} (X - j), low degree first
+        denominator = 1
+        for j in domain:
+            if j != i:
+                coeffs = [(a - j * b) % P for a, b in zip([0] + coeffs, coeffs + [0])]
+                denominator = denominator * (i - j) % P
+        inv = pow(denominator, P - 2, P)
+        selectors.append(UnivariatePolynomial([EF.from_ints(c * inv, 0, 0, 0) for c in coeffs]))
+    return selectors
+
 
 class MultilinearCoeffs:
     # a multilinear polynomial defined by its coefficients (canonical form)
+    # the coefficient at index i is attached to the monomial prod(x[j] for each bit j set in i)
 
-    def __init__(self, coefficients: List[EF]):
+    def __init__(self, coefficients: Union[List[EF], EFVec]):
         self.coefficients = coefficients
 
     def evaluate(self, x: List[EF]) -> EF:
+        # O(2^n): fold one variable at a time, starting from the most significant one
+        assert len(self.coefficients) == 2 ** len(x)
+        if isinstance(self.coefficients, EFVec):
+            coeffs = self.coefficients
+            for x_j in reversed(x):
+                half = len(coeffs) // 2
+                coeffs = coeffs[:half] + coeffs[half:] * x_j
+            return coeffs[0]
+        coeffs = _to_ext_list(self.coefficients)
+        size = len(coeffs)
+        for x_j in reversed(x):
+            size //= 2
+            for i in range(size):
+                coeffs[i] = coeffs[i] + coeffs[i + size] * x_j
+        return coeffs[0]
+
+
+class EqTable:
+    # eq(point, b) for every b in the hypercube (bit j of the index of b <-> point[j])
+    # Built once in O(2^n), then every multilinear polynomial evaluated at the same point costs a single dot product
+
+    def __init__(self, point: List[EF]):
+        self.point = point
+        self._table = None
+        self._vec = None
+
+    def __len__(self) -> int: return 2 ** len(self.point)
+
+    @property
+    def table(self) -> List[EF]:
+        if self._table is None:
+            table = [EF.one()]
+            for x_j in self.point:
+                high = [t * x_j for t in table]
+                table = [t - h for t, h in zip(table, high)] + high
+            self._table = table
+        return self._table
+
+    def vec(self) -> EFVec:
+        if self._vec is None:
+            table = EFVec.from_list([EF.one()])
+            for x_j in self.point:
+                high = table * x_j
+                table = EFVec.concat([table - high, high])
+            self._vec = table
+        return self._vec
+
+    def dot(self, evals: Union[List[F], List[EF], FVec, EFVec]) -> EF:
+        assert len(evals) == len(self)
+        if isinstance(evals, (FVec, EFVec)):
+            return self.vec().dot(evals)
         result = EF.zero()
-        for i, coeff in enumerate(self.coefficients):
-            term = coeff
-            for j, x_j in enumerate(x):
-                term *= x_j ** ((i >> j) & 1)
-            result += term
+        if len(evals) > 0 and isinstance(evals[0], F):
+            for t, e in zip(self.table, evals):
+                result += t.mul_base(e)
+        else:
+            for t, e in zip(self.table, evals):
+                result += t * e
         return result
 
 
+def eq_table(point: List[EF]) -> EqTable:
+    return EqTable(point)
+
+
 class MultilinearEvals:
     # a multilinear polynomial defined by its evaluations (on the hypercube)
+    # the evaluation at index i corresponds to the point whose j-th coordinate is bit j of i
 
-    def __init__(self, evals: List[EF]):
+    def __init__(self, evals: Union[List[EF], EFVec]):
         self.evals = evals
 
-    def evaluate(self, x: List[EF]) -> EF:
-        result = EF.zero()
-        for i in range(len(self.evals)):
-            basis_term = EF.one()
-            for j in range(len(x)):
-                bit = (i >> j) & 1
-                if bit == 1:
-                    basis_term *= x[j]
-                else:
-                    basis_term *= (EF.one() - x[j])
-            result += self.evals[i] * basis_term
-        return result
+    def evaluate(self, x: Union[List[EF], EqTable]) -> EF:
+        if isinstance(x, EqTable):
+            return x.dot(self.evals)
+        # O(2^n): fold one variable at a time, starting from the most significant one
+        assert len(self.evals) == 2 ** len(x)
+        if isinstance(self.evals, EFVec):
+            evals = self.evals
+            for x_j in reversed(x):
+                half = len(evals) // 2
+                evals = evals[:half] + (evals[half:] - evals[:half]) * x_j
+            return evals[0]
+        evals = _to_ext_list(self.evals)
+        size = len(evals)
+        for x_j in reversed(x):
+            size //= 2
+            for i in range(size):
+                low = evals[i]
+                evals[i] = low + (evals[i + size] - low) * x_j
+        return evals[0]
+
+
+def _to_vec(values: Union[List[EF], EFVec]) -> EFVec:
+    return values if isinstance(values, EFVec) else EFVec.from_list(values)
+
+
+def _to_ext_list(values: Union[List[F], List[EF]]) -> List[EF]:
+    # fresh copy, that can be folded in place
+    if len(values) > 0 and isinstance(values[0], F):
+        return [EF.from_base(v) for v in values]
+    return list(values)
+
+
+def monomials(x: List[EF]) -> EFVec:
+    # prod(x[j] for each bit j set in i), for every i: evaluating MultilinearCoeffs at x is a dot product with this vector
+    table = EFVec.from_list([EF.one()])
+    for x_j in x:
+        table = EFVec.concat([table, table * x_j])
+    return table
+
+
+def multilinear_coeffs_evaluate_batch(polynomials: List[Union[FVec, EFVec]], x: List[EF]) -> List[EF]:
+    # MultilinearCoeffs(p).evaluate(x) for every p (all in the same field, with 2^len(x) coefficients),
+    # as a single matrix-vector product against the monomials of x
+    if len(polynomials) == 0:
+        return []
+    m = monomials(x)
+    if isinstance(polynomials[0], FVec):
+        return matrix_dot(np.stack([p.values for p in polynomials]), m).to_list()
+    # extension field coefficients: sum_k X^k.(limb k of the coefficients . m)
+    limbs = np.stack([p.limbs for p in polynomials], axis=1)  # (DEG, n_polynomials, 2^len(x))
+    result = EFVec.zeros(len(polynomials))
+    x_power = EF.one()
+    for k in range(DEG):
+        result += matrix_dot(limbs[k], m) * x_power
+        x_power *= EF.from_ints(0, 1, 0, 0)
+    return result.to_list()
+
+
+def eq_extension_batch(points: List[List[EF]], s: List[EF]) -> EFVec:
+    # eq_extension(point, s) for every point (all of the same length):
+    # each factor p.s + (1 - p)(1 - s) = p.(2s - 1) + (1 - s) is an affine function of p
+    assert all(len(point) == len(s) for point in points)
+    one = EF.one()
+    result = EFVec.from_list([one] * len(points))
+    for j, s_j in enumerate(s):
+        coordinates = EFVec.from_list([point[j] for point in points])
+        result = result * (coordinates * (s_j + s_j - one) + (one - s_j))
+    return result
 
 
 def multilinear_point_from_univariate(point: EF, num_variables: int) -> List[EF]:
@@ -69,22 +262,35 @@ def eq_extension(s1: List[EF], s2: List[EF]) -> EF:
     assert len(s1) == len(s2)
     if not s1:
         return EF.one()
-    result = EF.one()
+    one = EF.one()
+    result = one
     for i in range(len(s1)):
-        result *= s2[i] * s1[i] + (EF.one() - s2[i]) * (EF.one() - s1[i])
+        result *= s2[i] * s1[i] + (one - s2[i]) * (one - s1[i])
     return result
 
 
 def fold_rectangular(multilinear: MultilinearEvals, scalars: List[EF]) -> MultilinearEvals:
     new_size = len(multilinear.evals) // len(scalars)
+    if isinstance(multilinear.evals, (FVec, EFVec)):
+        new_evals = EFVec.zeros(new_size)
+        for j, scalar in enumerate(scalars):
+            new_evals += multilinear.evals[j * new_size:(j + 1) * new_size] * scalar
+        return MultilinearEvals(new_evals)
+    evals = _to_ext_list(multilinear.evals)
     new_evals = [EF.zero() for _ in range(new_size)]
     for i in range(new_size):
-        new_evals[i] = sum(scalars[j] * multilinear.evals[i + j * new_size] for j in range(len(scalars)))
+        for j in range(len(scalars)):
+            new_evals[i] += scalars[j] * evals[i + j * new_size]
     return MultilinearEvals(new_evals)
 
 
-def dot_product(a: List[EF], b: List[EF]) -> EF:
-    sum(x * y for x, y in zip(a, b))
+def dot_product(a: Union[List[EF], EFVec], b: Union[List[EF], EFVec]) -> EF:
+    if isinstance(a, EFVec) or isinstance(b, EFVec):
+        return _to_vec(a).dot(_to_vec(b))
+    result = EF.zero()
+    for x, y in zip(a, b):
+        result += x * y
+    return result
 
 
 Op = Literal["const", "input", "add", "mul"]
@@ -94,21 +300,25 @@ Op = Literal["const", "input", "add", "mul"]
 class ArithmeticCircuit:
     op: Op
     children: Sequence["ArithmeticCircuit"] = ()  # for "add" / "mul"
-    const_value: Optional[F] = None
+    const_value: Optional[Union[F, EF]] = None
     input_index: Optional[int] = None
 
     @staticmethod
-    def const(value: F) -> "ArithmeticCircuit": return ArithmeticCircuit("const", const_value=value)
+    def const(value: Union[F, EF]) -> "ArithmeticCircuit": return ArithmeticCircuit("const", const_value=value)
 
     @staticmethod
     def var(i: int) -> "ArithmeticCircuit": return ArithmeticCircuit("input", input_index=i)
 
     def __add__(self, other: "ArithmeticCircuit") -> "ArithmeticCircuit": return ArithmeticCircuit("add", children=(self, other))
     def __mul__(self, other: "ArithmeticCircuit") -> "ArithmeticCircuit": return ArithmeticCircuit("mul", children=(self, other))
+    def __sub__(self, other: "ArithmeticCircuit") -> "ArithmeticCircuit": return self + other * ArithmeticCircuit.const(F(-1))
+
+    def compile(self) -> "CompiledCircuit":
+        return compile_circuits([self])
 
     def evaluate(self, inputs: List[EF]) -> EF:
         if self.op == "const":
-            return EF.from_base(self.const_value)
+            return _const_to_ext(self.const_value)
 
         if self.op == "input":
             idx = self.input_index
@@ -134,7 +344,7 @@ class ArithmeticCircuit:
         return ArithmeticCircuit._eq_extension(left, right)
 
     @staticmethod
-    def eq_extension_n_scalars(self, scalars: List[EF]) -> "ArithmeticCircuit":
+    def eq_extension_n_scalars(scalars: List[EF]) -> "ArithmeticCircuit":
         # eq(scalars, Xs) = ((scalars[0] X0 + (scalars[0] - 1) (X0 - 1)) * ((scalars[1] X1 + (scalars[1] - 1) (X1 - 1)) ...
         left = [ArithmeticCircuit.var(i) for i in range(len(scalars))]
         right = [ArithmeticCircuit.const(scalar) for scalar in scalars]
@@ -153,7 +363,7 @@ class ArithmeticCircuit:
         # returns a polynomial P in 2n vars, where P(x, y) = 1 iif y = x + 1 in big endian (both numbers are n bits)
 
         def factor(l, r):
-            return ArithmeticCircuit.var(l) * (ArithmeticCircuit.const(EF.one()) + ArithmeticCircuit.var(r) * ArithmeticCircuit.const(EF(-1)))
+            return ArithmeticCircuit.var(l) * (ArithmeticCircuit.const(EF.one()) + ArithmeticCircuit.var(r) * ArithmeticCircuit.const(F(-1)))
 
         def g(k):
             factors = []
@@ -177,9 +387,256 @@ class ArithmeticCircuit:
 
     @staticmethod
     def matrix_up_lde(n: int) -> "ArithmeticCircuit":
-        return ArithmeticCircuit.eq_extension_2n_vars(n) + ArithmeticCircuit.eq_extension_n_scalars([EF.one() for _ in (2 * n - 1)]) * (ArithmeticCircuit.const(EF.one()) -
+        return ArithmeticCircuit.eq_extension_2n_vars(n) + ArithmeticCircuit.eq_extension_n_scalars([EF.one() for _ in range(2 * n - 1)]) * (ArithmeticCircuit.const(EF.one()) -
                                                                                                                                         ArithmeticCircuit.var(2 * n - 1) * ArithmeticCircuit.const(EF.from_base(F(2))))
 
     @staticmethod
     def matrix_down_lde(n: int) -> "ArithmeticCircuit":
-        return ArithmeticCircuit.next(n) + ArithmeticCircuit.eq_extension_n_scalars([EF.one() for _ in (2 * n)])
+        return ArithmeticCircuit.next(n) + ArithmeticCircuit.eq_extension_n_scalars([EF.one() for _ in range(2 * n)])
+
+
+
+class StructuredPolynomial(ABC):
+    # A polynomial with a succinct description: evaluate(inputs) computes its value directly in O(n_vars) field operations,
+    # and to_circuit() gives the equivalent ArithmeticCircuit (e.g. for recursive verifier cost models)
+    n_vars: int
+
+    @abstractmethod
+    def evaluate(self, inputs: List[EF]) -> EF: ...
+
+    @abstractmethod
+    def to_circuit(self) -> ArithmeticCircuit: ...
+
+    def compile(self) -> "CompiledCircuit":
+        return self.to_circuit().compile()
+
+
+class EqPolynomial(StructuredPolynomial):
+    # eq(X, Y), in 2n vars
+    def __init__(self, n: int):
+        self.n = n
+        self.n_vars = 2 * n
+
+    def evaluate(self, inputs: List[EF]) -> EF:
+        assert len(inputs) == self.n_vars
+        return eq_extension(inputs[:self.n], inputs[self.n:])
+
+    def to_circuit(self) -> ArithmeticCircuit:
+        return ArithmeticCircuit.eq_extension_2n_vars(self.n)
+
+
+class NextPolynomial(StructuredPolynomial):
+    # next(X, Y) = 1 iif Y = X + 1 (big endian, n bits each), in 2n vars
+    def __init__(self, n: int):
+        self.n = n
+        self.n_vars = 2 * n
+
+    def evaluate(self, inputs: List[EF]) -> EF:
+        # next(x, y) = sum_i eq(x[:i], y[:i]) * (1 - x[i]) * y[i] * prod_{j > i} x[j] * (1 - y[j])
+        assert len(inputs) == self.n_vars
+        n, one = self.n, EF.one()
+        x, y = inputs[:n], inputs[n:]
+        suffix = [one] * (n + 1)  # suffix[i] = prod_{j >= i} x[j] * (1 - y[j])
+        for i in range(n - 1, -1, -1):
+            suffix[i] = suffix[i + 1] * x[i] * (one - y[i])
+        result = EF.zero()
+        prefix_eq = one
+        for i in range(n):
+            result += prefix_eq * (one - x[i]) * y[i] * suffix[i + 1]
+            prefix_eq *= x[i] * y[i] + (one - x[i]) * (one - y[i])
+        return result
+
+    def to_circuit(self) -> ArithmeticCircuit:
+        return ArithmeticCircuit.next(self.n)
+
+
+class MatrixUpPolynomial(StructuredPolynomial):
+    # same as ArithmeticCircuit.matrix_up_lde(n):
+    # eq(X, Y) + X_0...X_{n-1}.Y_0...Y_{n-2}.(1 - 2.Y_{n-1})
+    def __init__(self, n: int):
+        self.n = n
+        self.n_vars = 2 * n
+
+    def evaluate(self, inputs: List[EF]) -> EF:
+        assert len(inputs) == self.n_vars
+        one = EF.one()
+        last_row = one
+        for v in inputs[:-1]:
+            last_row *= v
+        return eq_extension(inputs[:self.n], inputs[self.n:]) + last_row * (one - inputs[-1] - inputs[-1])
+
+    def to_circuit(self) -> ArithmeticCircuit:
+        return ArithmeticCircuit.matrix_up_lde(self.n)
+
+
+class MatrixDownPolynomial(StructuredPolynomial):
+    # same as ArithmeticCircuit.matrix_down_lde(n):
+    # next(X, Y) + X_0...X_{n-1}.Y_0...Y_{n-1}
+    def __init__(self, n: int):
+        self.n = n
+        self.n_vars = 2 * n
+
+    def evaluate(self, inputs: List[EF]) -> EF:
+        assert len(inputs) == self.n_vars
+        last_row = EF.one()
+        for v in inputs:
+            last_row *= v
+        return NextPolynomial(self.n).evaluate(inputs) + last_row
+
+    def to_circuit(self) -> ArithmeticCircuit:
+        return ArithmeticCircuit.matrix_down_lde(self.n)
+
+def _const_to_ext(value: Union[F, EF]) -> EF:
+    return EF.from_base(value) if isinstance(value, F) else value
+
+
+_TAPE_OPS = {"add": operator.add, "sub": operator.sub, "mul": operator.mul}
+
+
+@dataclass
+class CompiledCircuit:
+    # Straight-line program evaluating several circuits at once.
+    # Registers: [inputs (n_inputs) | constants | one register per instruction, in tape order]
+    # Each instruction (op, a, b) computes registers[a] op registers[b], with op in "add", "sub", "mul"
+    n_inputs: int
+    constants: List[EF]
+    tape: List[Tuple[str, int, int]]
+    outputs: List[int]  # register of each circuit
+
+    def evaluate(self, inputs: Union[List[EF], List[EFVec]]) -> Union[List[EF], List[EFVec]]:
+        # works on scalars, or on batched vectors (all of the same length)
+        assert len(inputs) == self.n_inputs
+        if len(inputs) > 0 and isinstance(inputs[0], EFVec):
+            n = len(inputs[0])
+            constants = [EFVec(np.broadcast_to(EFVec.from_list([c]).limbs, (DEG, n))) for c in self.constants]
+        else:
+            constants = self.constants
+        registers = list(inputs) + list(constants)
+        for op, a, b in self.tape:
+            registers.append(_TAPE_OPS[op](registers[a], registers[b]))
+        return [registers[o] for o in self.outputs]
+
+
+class _CircuitBuilder:
+    # Hash-consed DAG: structurally identical nodes get the same id. Constants are folded on the fly.
+
+    def __init__(self):
+        self.nodes: List[Tuple] = []  # ("input", index) / ("const", EF) / (op, child_id, child_id)
+        self.ids = {}
+
+    def _intern(self, key: Tuple, node: Tuple) -> int:
+        if key not in self.ids:
+            self.ids[key] = len(self.nodes)
+            self.nodes.append(node)
+        return self.ids[key]
+
+    def input(self, index: int) -> int:
+        return self._intern(("input", index), ("input", index))
+
+    def const(self, value: EF) -> int:
+        return self._intern(("const", value.coords()), ("const", value))
+
+    def _const_value(self, id: int) -> Optional[EF]:
+        node = self.nodes[id]
+        return node[1] if node[0] == "const" else None
+
+    def _negated(self, id: int) -> Optional[int]:
+        # if id = (-1) * x, returns x
+        node = self.nodes[id]
+        if node[0] == "mul":
+            for c, x in ((node[1], node[2]), (node[2], node[1])):
+                if self._const_value(c) == -EF.one():
+                    return x
+        return None
+
+    def add(self, a: int, b: int) -> int:
+        ca, cb = self._const_value(a), self._const_value(b)
+        if ca is not None and cb is not None:
+            return self.const(ca + cb)
+        if ca == EF.zero():
+            return b
+        if cb == EF.zero():
+            return a
+        if (x := self._negated(b)) is not None:
+            return self.sub(a, x)
+        if (x := self._negated(a)) is not None:
+            return self.sub(b, x)
+        a, b = min(a, b), max(a, b)
+        return self._intern(("add", a, b), ("add", a, b))
+
+    def sub(self, a: int, b: int) -> int:
+        ca, cb = self._const_value(a), self._const_value(b)
+        if ca is not None and cb is not None:
+            return self.const(ca - cb)
+        if cb == EF.zero():
+            return a
+        if a == b:
+            return self.const(EF.zero())
+        return self._intern(("sub", a, b), ("sub", a, b))
+
+    def mul(self, a: int, b: int) -> int:
+        ca, cb = self._const_value(a), self._const_value(b)
+        if ca is not None and cb is not None:
+            return self.const(ca * cb)
+        if ca == EF.zero() or cb == EF.zero():
+            return self.const(EF.zero())
+        if ca == EF.one():
+            return b
+        if cb == EF.one():
+            return a
+        a, b = min(a, b), max(a, b)
+        return self._intern(("mul", a, b), ("mul", a, b))
+
+    def add_circuit(self, circuit: ArithmeticCircuit) -> int:
+        # iterative post-order walk (circuits can be deep), each tree node is visited once
+        built = {}
+        stack = [(circuit, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if id(node) in built:
+                continue
+            if node.op == "const":
+                built[id(node)] = self.const(_const_to_ext(node.const_value))
+            elif node.op == "input":
+                built[id(node)] = self.input(node.input_index)
+            elif not children_done:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children if id(child) not in built)
+            else:
+                acc = self.const(EF.zero() if node.op == "add" else EF.one())
+                for child in node.children:
+                    acc = self.add(acc, built[id(child)]) if node.op == "add" else self.mul(acc, built[id(child)])
+                built[id(node)] = acc
+        return built[id(circuit)]
+
+
+def compile_circuits(circuits: List[ArithmeticCircuit], n_inputs: Optional[int] = None) -> CompiledCircuit:
+    builder = _CircuitBuilder()
+    roots = [builder.add_circuit(c) for c in circuits]
+
+    # keep only the nodes reachable from the outputs (ids are already in topological order)
+    live = [False] * len(builder.nodes)
+    for r in roots:
+        live[r] = True
+    for id in range(len(builder.nodes) - 1, -1, -1):
+        node = builder.nodes[id]
+        if live[id] and node[0] in _TAPE_OPS:
+            live[node[1]] = live[node[2]] = True
+
+    max_input = max((node[1] for node in builder.nodes if node[0] == "input"), default=-1)
+    n_inputs = max_input + 1 if n_inputs is None else n_inputs
+    assert max_input < n_inputs
+    registers = {}
+    constants = []
+    for id, node in enumerate(builder.nodes):
+        if node[0] == "input":
+            registers[id] = node[1]
+        elif node[0] == "const" and live[id]:
+            registers[id] = n_inputs + len(constants)
+            constants.append(node[1])
+    tape = []
+    for id, node in enumerate(builder.nodes):
+        if node[0] in _TAPE_OPS and live[id]:
+            registers[id] = n_inputs + len(constants) + len(tape)
+            tape.append((node[0], registers[node[1]], registers[node[2]]))
+    return CompiledCircuit(n_inputs, constants, tape, [registers[r] for r in roots])
@@ -1,5 +1,6 @@
 from finite_field import *
 from typing import Annotated, List, Literal
+import numpy as np
 
 POSEIDON_WIDTH = 16
 DIGEST_LEN = POSEIDON_WIDTH // 2
@@ -7,7 +8,134 @@ DIGEST_LEN = POSEIDON_WIDTH // 2
 PermutationState = Annotated[List[F], Literal[POSEIDON_WIDTH]]
 Digest = Annotated[List[F], Literal[DIGEST_LEN]]
 
+# Poseidon2 over KoalaBear, width 16 (https://eprint.iacr.org/2023/323)
+SBOX_DEGREE = 3  # x -> x^3 is a permutation since gcd(3, P - 1) = 1
+HALF_FULL_ROUNDS = 4
+PARTIAL_ROUNDS = 20
+
+
+# Round constants of Plonky3's KoalaBear width-16 Poseidon2 (p3-koala-bear, KOALABEAR_RC16_*), i.e. the output of the
+# Grain LFSR of the Poseidon2 reference implementation (p = 2^31 - 2^24 + 1, t = 16, R_F = 8, R_P = 20, alpha = 3):
+# the initial full rounds, then the partial rounds, then the final full rounds
+EXTERNAL_INITIAL_CONSTANTS = [
+    [2128964168, 288780357, 316938561, 2126233899, 426817493, 1714118888, 1045008582, 1738510837,
+     889721787, 8866516, 681576474, 419059826, 1596305521, 1583176088, 1584387047, 1529751136],
+    [1863858111, 1072044075, 517831365, 1464274176, 1138001621, 428001039, 245709561, 1641420379,
+     1365482496, 770454828, 693167409, 757905735, 136670447, 436275702, 525466355, 1559174242],
+    [1030087950, 869864998, 322787870, 267688717, 948964561, 740478015, 679816114, 113662466,
+     2066544572, 1744924186, 367094720, 1380455578, 1842483872, 416711434, 1342291586, 1692058446],
+    [1493348999, 1113949088, 210900530, 1071655077, 610242121, 1136339326, 2020858841, 1019840479,
+     678147278, 1678413261, 1361743414, 61132629, 1209546658, 64412292, 1936878279, 1980661727],
+]
+INTERNAL_CONSTANTS = [
+    1423960925, 2101391318, 1915532054, 275400051, 1168624859, 1141248885, 356546469, 1165250474, 1320543726, 932505663,
+    1204226364, 1452576828, 1774936729, 926808140, 1184948056, 1186493834, 843181003, 185193011, 452207447, 510054082,
+]
+EXTERNAL_FINAL_CONSTANTS = [
+    [1139268644, 630873441, 669538875, 462500858, 876500520, 1214043330, 383937013, 375087302,
+     636912601, 307200505, 390279673, 1999916485, 1518476730, 1606686591, 1410677749, 1581191572],
+    [1004269969, 143426723, 1747283099, 1016118214, 1749423722, 66331533, 1177761275, 1581069649,
+     1851371119, 852520128, 1499632627, 1820847538, 150757557, 884787840, 619710451, 1651711087],
+    [505263814, 212076987, 1482432120, 1458130652, 382871348, 417404007, 2066495280, 1996518884,
+     902934924, 582892981, 1337064375, 1199354861, 2102596038, 1533193853, 1436311464, 2012303432],
+    [839997195, 1225781098, 2011967775, 575084315, 1309329169, 786393545, 995788880, 1702925345,
+     1444525226, 908073383, 1811535085, 1531002367, 1635653662, 1585100155, 867006515, 879151050],
+]
+
+# Internal matrix: 1 + diag(V), with V = [-2, 1, 2, 1/2, 3, 4, -1/2, -3, -4, 1/2^8, 1/8, 1/2^24, -1/2^8, -1/8, -1/16, -1/2^24]
+INTERNAL_DIAG = [x % P for x in [
+    -2, 1, 2, pow(2, -1, P), 3, 4, -pow(2, -1, P), -3, -4,
+    pow(2, -8, P), pow(8, -1, P), pow(2, -24, P), -pow(2, -8, P), -pow(8, -1, P), -pow(16, -1, P), -pow(2, -24, P)
+]]
+
+# External matrix: circ(2.M4, M4, M4, M4), with:
+M4 = [[2, 3, 1, 1],
+      [1, 2, 3, 1],
+      [1, 1, 2, 3],
+      [3, 1, 1, 2]]
+
+
+def _external_linear_layer(state: List[int]) -> List[int]:
+    # apply M4 on each chunk of 4, then add to each element the sum of the elements at the same position in every chunk
+    mixed = []
+    for c in range(0, POSEIDON_WIDTH, 4):
+        x = state[c:c + 4]
+        mixed += [sum(M4[i][j] * x[j] for j in range(4)) for i in range(4)]
+    sums = [sum(mixed[k::4]) for k in range(4)]
+    return [(mixed[i] + sums[i % 4]) % P for i in range(POSEIDON_WIDTH)]
+
+
+def _internal_linear_layer(state: List[int]) -> List[int]:
+    s = sum(state)
+    return [(x * d + s) % P for x, d in zip(state, INTERNAL_DIAG)]
+
+
+def _full_round(state: List[int], constants: List[int]) -> List[int]:
+    return _external_linear_layer([pow(x + c, SBOX_DEGREE, P) for x, c in zip(state, constants)])
+
+
+def _partial_round(state: List[int], constant: int) -> List[int]:
+    return _internal_linear_layer([pow(state[0] + constant, SBOX_DEGREE, P)] + state[1:])
+
 
 def poseidon2_permutation(state: PermutationState) -> PermutationState:
-    # TODO
-    pass
\ No newline at end of file
+    assert len(state) == POSEIDON_WIDTH
+    return [F(x) for x in _permutation([x.value for x in state])]
+
+
+def permutation_python(state: List[int]) -> List[int]:
+    # works on any integer type (e.g. gmpy2.mpz)
+    s = _external_linear_layer(state)
+    for constants in EXTERNAL_INITIAL_CONSTANTS:
+        s = _full_round(s, constants)
+    for constant in INTERNAL_CONSTANTS:
+        s = _partial_round(s, constant)
+    for constants in EXTERNAL_FINAL_CONSTANTS:
+        s = _full_round(s, constants)
+    return s
+
+
+# Batched variant: permutes N states at once, stored as a (N, POSEIDON_WIDTH) array of canonical elements
+
+_M4_ARRAY = np.array(M4, dtype=np.uint64)
+_INTERNAL_DIAG_ARRAY = np.array(INTERNAL_DIAG, dtype=np.uint64)
+_EXTERNAL_INITIAL_ARRAY = np.array(EXTERNAL_INITIAL_CONSTANTS, dtype=np.uint64)
+_EXTERNAL_FINAL_ARRAY = np.array(EXTERNAL_FINAL_CONSTANTS, dtype=np.uint64)
+
+
+def _sbox_batch(x: np.ndarray) -> np.ndarray:
+    return (x * x % P) * x % P
+
+
+def _external_linear_layer_batch(states: np.ndarray) -> np.ndarray:
+    chunks = states.reshape(-1, POSEIDON_WIDTH // 4, 4)
+    mixed = chunks @ _M4_ARRAY.T  # entries < 7P
+    sums = mixed.sum(axis=1, keepdims=True)  # < 28P
+    return ((mixed + sums) % P).reshape(-1, POSEIDON_WIDTH)
+
+
+def _internal_linear_layer_batch(states: np.ndarray) -> np.ndarray:
+    s = states.sum(axis=1, keepdims=True)  # < 16P
+    return (states * _INTERNAL_DIAG_ARRAY % P + s) % P
+
+
+def poseidon2_permutation_batch(states: np.ndarray) -> np.ndarray:
+    assert states.ndim == 2 and states.shape[1] == POSEIDON_WIDTH
+    return _permutation_batch(states)
+
+
+def permutation_batch_numpy(states: np.ndarray) -> np.ndarray:
+    s = _external_linear_layer_batch(states.astype(np.uint64))
+    for constants in _EXTERNAL_INITIAL_ARRAY:
+        s = _external_linear_layer_batch(_sbox_batch((s + constants) % P))
+    for constant in INTERNAL_CONSTANTS:
+        s[:, 0] = _sbox_batch((s[:, 0] + constant) % P)
+        s = _internal_linear_layer_batch(s)
+    for constants in _EXTERNAL_FINAL_ARRAY:
+        s = _external_linear_layer_batch(_sbox_batch((s + constants) % P))
+    return s.astype(np.uint32)
+
+
+# Implementations used by poseidon2_permutation and poseidon2_permutation_batch, set by the active backend (see backend.py)
+_permutation = permutation_python
+_permutation_batch = permutation_batch_numpy
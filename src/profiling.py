@@ -0,0 +1,142 @@
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, Optional, Tuple, Union
+import json
+import sys
+import threading
+import time
+from finite_field import *
+from finite_field_vec import *
+import finite_field_vec
+import poseidon2
+import merkle_tree
+
+# Operation counters and per-phase timers for the verifier.
+# Nothing is instrumented outside of `with profiling() as profile:`: the counted methods and functions are
+# swapped in on entry and restored on exit, and phase() returns a shared no-op context manager.
+# Counts of vectorized operations (FVec, EFVec, batched permutations / Merkle paths) are in elements. Kernels that work
+# on raw limbs are counted in the operations they replace: EFVec.horner as one EF.mul and one EF.add per coefficient,
+# matrix_dot as rows x cols x DEG base field multiplications (each entry times the DEG coordinates of its weight).
+# The swap is process-wide, but the counting is context-local: only the code running in the context that entered
+# profiling() is counted (including contexts copied from it, e.g. the streaming worker thread), not other threads,
+# nor the worker processes of the batch verifier. A single profiling() session can be active at a time per process.
+
+
+@dataclass
+class PhaseStats:
+    calls: int = 0
+    seconds: float = 0.0
+    counters: Counter = field(default_factory=Counter)  # operations performed inside the phase (including nested phases)
+
+
+@dataclass
+class Profile:
+    counters: Counter = field(default_factory=Counter)
+    phases: Dict[str, PhaseStats] = field(default_factory=dict)
+
+    def report(self) -> dict:
+        return {
+            "counters": dict(sorted(self.counters.items())),
+            "phases": {name: {"calls": p.calls, "seconds": p.seconds, "counters": dict(sorted(p.counters.items()))}
+                       for name, p in self.phases.items()},
+        }
+
+    def to_json(self, indent: Optional[int] = 2) -> str:
+        return json.dumps(self.report(), indent=indent)
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            f.write(self.to_json())
+
+
+_active: ContextVar[Optional[Profile]] = ContextVar("profile", default=None)
+_session = threading.Lock()  # held while the instrumentation is installed
+_NULL_PHASE = nullcontext()
+
+
+def phase(name: str):
+    # e.g. `with phase("zerocheck"):`
+    profile = _active.get()
+    return _NULL_PHASE if profile is None else _timed_phase(profile, name)
+
+
+@contextmanager
+def _timed_phase(profile: Profile, name: str) -> Iterator[None]:
+    before = profile.counters.copy()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = profile.phases.setdefault(name, PhaseStats())
+        stats.calls += 1
+        stats.seconds += time.perf_counter() - start
+        stats.counters.update(profile.counters - before)
+
+
+def _one(*args) -> int: return 1
+def _length(self, *args) -> int: return len(self)
+
+
+# (class, method, counter name(s), number of operations per call)
+_METHODS = [
+    (F, "__add__", "F.add", _one), (F, "__sub__", "F.sub", _one), (F, "__mul__", "F.mul", _one),
+    (F, "__neg__", "F.neg", _one), (F, "__pow__", "F.pow", _one), (F, "inverse", "F.inverse", _one),
+    (EF, "__add__", "EF.add", _one), (EF, "__sub__", "EF.sub", _one), (EF, "__mul__", "EF.mul", _one),
+    (EF, "mul_base", "EF.mul_base", _one), (EF, "__neg__", "EF.neg", _one), (EF, "__pow__", "EF.pow", _one),
+    (EF, "inverse", "EF.inverse", _one),
+    (FVec, "__add__", "FVec.add", _length), (FVec, "__sub__", "FVec.sub", _length), (FVec, "__mul__", "FVec.mul", _length),
+    (EFVec, "__add__", "EFVec.add", _length), (EFVec, "__sub__", "EFVec.sub", _length), (EFVec, "__mul__", "EFVec.mul", _length),
+    (EFVec, "horner", ("EF.mul", "EF.add"), _length),
+]
+
+# (module, function, counter name(s), number of operations per call)
+_FUNCTIONS = [
+    (finite_field_vec, "matrix_dot", "matrix_dot", lambda rows, weights: rows.shape[0] * rows.shape[1] * DEG),
+    (poseidon2, "poseidon2_permutation", "poseidon2_permutation", _one),
+    (poseidon2, "poseidon2_permutation_batch", "poseidon2_permutation", lambda states: states.shape[0]),
+    (merkle_tree, "verify_merkle_path", "merkle_path", _one),
+    (merkle_tree, "verify_merkle_paths", "merkle_path", lambda root, indices, *args: len(indices)),
+    (merkle_tree, "verify_merkle_multiproof", "merkle_path", lambda root, indices, *args: len(set(indices))),
+]
+
+
+def _counted(names: Union[str, Tuple[str, ...]], size: Callable, original: Callable) -> Callable:
+    names = (names,) if isinstance(names, str) else names
+
+    def counted(*args):
+        profile = _active.get()
+        if profile is not None:
+            n = size(*args)
+            for name in names:
+                profile.counters[name] += n
+        return original(*args)
+    return counted
+
+
+@contextmanager
+def profiling() -> Iterator[Profile]:
+    assert _session.acquire(blocking=False), "profiling() is not reentrant, and cannot run in several threads at once"
+    profile = Profile()
+    restore = []
+    token = _active.set(profile)
+    try:
+        for cls, method, name, size in _METHODS:
+            original = vars(cls)[method]
+            setattr(cls, method, _counted(name, size, original))
+            restore.append((cls, method, original))
+        # modules import these functions with `from ... import *`: rebind every copy
+        for module, function, name, size in _FUNCTIONS:
+            original = getattr(module, function)
+            counted = _counted(name, size, original)
+            for m in list(sys.modules.values()):
+                if getattr(m, function, None) is original:
+                    setattr(m, function, counted)
+                    restore.append((m, function, original))
+        yield profile
+    finally:
+        _active.reset(token)
+        for target, attribute, original in reversed(restore):
+            setattr(target, attribute, original)
+        _session.release()
@@ -0,0 +1,350 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Tuple, Union
+import numpy as np
+from finite_field import *
+from finite_field_vec import *
+from polynomial import *
+from merkle_tree import *
+from fiat_shamir import FiatShamirProver
+from whir import WhirParams
+from piop import AirTable, VerifyingKey, MultiVerifyingKey, UNIVARIATE_SKIPS, verifying_key
+
+# Reference prover: produces the transcripts consumed by piop_verify / whir_verify, to test and benchmark the verifier.
+# Straightforward (not optimized, not zero-knowledge), every step mirrors the corresponding step of the verifier.
+# Multilinear tables are little-endian and sumchecks bind the least significant variable first.
+
+
+@lru_cache(maxsize=None)
+def _interpolation_matrix(n: int) -> np.ndarray:
+    # entry (k, i): coefficient of X^k in the Lagrange basis polynomial L_i on {0, 1, ..., n - 1}
+    matrix = np.zeros((n, n), dtype=np.uint32)
+    for i in range(n):
+        coeffs = [1]  # prod_{j != i} (X - j), low degree first
+        denominator = 1
+        for j in range(n):
+            if j != i:
+                coeffs = [(a - j * b) % P for a, b in zip([0] + coeffs, coeffs + [0])]
+                denominator = denominator * (i - j) % P
+        inv = pow(denominator, P - 2, P)
+        matrix[:, i] = [c * inv % P for c in coeffs]
+    return matrix
+
+
+def _interpolate(evals: List[EF]) -> List[EF]:
+    # coefficients of the polynomial of degree < len(evals) taking the value evals[x] at x = 0, 1, ...
+    return matrix_dot(_interpolation_matrix(len(evals)), EFVec.from_list(evals)).to_list()
+
+
+def _lift(values: np.ndarray) -> EFVec:
+    return EFVec.lift(FVec(values.astype(np.uint32)))
+
+
+def _fold(table: EFVec, r: EF) -> EFVec:
+    # binds the least significant variable to r
+    low, high = table[0::2], table[1::2]
+    return low + (high - low) * r
+
+
+def _lines(table: EFVec, n_points: int) -> List[EFVec]:
+    # the table with its least significant variable bound to 0, 1, ..., n_points - 1
+    low, high = table[0::2], table[1::2]
+    diff = high - low
+    return [low + diff * F(t) for t in range(n_points)]
+
+
+def _evals_to_coeffs(evals: np.ndarray) -> np.ndarray:
+    # multilinear evaluations on the hypercube -> coefficients (along the last axis), see MultilinearCoeffs
+    coeffs = evals.astype(np.uint64)
+    size = coeffs.shape[-1]
+    step = 1
+    while step < size:
+        view = coeffs.reshape(coeffs.shape[:-1] + (size // (2 * step), 2, step))
+        view[..., 1, :] = (view[..., 1, :] + P - view[..., 0, :]) % P
+        step *= 2
+    return coeffs.astype(np.uint32)
+
+
+def _ntt(coeffs: np.ndarray, log_size: int) -> np.ndarray:
+    # evaluations at g^0, g^1, ..., g^(2^log_size - 1) (g = F.two_addic_generator(log_size))
+    # of the polynomials given by their coefficients along the last axis (zero-padded)
+    size = 2 ** log_size
+    a = np.zeros(coeffs.shape[:-1] + (size,), dtype=np.uint64)
+    a[..., :coeffs.shape[-1]] = coeffs
+    reversed_bits = np.array([int(format(i, f"0{log_size}b")[::-1], 2) if log_size > 0 else 0 for i in range(size)])
+    a = a[..., reversed_bits]
+    for s in range(1, log_size + 1):
+        half = 2 ** (s - 1)
+        twiddles = np.array([t.value for t in powers(F.two_addic_generator(s), half)], dtype=np.uint64)
+        a = a.reshape(coeffs.shape[:-1] + (size // (2 * half), 2 * half))
+        u, v = a[..., :half], a[..., half:] * twiddles % P
+        a = np.concatenate([(u + v) % P, (u + P - v) % P], axis=-1)
+    return a.reshape(coeffs.shape[:-1] + (size,)).astype(np.uint32)
+
+
+def _whir_leaves(coeff_limbs: np.ndarray, folding_factor: int, domain_size: int) -> np.ndarray:
+    # coeff_limbs: (1 or DEG, 2^n) coefficients of the polynomial.
+    # Leaf i holds [h_0(g^i), ..., h_{2^folding_factor - 1}(g^i)], g generating the domain of size 2^(domain_size - folding_factor),
+    # with h_j(Y) = sum_k c[j + 2^folding_factor.k].Y^k, so that MultilinearCoeffs(leaf i) at the folding randomness
+    # is the folded polynomial at multilinear_point_from_univariate(g^i) (one leaf per row, flattened to the base field)
+    n_limbs, n_coeffs = coeff_limbs.shape
+    h = coeff_limbs.reshape(n_limbs, n_coeffs >> folding_factor, 2 ** folding_factor).transpose(0, 2, 1)
+    evals = _ntt(h, domain_size - folding_factor)  # (n_limbs, 2^folding_factor, 2^(domain_size - folding_factor))
+    return np.ascontiguousarray(evals.transpose(2, 1, 0)).reshape(evals.shape[2], -1)
+
+
+def _to_base_list(values: np.ndarray) -> List[F]:
+    return [F(v) for v in values.tolist()]
+
+
+@dataclass
+class WhirWitness:
+    evals: np.ndarray  # the committed polynomial, on the hypercube (base field)
+    coefficients: np.ndarray
+    leaves: np.ndarray
+    tree: List[np.ndarray]
+    ood_points: List[List[EF]]
+
+
+def whir_commit(params: WhirParams, fs: FiatShamirProver, evals: np.ndarray) -> WhirWitness:
+    # counterpart of whir_parse_commitment
+    first_round = params.rounds[0]
+    assert len(evals) == 2 ** first_round.n_variables
+    coefficients = _evals_to_coeffs(evals)
+    leaves = _whir_leaves(coefficients[None], first_round.folding_factor, first_round.domain_size)
+    tree = merkle_tree_levels(leaves)
+    fs.send_scalars_base(merkle_root(tree))
+    ood_points = [multilinear_point_from_univariate(z, first_round.n_variables) for z in fs.random_scalars(params.initial_ood_samples)]
+    polynomial = MultilinearCoeffs(_lift(coefficients))
+    for point in ood_points:
+        fs.send_scalars_ext([polynomial.evaluate(point)])
+    return WhirWitness(evals, coefficients, leaves, tree, ood_points)
+
+
+def whir_prove(params: WhirParams, fs: FiatShamirProver, witness: WhirWitness, points: Union[List[EF], List[List[EF]]]):
+    # counterpart of whir_verify, for the evaluation(s) of the committed polynomial at one point, or at several points
+    points = points if isinstance(points[0], list) else [points]
+    assert all(len(point) == params.rounds[0].n_variables for point in points)
+    evals = _lift(witness.evals)
+    coefficients = _lift(witness.coefficients)
+    weights = EFVec.zeros(len(evals))  # sum of the eq polynomials of the constraints, batched by the combination randomness
+    new_points = witness.ood_points + points
+    leaves, tree = witness.leaves, witness.tree
+
+    for r, round in enumerate(params.rounds):
+        # 0. Combination randomness
+        fs.pow_grinding(round.combination_pow_bits)
+        combination_randomness_gen = fs.random_scalar()
+        for new_point, coeff in zip(new_points, powers(combination_randomness_gen, len(new_points))):
+            weights += eq_table(new_point).vec() * coeff
+
+        # 1. Sumcheck rounds, on evals . weights (degree 2)
+        for _ in range(round.folding_factor):
+            fs.send_scalars_ext(_interpolate([e.dot(w) for e, w in zip(_lines(evals, 3), _lines(weights, 3))]))
+            randomness = fs.random_scalar()
+            evals, weights = _fold(evals, randomness), _fold(weights, randomness)
+            coefficients = coefficients[0::2] + coefficients[1::2] * randomness
+            fs.pow_grinding(round.folding_pow_bits)
+
+        # 2. Commit to the folded polynomial
+        folded_n_variables = round.n_variables - round.folding_factor
+        if r + 1 < len(params.rounds):
+            next_round = params.rounds[r + 1]
+            assert next_round.n_variables == folded_n_variables
+            next_leaves = _whir_leaves(coefficients.limbs, next_round.folding_factor, next_round.domain_size)
+        else:
+            assert folded_n_variables == 0  # folded until constant: a single leaf
+            next_leaves = coefficients.to_base_field().values[None]
+        next_tree = merkle_tree_levels(next_leaves)
+        fs.send_scalars_base(merkle_root(next_tree))
+
+        # 3, 4. Out-of-domain samples and answers
+        ood_points = [multilinear_point_from_univariate(z, folded_n_variables) for z in fs.random_scalars(round.ood_samples)]
+        polynomial = MultilinearCoeffs(coefficients)
+        for ood_point in ood_points:
+            fs.send_scalars_ext([polynomial.evaluate(ood_point)])
+
+        # 5. Shift queries, opened in the current tree
+        query_domain = round.domain_size - round.folding_factor
+        if params.merkle_multiproof:
+            indices = fs.random_indices(round.num_queries, query_domain)
+            for index in sorted(set(indices)):
+                fs.send_scalars_base(_to_base_list(leaves[index]))
+            fs.send_scalars_base(merkle_multiproof(tree, indices))
+        else:
+            indices = fs.random_indices(round.num_queries, query_domain) if fs.version >= 2 else []
+            for q in range(round.num_queries):
+                if fs.version == 1:
+                    indices.append(fs.random_index(query_domain))
+                fs.send_scalars_base(_to_base_list(leaves[indices[q]]))
+                fs.send_scalars_base(merkle_auth_path(tree, indices[q]))
+        generator = F.two_addic_generator(query_domain)
+        z_is = [multilinear_point_from_univariate(EF.from_base(generator ** index), folded_n_variables) for index in indices]
+
+        new_points = ood_points + z_is
+        leaves, tree = next_leaves, next_tree
+
+    fs.send_scalars_ext([coefficients[0]])
+
+
+def _zerocheck_prove(vk: VerifyingKey, fs: FiatShamirProver, columns: np.ndarray, batching_scalar: EF,
+                     challenges: List[EF]) -> Tuple[List[EF], List[EF], List[EF], List[EF]]:
+    # counterpart of sumcheck_verify_with_univariate_skip, on
+    #   sum_{x in {0, .., 2^skips - 1}, i} eq_skip(challenges[0], x).eq(challenges[1:], i).C(shifted columns at row x.block_size + i)
+    # returns (point, up evals, down evals, selector evals at point[0]) of every column
+    s = UNIVARIATE_SKIPS
+    n_columns, n_rows = columns.shape
+    block_size = n_rows >> s
+    up = columns.copy()
+    up[:, -1] = columns[:, -2]
+    down = np.concatenate([columns[:, 1:], columns[:, -1:]], axis=1)
+    shifted = np.concatenate([up, down]).reshape(2 * n_columns, 2 ** s, block_size).astype(np.uint64)
+    batching_powers = powers(batching_scalar, len(vk.constraints.outputs))
+    challenge_selector_evals = lagrange_selector_evals(challenges[0], s)
+    eq = eq_table(challenges[1:]).vec()
+
+    def batched_constraints(inputs: List[EFVec]) -> EFVec:
+        result = EFVec.zeros(len(inputs[0]))
+        for output, coeff in zip(vk.constraints.evaluate(inputs), batching_powers):
+            result += output * coeff
+        return result
+
+    # 1. the univariate skip: evaluations at x = 0, 1, ..., of degree < (max_constraint_degree + 1).2^skips
+    evals = []
+    for x in range((vk.max_constraint_degree + 1) * 2 ** s):
+        x_selector_evals = lagrange_selector_evals(EF.from_ints(x, 0, 0, 0), s)  # in the base field
+        columns_at_x = np.zeros((2 * n_columns, block_size), dtype=np.uint64)
+        for j, selector_eval in enumerate(x_selector_evals):
+            columns_at_x = (columns_at_x + shifted[:, j] * selector_eval.c0) % P
+        constraints = batched_constraints([_lift(c) for c in columns_at_x])
+        evals.append(dot_product(challenge_selector_evals, x_selector_evals) * eq.dot(constraints))
+    fs.send_scalars_ext(_interpolate(evals))
+    point = [fs.random_scalar()]
+    selector_evals = lagrange_selector_evals(point[0], s)
+    scale = dot_product(challenge_selector_evals, selector_evals)
+    tables = []
+    for c in range(2 * n_columns):
+        table = EFVec.zeros(block_size)
+        for j, selector_eval in enumerate(selector_evals):
+            table += _lift(shifted[c, j]) * selector_eval
+        tables.append(table)
+
+    # 2. the multilinear rounds (degree max_constraint_degree + 1)
+    n_points = vk.max_constraint_degree + 2
+    for _ in range(vk.log_n_rows - s):
+        table_lines = [_lines(table, n_points) for table in tables]
+        eq_lines = _lines(eq, n_points)
+        evals = [eq_lines[t].dot(batched_constraints([lines[t] for lines in table_lines])) * scale for t in range(n_points)]
+        fs.send_scalars_ext(_interpolate(evals))
+        point.append(fs.random_scalar())
+        tables = [_fold(table, point[-1]) for table in tables]
+        eq = _fold(eq, point[-1])
+    return point, [t[0] for t in tables[:n_columns]], [t[0] for t in tables[n_columns:]], selector_evals
+
+
+def _inner_sumcheck_prove(vk: VerifyingKey, fs: FiatShamirProver, witness: np.ndarray, zerocheck_point: List[EF],
+                          selector_evals: List[EF]) -> Tuple[List[EF], List[EF]]:
+    # counterpart of the inner sumcheck of piop_verify, on
+    #   sum_{j, b} S(j).(up_weights(j, b).c_up(b) + down_weights(j, b).c_down(b))
+    # with j the skipped variables of the row, b the row of the column, S(j) = L_j(zerocheck_point[0]),
+    # up_weights(j, b) = sum_i eq(zerocheck_point[1:], i).M_up(j.block_size + i, b) (same for down),
+    # and c_up, c_down the witness columns batched by the powers of the batching scalar.
+    # Returns (point, evaluation of each witness column at point[skips:])
+    s = UNIVARIATE_SKIPS
+    n_skip = 2 ** s
+    n_witness_columns, n_rows = witness.shape
+    block_size = n_rows >> s
+    batching_powers = powers(fs.random_scalar(), 2 * n_witness_columns)
+
+    eq = eq_table(zerocheck_point[1:]).vec()
+    up_weights = np.zeros((DEG, n_skip, n_rows), dtype=np.uint32)
+    down_weights = np.zeros((DEG, n_skip, n_rows), dtype=np.uint32)
+    for j in range(n_skip):
+        start = j * block_size
+        up_weights[:, j, start:start + block_size] = eq.limbs
+        end = min(start + block_size + 1, n_rows)
+        down_weights[:, j, start + 1:end] = eq.limbs[:, :end - start - 1]
+    # last row: M_up(n_rows - 1, n_rows - 2) = 1 instead of M_up(n_rows - 1, n_rows - 1), and M_down(n_rows - 1, n_rows - 1) = 1
+    last = eq[block_size - 1]
+    up_weights[:, -1, -1] = 0
+    up_weights[:, -1, -2] = (EF.from_ints(*up_weights[:, -1, -2].tolist()) + last).coords()
+    down_weights[:, -1, -1] = (EF.from_ints(*down_weights[:, -1, -1].tolist()) + last).coords()
+
+    # tables on index j + 2^skips.b
+    def interleaved(weights: np.ndarray) -> EFVec:
+        return EFVec(np.ascontiguousarray(weights.transpose(0, 2, 1)).reshape(DEG, -1))
+
+    def repeated(column: EFVec) -> EFVec:
+        return EFVec(np.repeat(column.limbs, n_skip, axis=1))
+
+    tables = [
+        EFVec(np.tile(EFVec.from_list(selector_evals).limbs, (1, n_rows))),
+        interleaved(up_weights),
+        interleaved(down_weights),
+        repeated(matrix_dot(witness.T, EFVec.from_list(batching_powers[:n_witness_columns]))),
+        repeated(matrix_dot(witness.T, EFVec.from_list(batching_powers[n_witness_columns:]))),
+    ]
+    point = []
+    for _ in range(vk.log_n_rows + s):
+        lines = [_lines(table, 4) for table in tables]
+        evals = [selector.dot(up * c_up + down * c_down) for selector, up, down, c_up, c_down in zip(*lines)]
+        fs.send_scalars_ext(_interpolate(evals))
+        point.append(fs.random_scalar())
+        tables = [_fold(table, point[-1]) for table in tables]
+    return point, matrix_dot(witness, eq_table(point[s:]).vec()).to_list()
+
+
+def _witness_matrix(vk: VerifyingKey, witness: Union[np.ndarray, List[List[F]]]) -> np.ndarray:
+    if not isinstance(witness, np.ndarray):
+        witness = np.array([[f.value for f in column] for column in witness], dtype=np.uint32)
+    assert witness.shape == (vk.n_witness_columns, 2 ** vk.log_n_rows)
+    return witness
+
+
+def _packed_witness(vk: VerifyingKey, witness: np.ndarray) -> np.ndarray:
+    # the witness columns, packed in a single multilinear polynomial: column u, row b at index u + 2^log_n_witness_columns.b
+    packed = np.zeros((2 ** vk.log_n_witness_columns(), 2 ** vk.log_n_rows), dtype=np.uint32)
+    packed[:vk.n_witness_columns] = witness
+    return packed.T.reshape(-1)
+
+
+def _piop_prove_table(vk: VerifyingKey, fs: FiatShamirProver, witness: np.ndarray) -> List[EF]:
+    # counterpart of _piop_verify_table, returns the point at which the packed witness is opened
+    constraints_batching_scalar = fs.random_scalar()
+    zerocheck_challenges = fs.random_scalars(vk.log_n_rows - UNIVARIATE_SKIPS + 1)
+    columns = np.concatenate([vk.preprocessed_columns, witness]).astype(np.uint32)
+    zerocheck_point, up, down, selector_evals = _zerocheck_prove(vk, fs, columns, constraints_batching_scalar, zerocheck_challenges)
+    n_preprocessed_columns = vk.n_columns - vk.n_witness_columns
+    fs.send_scalars_ext(up[n_preprocessed_columns:] + down[n_preprocessed_columns:])
+
+    inner_point, final_inner_claims = _inner_sumcheck_prove(vk, fs, witness, zerocheck_point, selector_evals)
+    fs.send_scalars_ext(final_inner_claims)
+
+    final_random_scalars = fs.random_scalars(vk.log_n_witness_columns())
+    return final_random_scalars + inner_point[UNIVARIATE_SKIPS:]
+
+
+def piop_prove(key: Union[AirTable, VerifyingKey], witness: Union[np.ndarray, List[List[F]]]) -> List[F]:
+    # witness: the n_witness_columns columns of the table (the preprocessed columns come first in the table)
+    vk = verifying_key(key)
+    witness = _witness_matrix(vk, witness)
+    fs = FiatShamirProver(vk.fiat_shamir_version)
+    whir_witness = whir_commit(vk.whir_params, fs, _packed_witness(vk, witness))
+    point = _piop_prove_table(vk, fs, witness)
+    whir_prove(vk.whir_params, fs, whir_witness, point)
+    return fs.transcript
+
+
+def piop_prove_multi(key: MultiVerifyingKey, witnesses: List[Union[np.ndarray, List[List[F]]]]) -> List[F]:
+    # counterpart of piop_verify_multi, one witness per table
+    assert len(witnesses) == len(key.tables)
+    witnesses = [_witness_matrix(vk, witness) for vk, witness in zip(key.tables, witnesses)]
+    fs = FiatShamirProver(key.fiat_shamir_version)
+    committed = np.zeros(2 ** key.n_variables(), dtype=np.uint32)
+    for vk, witness, offset in zip(key.tables, witnesses, key.offsets):
+        packed = _packed_witness(vk, witness)
+        committed[offset:offset + len(packed)] = packed
+    whir_witness = whir_commit(key.whir_params, fs, committed)
+    points = [key.claim_point(t, _piop_prove_table(vk, fs, witness)) for t, (vk, witness) in enumerate(zip(key.tables, witnesses))]
+    whir_prove(key.whir_params, fs, whir_witness, points)
+    return fs.transcript
@@ -0,0 +1,109 @@
+from typing import Callable, List, Optional, TypeVar
+import asyncio
+import concurrent.futures
+import contextvars
+import os
+import threading
+import numpy as np
+from finite_field import *
+from transcript import *
+from fiat_shamir import FiatShamirVerifier
+from polynomial import Evaluation
+from whir import WhirParams, whir_parse_commitment, whir_verify
+from piop import AirTable, VerifyingKey, piop_verify
+
+# Streaming verification: the transcript (in the binary format of transcript.py) is consumed from an asyncio stream
+# while it arrives. The verifier itself is unchanged: it runs in a worker thread, and each read blocks that thread
+# until the corresponding bytes have landed on the event loop. A failed check ends the verification immediately,
+# and nothing beyond the bytes needed so far is ever read from the stream. Cancelling the awaiting task fails the
+# pending read (and all later ones), so the worker thread stops too.
+# The workers come from a dedicated, bounded pool (so that stalled senders cannot exhaust the event loop's default
+# executor: extra verifications wait for a free worker), and a read that gets no data for read_timeout seconds
+# raises TimeoutError.
+
+T = TypeVar("T")
+
+STREAMING_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+READ_TIMEOUT = 30.0  # seconds
+_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _streaming_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(STREAMING_WORKERS, thread_name_prefix="streaming-verifier")
+        return _executor
+
+
+class StreamTranscriptReader(BaseTranscriptReader):
+    # Transcript reader over an asyncio.StreamReader, read() is called from a worker thread
+
+    def __init__(self, stream: asyncio.StreamReader, loop: asyncio.AbstractEventLoop, length: int, read_timeout: float = READ_TIMEOUT):
+        super().__init__(length)
+        self.stream = stream
+        self.loop = loop
+        self.read_timeout = read_timeout
+        self.lock = threading.Lock()
+        self.cancelled = False
+        self.pending: Optional[concurrent.futures.Future] = None
+
+    @staticmethod
+    async def start(stream: asyncio.StreamReader, read_timeout: float = READ_TIMEOUT) -> "StreamTranscriptReader":
+        header = await asyncio.wait_for(stream.readexactly(TRANSCRIPT_HEADER_SIZE), read_timeout)
+        return StreamTranscriptReader(stream, asyncio.get_running_loop(), decode_header(header), read_timeout)
+
+    def read(self, n: int) -> np.ndarray:
+        assert self.cursor + n <= self.length
+        with self.lock:
+            if self.cancelled:
+                raise concurrent.futures.CancelledError()
+            self.pending = asyncio.run_coroutine_threadsafe(self.stream.readexactly(4 * n), self.loop)
+        try:
+            data = self.pending.result(self.read_timeout)  # raises CancelledError once cancel() is called
+        except concurrent.futures.TimeoutError:
+            self.cancel()
+            raise TimeoutError(f"no transcript data for {self.read_timeout}s (at element {self.cursor})")
+        values = decode_elements(data, n)
+        self.cursor += n
+        return values
+
+    def cancel(self):
+        # called from the event loop
+        with self.lock:
+            self.cancelled = True
+            if self.pending is not None:
+                self.pending.cancel()
+
+
+async def _run_streaming(stream: asyncio.StreamReader, verify: Callable[[StreamTranscriptReader], T],
+                         read_timeout: float = READ_TIMEOUT) -> T:
+    transcript = await StreamTranscriptReader.start(stream, read_timeout)
+    context = contextvars.copy_context()  # e.g. the backend selected with use_backend
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_streaming_executor(), context.run, verify, transcript)
+    except asyncio.CancelledError:
+        transcript.cancel()
+        raise
+
+
+async def piop_verify_async(key: Union[AirTable, VerifyingKey], stream: asyncio.StreamReader, read_timeout: float = READ_TIMEOUT):
+    return await _run_streaming(stream, lambda transcript: piop_verify(key, transcript), read_timeout)
+
+
+async def whir_verify_async(params: WhirParams, stream: asyncio.StreamReader, eval: Evaluation, fiat_shamir_version: int = 1,
+                            read_timeout: float = READ_TIMEOUT):
+    def verify(transcript: StreamTranscriptReader):
+        fs = FiatShamirVerifier(transcript, fiat_shamir_version)
+        commitment = whir_parse_commitment(params, fs)
+        whir_verify(params, fs, commitment, eval)
+    return await _run_streaming(stream, verify, read_timeout)
+
+
+async def feed_stream(stream: asyncio.StreamReader, data: bytes, chunk_size: int = 4096, delay: float = 0):
+    # In-memory stand-in for a socket: feeds data to stream by chunks
+    for i in range(0, len(data), chunk_size):
+        stream.feed_data(data[i:i + chunk_size])
+        await asyncio.sleep(delay)
+    stream.feed_eof()
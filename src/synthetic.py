@@ -0,0 +1,74 @@
+from typing import List, Optional, Tuple
+import numpy as np
+from finite_field import *
+from polynomial import *
+from whir import RoundParams, WhirParams
+from piop import AirTable, UNIVARIATE_SKIPS
+
+# Synthetic tables and parameters, with a valid witness, to test and benchmark the verifier (see prover.py)
+
+
+def synthetic_whir_params(n_variables: int, folding_factor: int = 4, num_queries: int = 16, log_inv_rate: int = 1,
+                          ood_samples: int = 1, pow_bits: int = 0, merkle_multiproof: bool = False) -> WhirParams:
+    # folds until the polynomial is constant, halving the evaluation domain at each round
+    rounds = []
+    n, domain_size = n_variables, n_variables + log_inv_rate
+    while n > 0:
+        k = min(folding_factor, n)
+        rounds.append(RoundParams(
+            n_variables=n,
+            domain_size=domain_size,
+            folding_factor=k,
+            ood_samples=ood_samples if n > k else 0,
+            num_queries=min(num_queries, 2 ** (domain_size - k)),
+            combination_pow_bits=pow_bits,
+            folding_pow_bits=pow_bits,
+        ))
+        n -= k
+        domain_size -= 1
+    assert rounds[0].domain_size - rounds[0].folding_factor <= TWO_ADICITY
+    return WhirParams(ood_samples, rounds, merkle_multiproof)
+
+
+def synthetic_air_table(log_n_rows: int, n_witness_columns: int, n_preprocessed_columns: int = 1, constraint_degree: int = 2,
+                        whir_params: Optional[WhirParams] = None, seed: int = 0) -> Tuple[AirTable, np.ndarray]:
+    # Returns the table and a valid witness (n_witness_columns, 2^log_n_rows). With p the preprocessed columns, w the witness columns:
+    #   w_0[r + 1] = w_0[r] + p_0[r]                                 (1 if no preprocessed column)
+    #   w_k[r] = w_{k-1}[r]^(constraint_degree - 1).p_{(k-1) % n_preprocessed_columns}[r]   (w_{k-1}[r]^constraint_degree if none)
+    assert log_n_rows >= UNIVARIATE_SKIPS and n_witness_columns >= 1 and constraint_degree >= 1
+    rng = np.random.default_rng(seed)
+    n_rows = 2 ** log_n_rows
+    n_columns = n_preprocessed_columns + n_witness_columns
+    preprocessed = rng.integers(0, P, (n_preprocessed_columns, n_rows), dtype=np.uint64)
+
+    def up(c: int) -> ArithmeticCircuit: return ArithmeticCircuit.var(c)
+    def down(c: int) -> ArithmeticCircuit: return ArithmeticCircuit.var(n_columns + c)
+
+    witness = np.zeros((n_witness_columns, n_rows), dtype=np.uint64)
+    w = n_preprocessed_columns  # column of w_0
+    increments = preprocessed[0] if n_preprocessed_columns > 0 else np.ones(n_rows, dtype=np.uint64)
+    witness[0] = np.concatenate([[rng.integers(0, P)], np.cumsum(increments[:-1] % P) % P]).astype(np.uint64)
+    witness[0, 1:] = (witness[0, 1:] + witness[0, 0]) % P
+    increment = up(0) if n_preprocessed_columns > 0 else ArithmeticCircuit.const(F(1))
+    constraints = [down(w) - up(w) - increment]
+    for k in range(1, n_witness_columns):
+        if n_preprocessed_columns > 0:
+            p = (k - 1) % n_preprocessed_columns
+            values, term, exponent = preprocessed[p], up(p), constraint_degree - 1
+        else:
+            values, term, exponent = witness[k - 1], up(w + k - 1), constraint_degree - 1
+        for _ in range(exponent):
+            values = values * witness[k - 1] % P
+            term = term * up(w + k - 1)
+        witness[k] = values
+        constraints.append(up(w + k) - term)
+
+    table = AirTable()
+    table.n_columns = n_columns
+    table.log_n_rows = log_n_rows
+    table.constraints = constraints
+    table.max_constraint_degree = constraint_degree
+    table.preprocessed_columns = [[F(v) for v in column] for column in preprocessed.tolist()]
+    table.univariate_selectors = univariate_selectors(UNIVARIATE_SKIPS)
+    table.whir_params = whir_params or synthetic_whir_params(log_n_rows + table.log_n_witness_columns())
+    return table, witness.astype(np.uint32)
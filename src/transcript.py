@@ -0,0 +1,112 @@
+from abc import ABC, abstractmethod
+from typing import List, Optional, Union
+import mmap
+import struct
+import numpy as np
+from finite_field import *
+
+# Binary transcript format:
+#   header: magic (4 bytes) | version (u32) | number of elements (u64), little-endian
+#   body:   the elements, as little-endian u32 in canonical form (< P)
+# The header is 16 bytes, so the body stays 4-byte aligned when the file is memory-mapped.
+TRANSCRIPT_MAGIC = b"SSNK"
+TRANSCRIPT_VERSION = 1
+_HEADER = struct.Struct("<4sIQ")
+_ELEMENT = np.dtype("<u4")
+TRANSCRIPT_HEADER_SIZE = _HEADER.size
+
+
+def encode_transcript(elements: List[F]) -> bytes:
+    body = np.array([f.value for f in elements], dtype=_ELEMENT)
+    return _HEADER.pack(TRANSCRIPT_MAGIC, TRANSCRIPT_VERSION, len(body)) + body.tobytes()
+
+
+def decode_header(header: bytes) -> int:
+    # returns the number of elements
+    magic, version, length = _HEADER.unpack_from(header, 0)
+    assert magic == TRANSCRIPT_MAGIC
+    assert version == TRANSCRIPT_VERSION
+    return length
+
+
+def decode_elements(data: Union[bytes, bytearray, memoryview, mmap.mmap], count: int, offset: int = 0) -> np.ndarray:
+    # zero-copy view on count encoded elements
+    elements = np.frombuffer(data, dtype=_ELEMENT, count=count, offset=offset)
+    assert np.all(elements < P)  # canonical encoding
+    return elements
+
+
+def write_transcript(path: str, elements: List[F]) -> None:
+    with open(path, "wb") as f:
+        f.write(encode_transcript(elements))
+
+
+class BaseTranscriptReader(ABC):
+    # Cursor over the elements of a transcript, wherever they come from: read(n) returns the next n elements
+
+    def __init__(self, length: int):
+        self.length = length
+        self.cursor = 0
+
+    def __len__(self) -> int:
+        return self.length
+
+    def remaining(self) -> int:
+        return self.length - self.cursor
+
+    @abstractmethod
+    def read(self, n: int) -> np.ndarray: ...
+
+    def close(self):
+        pass
+
+    def __enter__(self) -> "BaseTranscriptReader":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TranscriptReader(BaseTranscriptReader):
+    # Cursor over an encoded transcript. read(n) returns a zero-copy view on the underlying buffer
+    # (bytes, bytearray, memoryview or mmap), that FVec / EFVec can wrap directly.
+
+    def __init__(self, buffer: Union[bytes, bytearray, memoryview, mmap.mmap]):
+        length = decode_header(buffer)
+        assert len(buffer) == TRANSCRIPT_HEADER_SIZE + 4 * length
+        super().__init__(length)
+        self.buffer = buffer
+        self.elements = decode_elements(buffer, length, TRANSCRIPT_HEADER_SIZE)
+        self.mapping: Optional[mmap.mmap] = None  # owned by the reader, when created by open()
+
+    @staticmethod
+    def from_elements(elements: List[F]) -> "TranscriptReader":
+        return TranscriptReader(encode_transcript(elements))
+
+    @staticmethod
+    def open(path: str) -> "TranscriptReader":
+        # the file is memory-mapped (the file handle itself is closed right away), and the mapping is released by
+        # close(), e.g. with: with TranscriptReader.open(path) as transcript: ...
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        reader = TranscriptReader(buffer)
+        reader.mapping = buffer
+        return reader
+
+    def read(self, n: int) -> np.ndarray:
+        assert self.cursor + n <= self.length
+        view = self.elements[self.cursor:self.cursor + n]
+        self.cursor += n
+        return view
+
+    def close(self):
+        # views returned by read() must not be used afterwards. If some are still alive (e.g. referenced by the traceback
+        # of a failed verification), the mapping cannot be closed yet: it is then released along with the last of them.
+        if self.mapping is None:
+            return
+        self.buffer = self.elements = None
+        try:
+            self.mapping.close()
+        except BufferError:
+            pass
+        self.mapping = None
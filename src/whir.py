@@ -1,11 +1,13 @@
-from typing import List, Tuple
+from typing import List, Optional, Tuple, Union
 from dataclasses import dataclass
 
 from fiat_shamir import FiatShamirVerifier
 from finite_field import F
 from polynomial import *
-from merkle_tree import verify_merkle_path
+from merkle_tree import *
 from poseidon2 import *
+from checks import *
+from profiling import phase
 
 
 @dataclass
@@ -23,6 +25,7 @@ class RoundParams:
 class WhirParams:
     initial_ood_samples: int
     rounds: List[RoundParams]
+    merkle_multiproof: bool = False  # one compact multiproof per round, instead of one authentication path per query
 
 
 @dataclass
@@ -32,79 +35,118 @@ class ParsedCommitment:
     ood_answers: List[EF]
 
 
+def whir_query_tables(params: WhirParams) -> List[FixedBaseTable]:
+    # exponentiation table for the generator of the query domain of each round (can be computed in advance)
+    return [two_adic_generator_table(round.domain_size - round.folding_factor) for round in params.rounds]
+
+
 def whir_parse_commitment(params: WhirParams, fs: FiatShamirVerifier) -> ParsedCommitment:
     merkle_root = fs.receive_scalars_base(DIGEST_LEN)
-    ood_points = [multilinear_point_from_univariate(fs.random_scalar()) for _ in params.initial_ood_samples]
-    ood_answers = [fs.receive_scalars_ext(1)[0] for _ in params.initial_ood_samples]
+    n_variables = params.rounds[0].n_variables
+    ood_points = [multilinear_point_from_univariate(z, n_variables) for z in fs.random_scalars(params.initial_ood_samples)]
+    ood_answers = [fs.receive_scalars_ext(1)[0] for _ in range(params.initial_ood_samples)]
     return ParsedCommitment(merkle_root, ood_points, ood_answers)
 
 
-def whir_verify(params: WhirParams, fs: FiatShamirVerifier, commitment: ParsedCommitment, eval: Evaluation):
-    assert len(eval.point) == params.rounds[0].n_variables
-    evaluation_points = [commitment.ood_points + [eval.point]]
+def whir_verify(params: WhirParams, fs: FiatShamirVerifier, commitment: ParsedCommitment, eval: Union[Evaluation, List[Evaluation]],
+                query_tables: Optional[List[FixedBaseTable]] = None, checks: Optional[EqualityChecks] = None):
+    # several evaluations are batched with the out-of-domain answers, by the first combination randomness
+    checks = checks if checks is not None else EqualityChecks()
+    evals = eval if isinstance(eval, list) else [eval]
+    assert all(len(e.point) == params.rounds[0].n_variables for e in evals)
+    if query_tables is None:
+        query_tables = whir_query_tables(params)
+    evaluation_points = [commitment.ood_points + [e.point for e in evals]]
     combination_randomness = []
-    expected_evals = commitment.ood_answers + [eval.value]
+    expected_evals = commitment.ood_answers + [e.value for e in evals]
     merkle_root = commitment.merkle_root
     expected_sumcheck_output = EF.zero()
     all_folding_randomness = []
 
-    for round in params.rounds:
-
-        # 0. Combination randomness
-        fs.pow_grinding(round.combination_pow_bits)
-        combination_randomness_gen = fs.random_scalar()
-        expected_sumcheck_output += [r * combination_randomness_gen ** i for i, r in enumerate(expected_evals)]
-        folding_randomness = []
-
-        # 1. Sumcheck rounds
-        for _ in range(round.folding_factor):
-            sumcheck_poly = UnivariatePolynomial(fs.receive_scalars_ext(3))
-            assert sumcheck_poly.evaluate(EF.zero()) + sumcheck_poly.evaluate(EF.one()) == expected_sumcheck_output
-            randomness = fs.random_scalar()
-            expected_sumcheck_output = sumcheck_poly.evaluate(randomness)
-            folding_randomness.append(randomness)
-            fs.pow_grinding(round.folding_pow_bits)
-
-        # 2. Receive folded function
-        folded_merkle_root = fs.receive_scalars_base(DIGEST_LEN)
-
-        # 3. Out-of-domain sample
-        ood_points = [multilinear_point_from_univariate(fs.random_scalar()) for _ in round.ood_samples]
-
-        # 4. Out-of-domain answers
-        ood_answers = [fs.receive_scalars_ext(1)[0] for _ in round.ood_samples]
-
-        # 5. Shift queries
-        query_domain = round.domain_size - round.folding_factor
-        group_gen = EF.from_base(F.two_addic_generator(query_domain))
-        z_is = []
-        folded_evals = []
-        for _ in range(round.num_queries):
-            index = fs.random_index(query_domain)
-            z_i = group_gen ** index
-            leaf: Union[List[F], List[EF]] = fs.receive_scalars_base(
-                2 ** round.folding_factor) if round == 0 else fs.receive_scalars_ext(2 ** round.folding_factor)
-            auth_path = fs.receive_scalars_base(query_domain * DIGEST_LEN)
-            verify_merkle_path(merkle_root, index, leaf, auth_path, query_domain)
-            folded_eval = MultilinearCoeffs(list_to_ext_field(leaf)).evaluate(folding_randomness)
-            z_is.append(multilinear_point_from_univariate(z_i))
-            folded_evals.append(folded_eval)
-
-        merkle_root = folded_merkle_root
-        expected_evals = ood_answers + folded_evals
-        all_folding_randomness += folding_randomness
-        evaluation_points.append(ood_points + z_is)
-        combination_randomness.append(combination_randomness_gen)
+    for r, round in enumerate(params.rounds):
+        with phase(f"whir round {r}"):
+            # 0. Combination randomness
+            fs.pow_grinding(round.combination_pow_bits)
+            combination_randomness_gen = fs.random_scalar()
+            for expected_eval, coeff in zip(expected_evals, powers(combination_randomness_gen, len(expected_evals))):
+                expected_sumcheck_output += expected_eval * coeff
+            folding_randomness = []
+
+            # 1. Sumcheck rounds
+            for _ in range(round.folding_factor):
+                sumcheck_poly = UnivariatePolynomial(fs.receive_scalars_ext(3))
+                checks.check(sumcheck_poly.evaluate_zero_plus_one(), expected_sumcheck_output, f"whir round {r} sumcheck")
+                randomness = fs.random_scalar()
+                expected_sumcheck_output = sumcheck_poly.evaluate(randomness)
+                folding_randomness.append(randomness)
+                fs.pow_grinding(round.folding_pow_bits)
+
+            # 2. Receive folded function
+            folded_merkle_root = fs.receive_scalars_base(DIGEST_LEN)
+
+            # 3. Out-of-domain sample
+            folded_n_variables = round.n_variables - round.folding_factor
+            ood_points = [multilinear_point_from_univariate(z, folded_n_variables) for z in fs.random_scalars(round.ood_samples)]
+
+            # 4. Out-of-domain answers
+            ood_answers = [fs.receive_scalars_ext(1)[0] for _ in range(round.ood_samples)]
+
+            # 5. Shift queries
+            query_domain = round.domain_size - round.folding_factor
+            leaf_size = 2 ** round.folding_factor
+            def receive_leaf() -> Union[FVec, EFVec]:
+                # zero-copy views on the transcript. The committed polynomial has base field coefficients, so the leaves of
+                # the first tree hold 2^folding_factor base field elements (lifted to EF when folded), and those of the
+                # folded trees hold extension field elements. (The original spec tested `round == 0` on the WhirRound
+                # itself, which never held, and read every leaf as extension field elements.)
+                return fs.receive_scalars_base_vec(leaf_size) if r == 0 else fs.receive_scalars_ext(leaf_size)
+
+            if params.merkle_multiproof:
+                indices = fs.random_indices(round.num_queries, query_domain)
+                unique_indices = sorted(set(indices))
+                unique_leaves = [receive_leaf() for _ in unique_indices]
+                proof = fs.receive_scalars_base_vec(merkle_multiproof_size(unique_indices, query_domain) * DIGEST_LEN).values
+                verify_merkle_multiproof(merkle_root, unique_indices, unique_leaves, proof, query_domain)
+                leaf_of = dict(zip(unique_indices, unique_leaves))
+                leaves = [leaf_of[index] for index in indices]
+            else:
+                # version 1 draws each index right before its opening, later versions draw them all at once
+                indices = fs.random_indices(round.num_queries, query_domain) if fs.version >= 2 else []
+                leaves, auth_paths = [], []
+                for _ in range(round.num_queries):
+                    if fs.version == 1:
+                        indices.append(fs.random_index(query_domain))
+                    leaves.append(receive_leaf())
+                    auth_paths.append(fs.receive_scalars_base_vec(query_domain * DIGEST_LEN).values)  # one digest per DIGEST_LEN values
+                verify_merkle_paths(merkle_root, indices, leaves, auth_paths, query_domain)  # all the queries in lockstep
+
+            z_is = [multilinear_point_from_univariate(EF.from_base(query_tables[r].pow(index)), folded_n_variables) for index in indices]
+            folded_evals = multilinear_coeffs_evaluate_batch(leaves, folding_randomness)  # all the leaves at once
+
+            merkle_root = folded_merkle_root
+            expected_evals = ood_answers + folded_evals
+            all_folding_randomness += folding_randomness
+            evaluation_points.append(ood_points + z_is)
+            combination_randomness.append(combination_randomness_gen)
 
     # For simplicity, we do not use the trick of sending the polynomial earlier
     # We assume that it is folded until it becomes constant
 
-    claimed_constant_poly = fs.receive_scalars_ext(1)[0]
-    verify_merkle_path(merkle_root, 0, [claimed_constant_poly], [], 0)
+    with phase("whir final"):
+        claimed_constant_poly = fs.receive_scalars_ext(1)[0]
+        verify_merkle_path(merkle_root, 0, [claimed_constant_poly], [], 0)
+
+        # the constraints of the last round apply directly to the constant polynomial
+        for expected_eval in expected_evals:
+            checks.check(expected_eval, claimed_constant_poly, "whir final evaluations")
 
-    expected_constant_poly = EF.zero()
-    for eval_points, combination_randomness_gen in zip(evaluation_points, combination_randomness):
-        for i, eval_point in enumerate(eval_points):
-            expected_constant_poly += eq_extension(eval_point, all_folding_randomness[-len(eval_point):]) * combination_randomness_gen ** i
+        # the weight polynomial of the sumcheck, at the folding randomness
+        # (the points of the last round, at the end of evaluation_points, are not part of it)
+        final_weight = EF.zero()
+        for eval_points, combination_randomness_gen in zip(evaluation_points, combination_randomness):
+            if len(eval_points) == 0:
+                continue
+            eqs = eq_extension_batch(eval_points, all_folding_randomness[-len(eval_points[0]):])
+            final_weight += eqs.dot(EFVec.from_list(powers(combination_randomness_gen, len(eval_points))))
 
-    assert expected_constant_poly == claimed_constant_poly
+        checks.check(expected_sumcheck_output, claimed_constant_poly * final_weight, "whir final constant")
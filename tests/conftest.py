@@ -0,0 +1,29 @@
+import functools
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from synthetic import synthetic_air_table, synthetic_whir_params
+from prover import piop_prove
+from piop import VerifyingKey
+
+
+@functools.lru_cache(maxsize=None)
+def _proof(log_n_rows: int, folding_factor: int, merkle_multiproof: bool, fiat_shamir_version: int, pow_bits: int):
+    table, witness = synthetic_air_table(log_n_rows, 3, 1, 2)
+    table.whir_params = synthetic_whir_params(log_n_rows + table.log_n_witness_columns(), folding_factor, 8,
+                                              merkle_multiproof=merkle_multiproof, pow_bits=pow_bits)
+    vk = VerifyingKey.build(table, fiat_shamir_version=fiat_shamir_version)
+    return vk, piop_prove(vk, witness)
+
+
+@pytest.fixture
+def proof():
+    # (verifying key, transcript as a list of field elements) of a synthetic table, shared across tests
+    def make(log_n_rows: int = 4, folding_factor: int = 2, merkle_multiproof: bool = False, fiat_shamir_version: int = 1,
+             pow_bits: int = 0):
+        vk, transcript = _proof(log_n_rows, folding_factor, merkle_multiproof, fiat_shamir_version, pow_bits)
+        return vk, list(transcript)
+    return make
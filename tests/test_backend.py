@@ -0,0 +1,68 @@
+import asyncio
+import threading
+import numpy as np
+import pytest
+from finite_field import EF, F, P, DEG, batch_inverse
+from finite_field_vec import EFVec, FVec, matrix_dot
+from backend import available_backends, current_backend, use_backend
+from differential import compare_backends
+from streaming import _run_streaming, feed_stream
+from transcript import encode_transcript
+
+
+def test_backends_agree(proof):
+    vk, transcript = proof()
+    assert [r.ok for r in compare_backends(vk, [transcript])] == [True]
+
+
+def test_batch_inverse():
+    elements = [EF.from_ints(i, 2 * i, 3, i * i) for i in range(1, 6)]
+    for backend in ["python", "numpy"]:
+        with use_backend(backend):
+            assert all(e * inv == EF.one() for e, inv in zip(elements, batch_inverse(elements)))
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_vector_kernels(backend):
+    rng = np.random.default_rng(0)
+    base = FVec(rng.integers(P - 3, P, 6, dtype=np.uint32))
+    ext = EFVec(rng.integers(0, P, (DEG, 6), dtype=np.uint32))
+    other = EFVec(np.full((DEG, 6), P - 1, dtype=np.uint32))
+    rows = rng.integers(0, P, (3, 6), dtype=np.uint32)
+    x = EF.from_ints(P - 1, 2, P - 2, 3)
+    with use_backend(backend):
+        assert (base * F(P - 2)).to_list() == [b * F(P - 2) for b in base.to_list()]
+        assert (ext * base).to_list() == [e.mul_base(b) for e, b in zip(ext.to_list(), base.to_list())]
+        assert (ext * other).to_list() == [a * b for a, b in zip(ext.to_list(), other.to_list())]
+        assert (ext * x).to_list() == [e * x for e in ext.to_list()]
+        expected = [sum((w.mul_base(F(int(m))) for m, w in zip(row, ext.to_list())), EF.zero()) for row in rows]
+        assert matrix_dot(rows, ext).to_list() == expected
+
+
+def test_gmpy2():
+    pytest.importorskip("gmpy2")
+    assert "gmpy2" in available_backends()
+    with use_backend("gmpy2"):
+        assert F(3).inverse() * F(3) == F.one()
+
+
+def test_selection_is_context_local():
+    default = current_backend()
+    seen = []
+    with use_backend("python" if default != "python" else "numpy"):
+        thread = threading.Thread(target=lambda: seen.append(current_backend()))
+        thread.start()
+        thread.join()
+    assert seen == [default] and current_backend() == default
+
+
+def test_selection_follows_the_streaming_worker():
+    async def run():
+        stream = asyncio.StreamReader()
+        feeder = asyncio.ensure_future(feed_stream(stream, encode_transcript([])))
+        with use_backend("python"):
+            backend = await _run_streaming(stream, lambda transcript: current_backend())
+        await feeder
+        return backend
+
+    assert asyncio.run(run()) == "python"
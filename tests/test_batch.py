@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import pytest
+from batch import verify_batch, verify_one
+from streaming import feed_stream, piop_verify_async, _run_streaming
+from transcript import TranscriptReader, encode_transcript, write_transcript
+from finite_field import F
+from piop import piop_verify
+
+
+def test_verify_batch(proof):
+    vk, transcript = proof()
+    bad = list(transcript)
+    bad[len(bad) // 2] = bad[len(bad) // 2] + F(1)
+    transcripts = [transcript, bad, transcript]
+    for deferred in [False, True]:
+        for workers in [1, 2]:
+            results = verify_batch(vk, transcripts, workers=workers, deferred=deferred)
+            assert [r.ok for r in results] == [True, False, True]
+            assert results[1].failed_check is not None
+    assert verify_one(vk, encode_transcript(transcript)).ok
+
+
+def test_transcript_files(proof, tmp_path):
+    vk, transcript = proof()
+    path = str(tmp_path / "proof")
+    write_transcript(path, transcript)
+    assert [r.ok for r in verify_batch(vk, [path, path], workers=1)] == [True, True]
+    with TranscriptReader.open(path) as reader:
+        mapping = reader.mapping
+        piop_verify(vk, reader)
+    assert mapping.closed
+
+
+def test_piop_verify_async(proof):
+    vk, transcript = proof()
+    data = encode_transcript(transcript)
+
+    async def run():
+        stream = asyncio.StreamReader()
+        feeder = asyncio.ensure_future(feed_stream(stream, data, chunk_size=256))
+        await piop_verify_async(vk, stream)
+        await feeder
+
+    asyncio.run(run())
+
+
+def test_cancelling_stops_the_streaming_worker(proof):
+    vk, transcript = proof()
+    data = encode_transcript(transcript)
+    worker_done = threading.Event()
+
+    def verify(reader):
+        try:
+            reader.read(1)
+            reader.read(len(reader) - 1)  # never fully sent
+        finally:
+            worker_done.set()
+
+    async def run():
+        stream = asyncio.StreamReader()
+        stream.feed_data(data[:len(data) // 2])
+        task = asyncio.ensure_future(_run_streaming(stream, verify))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert worker_done.wait(5)  # before the loop closes (which would cancel the pending read anyway)
+
+    asyncio.run(run())
+
+
+def test_stalled_stream_times_out(proof):
+    vk, transcript = proof()
+    data = encode_transcript(transcript)
+
+    async def run():
+        stream = asyncio.StreamReader()
+        stream.feed_data(data[:len(data) // 2])  # then nothing
+        with pytest.raises(TimeoutError):
+            await piop_verify_async(vk, stream, read_timeout=0.2)
+        stalled_header = asyncio.StreamReader()
+        stalled_header.feed_data(data[:4])
+        with pytest.raises(TimeoutError):
+            await piop_verify_async(vk, stalled_header, read_timeout=0.2)
+        # the workers come from the dedicated pool, not the loop's default executor
+        empty = asyncio.StreamReader()
+        empty.feed_data(encode_transcript([]))
+        worker = await _run_streaming(empty, lambda reader: threading.current_thread().name)
+        assert worker.startswith("streaming-verifier")
+
+    asyncio.run(run())
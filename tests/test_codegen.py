@@ -0,0 +1,55 @@
+import traceback
+import pytest
+from finite_field import F
+from codegen import piop_verify_specialized, specialized_verifier
+from checks import DeferredEqualityChecks
+from differential import _recorded_challenges
+from piop import piop_verify
+
+
+def trace(verify, vk, transcript):
+    # the challenges and the equality claims of a verification, and whether it raised
+    checks = DeferredEqualityChecks()
+    with _recorded_challenges() as challenges:
+        try:
+            verify(vk, transcript, checks)
+            error = None
+        except AssertionError as e:
+            error = str(e)
+    return challenges, [(a, b, name) for a, b, name in checks.claims], error
+
+
+@pytest.mark.parametrize("fiat_shamir_version", [1, 2])
+@pytest.mark.parametrize("merkle_multiproof", [False, True])
+def test_specialized_round_trip(proof, fiat_shamir_version, merkle_multiproof):
+    vk, transcript = proof(fiat_shamir_version=fiat_shamir_version, merkle_multiproof=merkle_multiproof, pow_bits=2)
+    piop_verify_specialized(vk, transcript)
+    bad = list(transcript)
+    bad[len(bad) // 2] = bad[len(bad) // 2] + F(1)
+    with pytest.raises(AssertionError):
+        piop_verify_specialized(vk, bad)
+
+
+@pytest.mark.parametrize("fiat_shamir_version", [1, 2])
+@pytest.mark.parametrize("merkle_multiproof", [False, True])
+def test_specialized_matches_piop_verify(proof, fiat_shamir_version, merkle_multiproof):
+    vk, transcript = proof(fiat_shamir_version=fiat_shamir_version, merkle_multiproof=merkle_multiproof, pow_bits=2)
+    for index in [None, 10, len(transcript) // 3, len(transcript) // 2, len(transcript) - 1]:
+        t = list(transcript)
+        if index is not None:
+            t[index] = t[index] + F(1)
+        reference = trace(piop_verify, vk, t)
+        assert trace(piop_verify_specialized, vk, t) == reference
+        _, claims, error = reference
+        assert (error is not None or any(a != b for a, b, _ in claims)) == (index is not None)
+
+
+def test_traceback_shows_generated_source(proof):
+    vk, transcript = proof()
+    bad = list(transcript)
+    bad[0] = bad[0] + F(1)
+    with pytest.raises(AssertionError) as error:
+        piop_verify_specialized(vk, bad)
+    filename = specialized_verifier(vk).verify.__code__.co_filename
+    frames = [frame for frame in traceback.extract_tb(error.tb) if frame.filename == filename]
+    assert frames and all(frame.line for frame in frames)
@@ -0,0 +1,86 @@
+import random
+import numpy as np
+import pytest
+from finite_field import (EF, F, P, TWO_ADIC_GENERATOR, TWO_ADICITY, FixedBaseTable, list_to_base_field, list_to_ext_field,
+                          two_adic_generator_table)
+from finite_field_vec import EFVec, FVec, matrix_dot
+from polynomial import UnivariatePolynomial
+
+
+def random_ef(rng):
+    return EF.from_ints(*[rng.randrange(P) for _ in range(4)])
+
+
+def test_univariate_evaluate_on_limbs():
+    rng = random.Random(0)
+    x = random_ef(rng)
+    for n in [0, 1, 3, 8]:
+        coefficients = [random_ef(rng) for _ in range(n)]
+        assert UnivariatePolynomial(EFVec.from_list(coefficients)).evaluate(x) == UnivariatePolynomial(coefficients).evaluate(x)
+
+
+def test_ext_field_conversions_accept_vectors():
+    base = [F(i * 7 + 1) for i in range(8)]
+    ext = list_to_ext_field(FVec.from_list(base))
+    assert isinstance(ext, EFVec) and ext.to_list() == list_to_ext_field(base)
+    assert list_to_base_field(ext) == FVec.from_list(base)
+
+
+def test_ef_value_is_read_only():
+    e = EF.from_ints(1, 2, 3, 4)
+    with pytest.raises(TypeError):
+        e.value[0] = F(5)
+    assert e.value == (F(1), F(2), F(3), F(4))
+
+
+def test_comparisons_with_ints():
+    assert EF.zero() == 0 and EF.one() == 1 and EF.from_ints(P + 2, 0, 0, 0) == 2
+    assert EF.from_ints(0, 1, 0, 0) != 0 and EF.one() != 2
+    assert F(3) == 3 and F(3) == P + 3 and F(3) != 4
+    assert EF.from_base(F(3)) == F(3) and F(3) == EF.from_base(F(3))
+    assert EF.one() != "1"
+
+
+def naive_pow(base, exponent):
+    result = type(base).one()
+    for _ in range(exponent):
+        result = result * base
+    return result
+
+
+@pytest.mark.parametrize("max_bits, window", [(1, 8), (7, 3), (12, 4), (12, 8), (31, 8)])
+def test_fixed_base_table(max_bits, window):
+    rng = random.Random(max_bits)
+    for base in [F(rng.randrange(P)), random_ef(rng)]:
+        table = FixedBaseTable(base, max_bits, window)
+        exponents = [0, 1, 2 ** max_bits - 1] + [rng.randrange(2 ** max_bits) for _ in range(5)]
+        for e in exponents:
+            assert table.pow(e) == base ** e
+            if e < 300:
+                assert table.pow(e) == naive_pow(base, e)
+        with pytest.raises(AssertionError):
+            table.pow(2 ** max_bits)
+
+
+@pytest.mark.parametrize("bits", [0, 1, 5, TWO_ADICITY])
+def test_two_adic_generator_table(bits):
+    table = two_adic_generator_table(bits)
+    generator = F(pow(TWO_ADIC_GENERATOR, 2 ** (TWO_ADICITY - bits), P))
+    for index in [0, 1, 2 ** bits - 1, 2 ** bits // 3]:
+        assert table.pow(index) == F(pow(generator.value, index, P))
+    assert generator ** (2 ** bits) == F(1)
+    if bits > 0:
+        assert generator ** (2 ** (bits - 1)) == F(P - 1)  # order exactly 2^bits
+
+
+@pytest.mark.parametrize("n", [1, 5, 2 ** 16 + 3])
+def test_matrix_dot_near_p(n):
+    # entries and weights close to P: every partial product is near the 64-bit limit of the 16-bit split,
+    # and n > 2^16 crosses an accumulation chunk
+    rng = np.random.default_rng(n)
+    rows = rng.integers(P - 8, P, size=(2, n), dtype=np.uint32)
+    rows[0] = P - 1
+    weights = rng.integers(P - 8, P, size=(4, n), dtype=np.uint32)
+    weights[:, :3] = [[P - 1], [0xFFFF], [1 << 16], [P - 1]]
+    expected = [[sum(m * w for m, w in zip(row, column)) % P for column in weights.tolist()] for row in rows.tolist()]
+    assert matrix_dot(rows, EFVec(weights)).limbs.T.tolist() == expected
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+from finite_field import F, P
+from finite_field_vec import EFVec, FVec
+from poseidon2 import DIGEST_LEN, POSEIDON_WIDTH, poseidon2_permutation
+from merkle_tree import (merkle_auth_path, merkle_multiproof, merkle_multiproof_size, merkle_root, merkle_tree_levels,
+                         verify_merkle_multiproof, verify_merkle_path, verify_merkle_paths)
+
+
+def tree(n_leaves, leaf_size, seed=0):
+    leaves = np.random.default_rng(seed).integers(0, P, size=(n_leaves, leaf_size), dtype=np.uint32)
+    return leaves, merkle_tree_levels(leaves)
+
+
+def auth_path(levels, index):
+    path = merkle_auth_path(levels, index)
+    return [path[i:i + DIGEST_LEN] for i in range(0, len(path), DIGEST_LEN)]
+
+
+def naive_root(leaves):
+    # one scalar permutation at a time: leaves absorbed by chunks of DIGEST_LEN, parent = H(right child, left child)
+    level = []
+    for leaf in leaves.tolist():
+        state = [F(0)] * POSEIDON_WIDTH
+        for i in range(0, len(leaf), DIGEST_LEN):
+            chunk = [F(v) for v in leaf[i:i + DIGEST_LEN]]
+            state = poseidon2_permutation(chunk + [F(0)] * (DIGEST_LEN - len(chunk)) + state[DIGEST_LEN:])
+        level.append(state[:DIGEST_LEN])
+    while len(level) > 1:
+        level = [poseidon2_permutation(level[k + 1] + level[k])[:DIGEST_LEN] for k in range(0, len(level), 2)]
+    return level[0]
+
+
+@pytest.mark.parametrize("n_leaves, leaf_size", [(1, 8), (2, 3), (8, 16), (16, 20)])
+def test_tree_matches_naive(n_leaves, leaf_size):
+    leaves, levels = tree(n_leaves, leaf_size)
+    assert merkle_root(levels) == naive_root(leaves)
+
+
+@pytest.mark.parametrize("height", [0, 1, 4])
+def test_verify_merkle_paths(height):
+    leaves, levels = tree(2 ** height, 12, seed=height)
+    root = merkle_root(levels)
+    indices = [0, 2 ** height - 1, 0, 2 ** height // 2, 0]  # with duplicates
+    paths = [auth_path(levels, index) for index in indices]
+    for index, path in zip(indices, paths):
+        verify_merkle_path(root, index, FVec(leaves[index]), path, height)
+    verify_merkle_paths(root, indices, [FVec(leaves[index]) for index in indices], paths, height)
+    verify_merkle_paths(root, [], [], [], height)
+
+    def rejected(indices, leaves, paths, height):
+        with pytest.raises(AssertionError):
+            verify_merkle_paths(root, indices, leaves, paths, height)
+
+    good_leaves = [FVec(leaves[index]) for index in indices]
+    rejected(indices, good_leaves, paths[:-1] + [paths[-1] + [paths[-1][0] if height else [F(0)] * DIGEST_LEN]], height)  # too long
+    rejected(indices, good_leaves, [path + [[F(0)] * DIGEST_LEN] for path in paths], height + 1)  # one level too many
+    if height > 0:
+        rejected(indices, good_leaves, paths[:-1] + [paths[-1][:-1]], height)  # too short
+        rejected(indices, good_leaves, [path[:-1] for path in paths], height - 1)  # one level too few
+        rejected(indices, good_leaves[:-1] + [FVec(leaves[indices[-1] ^ 1])], paths, height)  # wrong leaf
+        rejected(indices[:-1] + [indices[-1] ^ 1], good_leaves, paths, height)  # wrong index
+    rejected(indices, good_leaves[:-1], paths, height)  # missing leaf
+
+
+def test_leaf_representations():
+    leaves, levels = tree(8, 16)
+    root = merkle_root(levels)
+    for index in [0, 5, 7]:
+        path = auth_path(levels, index)
+        as_list = [F(int(v)) for v in leaves[index]]
+        verify_merkle_path(root, index, as_list, path, 3)
+        verify_merkle_path(root, index, FVec(leaves[index]), path, 3)
+        verify_merkle_path(root, index, EFVec.from_base_field(FVec(leaves[index])), path, 3)
+        verify_merkle_paths(root, [index], [FVec(leaves[index])], [path], 3)
+        with pytest.raises(AssertionError):
+            verify_merkle_path(root, index, FVec(leaves[index - 1]), path, 3)
+
+
+def naive_multiproof(levels, indices, height):
+    # the union of the authentication paths, minus the nodes on the paths themselves (by level, then index)
+    on_paths = {(h, index >> h) for index in indices for h in range(height + 1)}
+    siblings = sorted({(h, (index >> h) ^ 1) for index in indices for h in range(height)} - on_paths)
+    return [F(v) for h, index in siblings for v in levels[h][index].tolist()]
+
+
+@pytest.mark.parametrize("height", [0, 1, 4])
+def test_verify_merkle_multiproof(height):
+    leaves, levels = tree(2 ** height, 12, seed=height)
+    root = merkle_root(levels)
+    n = 2 ** height
+    for indices in [[], [0], [n - 1, 0, n - 1], list(range(n)), [n // 2, (n // 2 + 1) % n, 1 % n, n // 2]]:
+        proof = merkle_multiproof(levels, indices)
+        assert proof == naive_multiproof(levels, indices, height)
+        assert merkle_multiproof_size(indices, height) * DIGEST_LEN == len(proof)
+        digests = [proof[i:i + DIGEST_LEN] for i in range(0, len(proof), DIGEST_LEN)]
+        good_leaves = [FVec(leaves[index]) for index in indices]
+        verify_merkle_multiproof(root, indices, good_leaves, digests, height)
+
+        def rejected(indices, leaves, proof):
+            with pytest.raises(AssertionError):
+                verify_merkle_multiproof(root, indices, leaves, proof, height)
+
+        rejected(indices, good_leaves, digests + [[F(0)] * DIGEST_LEN])  # too long
+        if len(digests) > 0:
+            rejected(indices, good_leaves, digests[:-1])  # too short
+        if len(digests) > 1:
+            rejected(indices, good_leaves, digests[1:] + digests[:1])  # out of order
+        if len(indices) > 0 and height > 0:
+            rejected(indices, good_leaves[:-1] + [FVec(leaves[indices[-1] ^ 1])], digests)  # wrong leaf
+            rejected(indices + [indices[0]], good_leaves + [FVec(leaves[indices[0] ^ 1])], digests)  # conflicting duplicate
+        rejected(indices + [n], good_leaves + [FVec(leaves[0])], digests)  # out of range
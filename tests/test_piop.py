@@ -0,0 +1,115 @@
+import json
+import pytest
+import numpy as np
+from finite_field import F
+from synthetic import synthetic_air_table, synthetic_whir_params
+from prover import piop_prove_multi
+from piop import (VERIFYING_KEY_VERSION, MultiVerifyingKey, VerifyingKey, multi_table_layout, piop_verify, piop_verify_multi,
+                  verifying_key)
+from checks import DeferredEqualityChecks
+from transcript import TranscriptReader, encode_transcript
+
+
+def tampered(transcript, index):
+    transcript = list(transcript)
+    transcript[index] = transcript[index] + F(1)
+    return transcript
+
+
+@pytest.mark.parametrize("folding_factor", [2, 4])
+@pytest.mark.parametrize("merkle_multiproof", [False, True])
+def test_round_trip(proof, folding_factor, merkle_multiproof):
+    vk, transcript = proof(log_n_rows=5, folding_factor=folding_factor, merkle_multiproof=merkle_multiproof)
+    piop_verify(vk, transcript)
+    piop_verify(vk, TranscriptReader(encode_transcript(transcript)))
+
+
+@pytest.mark.parametrize("fiat_shamir_version", [1, 2])
+@pytest.mark.parametrize("merkle_multiproof", [False, True])
+def test_fiat_shamir_versions(proof, fiat_shamir_version, merkle_multiproof):
+    vk, transcript = proof(fiat_shamir_version=fiat_shamir_version, merkle_multiproof=merkle_multiproof, pow_bits=2)
+    piop_verify(vk, transcript)
+    other, _ = proof(fiat_shamir_version=3 - fiat_shamir_version, merkle_multiproof=merkle_multiproof, pow_bits=2)
+    with pytest.raises(AssertionError):
+        piop_verify(other, transcript)
+
+
+@pytest.mark.parametrize("merkle_multiproof", [False, True])
+def test_tampered_transcript_is_rejected(proof, merkle_multiproof):
+    vk, transcript = proof(merkle_multiproof=merkle_multiproof)
+    for index in [0, 10, len(transcript) // 3, len(transcript) // 2, len(transcript) - 1]:
+        with pytest.raises(AssertionError):
+            piop_verify(vk, tampered(transcript, index))
+
+
+def test_saved_key(proof, tmp_path):
+    vk, transcript = proof(fiat_shamir_version=2)
+    vk.save(tmp_path / "vk")
+    loaded = VerifyingKey.load(tmp_path / "vk")
+    assert loaded.constraints == vk.constraints and loaded.whir_params == vk.whir_params
+    assert np.array_equal(loaded.preprocessed_columns, vk.preprocessed_columns)
+    piop_verify(loaded, transcript)
+    # a key saved by an older version (e.g. before fiat_shamir_version) is refused, not silently read as mode 1
+    with np.load(tmp_path / "vk") as data:
+        fields = dict(data)
+    with open(tmp_path / "old", "wb") as f:
+        np.savez(f, **{**fields, "version": np.array(VERIFYING_KEY_VERSION - 1)})
+    with pytest.raises(AssertionError):
+        VerifyingKey.load(tmp_path / "old")
+    # a corrupted tape is rejected, not evaluated
+    header = json.loads(str(fields["header"]))
+    header["constraints"]["tape"][0][0] = "pow"
+    with open(tmp_path / "corrupted", "wb") as f:
+        np.savez(f, **{**fields, "header": np.array(json.dumps(header))})
+    with pytest.raises(AssertionError):
+        VerifyingKey.load(tmp_path / "corrupted")
+
+
+def test_table_key_is_cached():
+    table, _ = synthetic_air_table(4, 3, 1, 2)
+    table.whir_params = synthetic_whir_params(4 + table.log_n_witness_columns(), 2, 8)
+    vk = verifying_key(table)
+    assert verifying_key(table) is vk
+    table.whir_params.rounds[0].num_queries += 1  # in place
+    assert verifying_key(table) is not vk
+    table.whir_params = synthetic_whir_params(4 + table.log_n_witness_columns(), 1, 8)
+    assert verifying_key(table).whir_params.rounds[0].folding_factor == 1
+
+
+def test_custom_selectors_are_rejected():
+    table, _ = synthetic_air_table(4, 3)
+    VerifyingKey.build(table)
+    table.univariate_selectors = table.univariate_selectors[1:] + table.univariate_selectors[:1]
+    with pytest.raises(AssertionError):
+        VerifyingKey.build(table)
+
+
+def test_truncated_transcript_is_rejected(proof):
+    vk, transcript = proof()
+    with pytest.raises(AssertionError):
+        piop_verify(vk, transcript[:-1])
+
+
+def test_deferred_checks(proof):
+    vk, transcript = proof()
+    checks = DeferredEqualityChecks()
+    piop_verify(vk, transcript, checks)
+    checks.finalize()
+    checks = DeferredEqualityChecks()
+    with pytest.raises(AssertionError):  # the Merkle checks are never deferred
+        piop_verify(vk, tampered(transcript, len(transcript) // 4), checks)
+        checks.finalize()
+
+
+@pytest.mark.parametrize("fiat_shamir_version", [1, 2])
+def test_multi_table_round_trip(fiat_shamir_version):
+    tables = [synthetic_air_table(log_n_rows, n_witness_columns, 1, 2, seed=log_n_rows)
+              for log_n_rows, n_witness_columns in [(5, 3), (4, 1), (4, 5)]]
+    keys = [VerifyingKey.build(table) for table, _ in tables]
+    n_variables, offsets = multi_table_layout(keys)
+    assert n_variables == 9 and offsets == [0, 256, 128]  # 2^7, 2^4 and 2^7 packed elements
+    key = MultiVerifyingKey.build(keys, synthetic_whir_params(n_variables, 3, 8), fiat_shamir_version)
+    transcript = piop_prove_multi(key, [witness for _, witness in tables])
+    piop_verify_multi(key, transcript)
+    with pytest.raises(AssertionError):
+        piop_verify_multi(key, tampered(transcript, len(transcript) // 2))
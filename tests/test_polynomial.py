@@ -0,0 +1,129 @@
+import random
+import pytest
+from finite_field import EF, F, P
+from finite_field_vec import EFVec, FVec
+from polynomial import (ArithmeticCircuit, EqPolynomial, EqTable, MatrixDownPolynomial, MatrixUpPolynomial, NextPolynomial, eq_extension,
+                        compile_circuits, eq_extension_batch, lagrange_selector_evals, multilinear_coeffs_evaluate_batch,
+                        univariate_selectors)
+
+
+def random_ef(rng):
+    return EF.from_ints(*[rng.randrange(P) for _ in range(4)])
+
+
+def lagrange(i, z, skips):
+    # L_i(z) = prod_{j != i} (z - j) / (i - j), directly
+    result = EF.one()
+    for j in range(2 ** skips):
+        if j != i:
+            result *= (z - EF.from_ints(j, 0, 0, 0)) * EF.from_ints(i - j, 0, 0, 0).inverse()
+    return result
+
+
+@pytest.mark.parametrize("skips", [1, 2, 3])
+def test_selectors(skips):
+    rng = random.Random(skips)
+    selectors = univariate_selectors(skips)
+    for z in [random_ef(rng), random_ef(rng)] + [EF.from_ints(j, 0, 0, 0) for j in range(2 ** skips)]:
+        expected = [lagrange(i, z, skips) for i in range(2 ** skips)]
+        assert [selector.evaluate(z) for selector in selectors] == expected
+        assert lagrange_selector_evals(z, skips) == expected
+
+
+def bits(index, n):
+    return [EF.from_ints((index >> j) & 1, 0, 0, 0) for j in range(n)]
+
+
+@pytest.mark.parametrize("n", [0, 1, 4])
+def test_eq_table(n):
+    rng = random.Random(n)
+    point = [random_ef(rng) for _ in range(n)]
+    expected = [eq_extension(point, bits(b, n)) for b in range(2 ** n)]
+    table = EqTable(point)
+    assert table.table == expected and table.vec().to_list() == expected
+    base = [F(rng.randrange(P)) for _ in range(2 ** n)]
+    ext = [random_ef(rng) for _ in range(2 ** n)]
+    assert table.dot(base) == table.dot(FVec.from_list(base)) == sum((e.mul_base(b) for e, b in zip(expected, base)), EF.zero())
+    assert table.dot(ext) == table.dot(EFVec.from_list(ext)) == sum((e * x for e, x in zip(expected, ext)), EF.zero())
+
+
+def test_eq_extension_batch():
+    rng = random.Random(0)
+    for n, n_points in [(0, 3), (3, 0), (3, 5)]:
+        s = [random_ef(rng) for _ in range(n)]
+        points = [[random_ef(rng) for _ in range(n)] for _ in range(n_points)]
+        assert eq_extension_batch(points, s).to_list() == [eq_extension(point, s) for point in points]
+
+
+def multilinear_coeffs_naive(coefficients, x):
+    result = EF.zero()
+    for i, c in enumerate(coefficients):
+        term = c if isinstance(c, EF) else EF.from_base(c)
+        for j, x_j in enumerate(x):
+            if (i >> j) & 1:
+                term *= x_j
+        result += term
+    return result
+
+
+@pytest.mark.parametrize("n", [0, 1, 4])
+def test_multilinear_coeffs_evaluate_batch(n):
+    rng = random.Random(n)
+    x = [random_ef(rng) for _ in range(n)]
+    base = [[F(rng.randrange(P - 4, P)) for _ in range(2 ** n)] for _ in range(3)]  # near P, the worst case for matrix_dot
+    ext = [[random_ef(rng) for _ in range(2 ** n)] for _ in range(3)]
+    assert multilinear_coeffs_evaluate_batch([FVec.from_list(p) for p in base], x) == [multilinear_coeffs_naive(p, x) for p in base]
+    assert multilinear_coeffs_evaluate_batch([EFVec.from_list(p) for p in ext], x) == [multilinear_coeffs_naive(p, x) for p in ext]
+    assert multilinear_coeffs_evaluate_batch([], x) == []
+
+
+@pytest.mark.parametrize("cls", [EqPolynomial, NextPolynomial, MatrixUpPolynomial, MatrixDownPolynomial])
+@pytest.mark.parametrize("n", [1, 2, 4])
+def test_closed_forms_match_their_circuits(cls, n):
+    rng = random.Random(n)
+    polynomial = cls(n)
+    circuit, compiled = polynomial.to_circuit(), polynomial.compile()
+    points = [[random_ef(rng) for _ in range(2 * n)] for _ in range(3)]
+    points += [bits(x, n)[::-1] + bits(y, n)[::-1] for x in range(2 ** n) for y in range(2 ** n)]  # big endian
+    for point in points:
+        assert polynomial.evaluate(point) == circuit.evaluate(point) == compiled.evaluate(point)[0]
+
+
+@pytest.mark.parametrize("n", [1, 2, 3])
+def test_closed_forms_on_the_hypercube(n):
+    # eq(x, y) = [y = x], next(x, y) = [y = x + 1], up: row x reads row x (the last one reads the row before it),
+    # down: row x reads row x + 1 (the last one reads itself)
+    last = 2 ** n - 1
+    for x in range(2 ** n):
+        for y in range(2 ** n):
+            point = bits(x, n)[::-1] + bits(y, n)[::-1]
+            assert EqPolynomial(n).evaluate(point) == EF.from_ints(int(x == y), 0, 0, 0)
+            assert NextPolynomial(n).evaluate(point) == EF.from_ints(int(y == x + 1), 0, 0, 0)
+            assert MatrixUpPolynomial(n).evaluate(point) == EF.from_ints(int(x == y and x != last) + int(x == last and y == last - 1), 0, 0, 0)
+            assert MatrixDownPolynomial(n).evaluate(point) == EF.from_ints(int(y == x + 1) + int(x == y == last), 0, 0, 0)
+
+
+def random_circuit(rng, n_inputs, size):
+    # random DAG (shared subexpressions), with the constants the builder folds (0, 1, -1) among others
+    nodes = [ArithmeticCircuit.var(i) for i in range(n_inputs)]
+    nodes += [ArithmeticCircuit.const(c) for c in [F(0), F(1), F(-1), F(rng.randrange(P)), random_ef(rng)]]
+    for _ in range(size):
+        a, b = rng.choice(nodes), rng.choice(nodes)
+        nodes.append(rng.choice([a + b, a - b, a * b, a - a, a * b + a * b]))
+    return nodes[-1]
+
+
+def test_compile_circuits():
+    rng = random.Random(0)
+    n_inputs = 4
+    circuits = [random_circuit(rng, n_inputs, 30) for _ in range(5)]
+    circuits += [ArithmeticCircuit.const(F(3)), ArithmeticCircuit.var(2), circuits[0]]  # constant, input, duplicate
+    compiled = compile_circuits(circuits, n_inputs + 2)  # unused inputs are allowed
+    inputs = [[random_ef(rng) for _ in range(n_inputs + 2)] for _ in range(4)]
+    for x in inputs:
+        assert compiled.evaluate(x) == [c.evaluate(x) for c in circuits]
+    columns = [EFVec.from_list([x[i] for x in inputs]) for i in range(n_inputs + 2)]
+    assert [v.to_list() for v in compiled.evaluate(columns)] == [[c.evaluate(x) for x in inputs] for c in circuits]
+    assert len(compiled.tape) <= sum(len(compile_circuits([c], n_inputs).tape) for c in circuits)
+    with pytest.raises(AssertionError):
+        compile_circuits([ArithmeticCircuit.var(n_inputs)], n_inputs)
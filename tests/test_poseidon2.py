@@ -0,0 +1,126 @@
+import numpy as np
+from finite_field import F, P
+from poseidon2 import *
+
+
+def grain_lfsr_constants(n: int = 31, t: int = 16, full_rounds: int = 8, partial_rounds: int = 20):
+    # round constants generator of the Poseidon2 reference implementation (prime field, x^alpha S-box),
+    # R_F.t + R_P elements in [0, P), rejection-sampled on n-bit big-endian chunks
+    fields = [(1, 2), (0, 4), (n, 12), (t, 12), (full_rounds, 10), (partial_rounds, 10)]
+    state = [int(b) for value, width in fields for b in format(value, f"0{width}b")] + [1] * 30
+
+    def shift() -> int:
+        bit = state[62] ^ state[51] ^ state[38] ^ state[23] ^ state[13] ^ state[0]
+        state.pop(0)
+        state.append(bit)
+        return bit
+
+    def next_bit() -> int:
+        while shift() == 0:
+            shift()
+        return shift()
+
+    for _ in range(160):
+        shift()
+    constants = []
+    while len(constants) < full_rounds * t + partial_rounds:
+        value = int("".join(str(next_bit()) for _ in range(n)), 2)
+        if value < P:
+            constants.append(value)
+    return constants
+
+
+def test_round_constants():
+    constants = grain_lfsr_constants()
+    assert [c for row in EXTERNAL_INITIAL_CONSTANTS for c in row] == constants[:64]
+    assert INTERNAL_CONSTANTS == constants[64:84]
+    assert [c for row in EXTERNAL_FINAL_CONSTANTS for c in row] == constants[84:]
+
+
+# Plonky3 v0.4.3 default_babybear_poseidon2_16 (baby-bear/src/poseidon2.rs): same permutation structure as KoalaBear
+# (initial external layer, 4 + 4 full rounds with circ(2.M4, M4, M4, M4), partial rounds with 1 + diag(V)),
+# with p = 15.2^27 + 1, x^7 S-box, 13 partial rounds and these constants
+BABYBEAR_P = 15 * 2 ** 27 + 1
+BABYBEAR_RC16_EXTERNAL_INITIAL = [
+    [
+        0x69CBB6AF, 0x46AD93F9, 0x60A00F4E, 0x6B1297CD, 0x23189AFE, 0x732E7BEF,
+        0x72C246DE, 0x2C941900, 0x0557EEDE, 0x1580496F, 0x3A3EA77B, 0x54F3F271,
+        0x0F49B029, 0x47872FE1, 0x221E2E36, 0x1AB7202E,
+    ],
+    [
+        0x487779A6, 0x3851C9D8, 0x38DC17C0, 0x209F8849, 0x268DCEE8, 0x350C48DA,
+        0x5B9AD32E, 0x0523272B, 0x3F89055B, 0x01E894B2, 0x13DDEDDE, 0x1B2EF334,
+        0x7507D8B4, 0x6CEEB94E, 0x52EB6BA2, 0x50642905,
+    ],
+    [
+        0x05453F3F, 0x06349EFC, 0x6922787C, 0x04BFFF9C, 0x768C714A, 0x3E9FF21A,
+        0x15737C9C, 0x2229C807, 0x0D47F88C, 0x097E0ECC, 0x27EADBA0, 0x2D7D29E4,
+        0x3502AAA0, 0x0F475FD7, 0x29FBDA49, 0x018AFFFD,
+    ],
+    [
+        0x0315B618, 0x6D4497D1, 0x1B171D9E, 0x52861ABD, 0x2E5D0501, 0x3EC8646C,
+        0x6E5F250A, 0x148AE8E6, 0x17F5FA4A, 0x3E66D284, 0x0051AA3B, 0x483F7913,
+        0x2CFE5F15, 0x023427CA, 0x2CC78315, 0x1E36EA47,
+    ],
+]
+BABYBEAR_RC16_EXTERNAL_FINAL = [
+    [
+        0x7290A80D, 0x6F7E5329, 0x598EC8A8, 0x76A859A0, 0x6559E868, 0x657B83AF,
+        0x13271D3F, 0x1F876063, 0x0AEEAE37, 0x706E9CA6, 0x46400CEE, 0x72A05C26,
+        0x2C589C9E, 0x20BD37A7, 0x6A2D3D10, 0x20523767,
+    ],
+    [
+        0x5B8FE9C4, 0x2AA501D6, 0x1E01AC3E, 0x1448BC54, 0x5CE5AD1C, 0x4918A14D,
+        0x2C46A83F, 0x4FCF6876, 0x61D8D5C8, 0x6DDF4FF9, 0x11FDA4D3, 0x02933A8F,
+        0x170EAF81, 0x5A9C314F, 0x49A12590, 0x35EC52A1,
+    ],
+    [
+        0x58EB1611, 0x5E481E65, 0x367125C9, 0x0EBA33BA, 0x1FC28DED, 0x066399AD,
+        0x0CBEC0EA, 0x75FD1AF0, 0x50F5BF4E, 0x643D5F41, 0x6F4FE718, 0x5B3CBBDE,
+        0x1E3AFB3E, 0x296FB027, 0x45E1547B, 0x4A8DB2AB,
+    ],
+    [
+        0x59986D19, 0x30BCDFA3, 0x1DB63932, 0x1D7C2824, 0x53B33681, 0x0673B747,
+        0x038A98A3, 0x2C5BCE60, 0x351979CD, 0x5008FB73, 0x547BCA78, 0x711AF481,
+        0x3F93BF64, 0x644D987B, 0x3C8BCD87, 0x608758B8,
+    ],
+]
+BABYBEAR_RC16_INTERNAL = [
+    0x5A8053C0, 0x693BE639, 0x3858867D, 0x19334F6B, 0x128F0FD8, 0x4E2B1CCB,
+    0x61210CE0, 0x3C318939, 0x0B5B2F22, 0x2EDB11D5, 0x213EFFDF, 0x0CAC4606,
+    0x241AF16D,
+]
+BABYBEAR_INTERNAL_DIAG = [x % BABYBEAR_P for x in [
+    -2, 1, 2, pow(2, -1, BABYBEAR_P), 3, 4, -pow(2, -1, BABYBEAR_P), -3, -4, pow(2, -8, BABYBEAR_P), pow(4, -1, BABYBEAR_P),
+    pow(8, -1, BABYBEAR_P), pow(2, -27, BABYBEAR_P), -pow(2, -8, BABYBEAR_P), -pow(16, -1, BABYBEAR_P), -pow(2, -27, BABYBEAR_P)
+]]
+
+
+def test_known_answer_plonky3(monkeypatch):
+    # The permutation code, instantiated with Plonky3's BabyBear width-16 parameters, against an output of Plonky3 v0.4.3
+    # (first permutation of the DuplexChallenger after observing 1, 2, 3, 4, 5, dumped by openvm-stark-backend v2.0.0).
+    # The KoalaBear instance only differs by the parameters, which are pinned by test_round_constants.
+    import poseidon2
+    monkeypatch.setattr(poseidon2, "P", BABYBEAR_P)
+    monkeypatch.setattr(poseidon2, "SBOX_DEGREE", 7)
+    monkeypatch.setattr(poseidon2, "INTERNAL_DIAG", BABYBEAR_INTERNAL_DIAG)
+    monkeypatch.setattr(poseidon2, "EXTERNAL_INITIAL_CONSTANTS", BABYBEAR_RC16_EXTERNAL_INITIAL)
+    monkeypatch.setattr(poseidon2, "INTERNAL_CONSTANTS", BABYBEAR_RC16_INTERNAL)
+    monkeypatch.setattr(poseidon2, "EXTERNAL_FINAL_CONSTANTS", BABYBEAR_RC16_EXTERNAL_FINAL)
+    expected = [1745697958, 1883316607, 1528744214, 380958910, 1655787167, 942789063, 1311515673, 484056006,
+                739818226, 1730171699, 1352380121, 36788954, 791149191, 174305907, 113982628, 1889258918]
+    assert poseidon2.permutation_python([1, 2, 3, 4, 5] + [0] * 11) == expected
+
+
+def test_known_answer():
+    # regression vector of the KoalaBear instance (input 0, 1, ..., 15)
+    expected = [1259554834, 663463928, 1989430097, 476523442, 836740795, 1803459961, 1229318262, 2023956904,
+                2054405130, 1556655036, 1455339712, 1471465890, 423337459, 353979748, 1203410294, 1592576868]
+    assert [x.value for x in poseidon2_permutation([F(i) for i in range(POSEIDON_WIDTH)])] == expected
+
+
+def test_batch_matches_scalar():
+    states = np.random.default_rng(0).integers(0, P, (5, POSEIDON_WIDTH), dtype=np.uint32)
+    batch = poseidon2_permutation_batch(states)
+    for state, permuted in zip(states.tolist(), batch.tolist()):
+        assert [x.value for x in poseidon2_permutation([F(x) for x in state])] == permuted
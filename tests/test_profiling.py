@@ -0,0 +1,55 @@
+import threading
+import pytest
+from finite_field import DEG, EF
+from finite_field_vec import EFVec
+from synthetic import synthetic_air_table, synthetic_whir_params
+from prover import piop_prove
+from piop import VerifyingKey, piop_verify
+from profiling import profiling
+
+
+def test_profile(proof):
+    vk, transcript = proof()
+    with profiling() as profile:
+        piop_verify(vk, transcript)
+    assert profile.counters["poseidon2_permutation"] > 0
+    assert {"zerocheck", "inner sumcheck", "whir"} <= set(profile.phases)
+
+
+def test_other_threads_are_not_counted():
+    refused = []
+
+    def other_thread():
+        for _ in range(100):
+            EF.one() * EF.one()
+        try:
+            with profiling():
+                pass
+        except AssertionError:
+            refused.append(True)
+
+    with profiling() as profile:
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+        thread.join()
+        EF.one() * EF.one()
+    assert profile.counters["EF.mul"] == 1 and refused == [True]
+
+
+@pytest.mark.parametrize("folding_factor", [2, 4])
+@pytest.mark.parametrize("num_queries", [4, 8])
+def test_leaf_folding_is_counted(folding_factor, num_queries):
+    table, witness = synthetic_air_table(4, 3)
+    table.whir_params = synthetic_whir_params(4 + table.log_n_witness_columns(), folding_factor, num_queries)
+    vk = VerifyingKey.build(table)
+    transcript = piop_prove(vk, witness)
+    with profiling() as profile:
+        piop_verify(vk, transcript)
+    # each base field leaf of round 0 is folded with a single matrix_dot row
+    assert profile.phases["whir round 0"].counters["matrix_dot"] == num_queries * 2 ** folding_factor * DEG
+
+
+def test_horner_is_counted():
+    with profiling() as profile:
+        EFVec.from_list([EF.one()] * 5).horner(EF.one())
+    assert profile.counters["EF.mul"] == 5 and profile.counters["EF.add"] == 5